@@ -0,0 +1,17 @@
+"""
+Joan Loadtest - offline benchmarking for ws-client.py.
+
+Usage:
+    joan-loadtest --events 500 --rate 50     # 500 smart events at 50/s
+    joan-loadtest --backlog 100 --events 0   # startup dispatch of 100 queued tasks
+    joan-loadtest --script burst.jsonl       # scripted event stream
+    joan-loadtest --replay monday.jsonl.gz --speed 10   # recorded stream, 10x (0 = flat out)
+
+Runs the real client against a loopback Joan server (server.JoanStub) with
+a fake `claude` (fake_claude.py) and reports dispatch latency, throughput
+and client memory.
+"""
+
+from joan_loadtest.harness import main
+
+__all__ = ["main"]
@@ -0,0 +1,48 @@
+"""
+WebSocket captures recorded by `ws-client.py --record FILE`.
+
+A capture is gzipped JSONL: a header line per ws-client run, a marker per
+connection, and one {"t": receive_time, "raw": message_text} line per
+inbound message (see "WebSocket Capture" in ws-client.py).
+"""
+
+import gzip
+import json
+from typing import Optional
+
+# Longest pause replayed between two messages, in capture time (overnight idle, client restarts)
+DEFAULT_MAX_GAP = 30.0
+
+
+def read_capture(path: str) -> tuple:
+    """Return (first header or None, [(receive_time, raw_text), ...])."""
+    header: Optional[dict] = None
+    messages = []
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn final line of a capture cut off by a crash
+                if "capture" in record:
+                    header = header or record
+                elif "raw" in record:
+                    messages.append((record["t"], record["raw"]))
+        except EOFError:
+            pass  # gzip stream cut off mid-member; keep what was readable
+    return header, messages
+
+
+def replay_schedule(messages: list, max_gap: float = DEFAULT_MAX_GAP) -> list:
+    """Turn receive times into offsets from the first message, capping each gap at `max_gap`."""
+    schedule, offset, previous = [], 0.0, None
+    for t, raw in messages:
+        if previous is not None:
+            offset += min(max(0.0, t - previous), max_gap)
+        previous = t
+        schedule.append((offset, raw))
+    return schedule
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Fake `claude` executable for load tests.
+
+ws-client.py runs it exactly like the real CLI (`claude <prompt>` with the
+JOAN_* handler environment). It prints output for a while, then submits a
+worker-result to JOAN_API_URL and writes JOAN_RESULT_MARKER, like
+submit-result.py does. The result carries the time the process started, so
+the harness can measure event-to-handler dispatch latency.
+
+Environment:
+    FAKE_CLAUDE_RUNTIME       - Seconds to run (default: 0.5)
+    FAKE_CLAUDE_OUTPUT_LINES  - Lines printed, spread over the runtime (default: 10)
+    FAKE_CLAUDE_LINE_BYTES    - Length of each line (default: 120)
+    FAKE_CLAUDE_EXIT_CODE     - Exit code (default: 0)
+    FAKE_CLAUDE_REPORT        - "0" to exit without submitting a result (default: 1)
+"""
+
+import time
+
+STARTED_AT = time.time()  # before the remaining imports, to keep interpreter startup out of it
+
+import json
+import os
+import sys
+import urllib.request
+from pathlib import Path
+
+
+def submit_result(started_at: float, payload_bytes: int, exit_code: int):
+    url = (f"{os.environ['JOAN_API_URL']}/api/v1/projects/{os.environ['JOAN_PROJECT_ID']}"
+           f"/tasks/{os.environ['JOAN_TASK_ID']}/worker-result")
+    body = {
+        "worker": "fake-worker",
+        "success": exit_code == 0,
+        "result_type": "fake_complete",
+        "output": {"started_at": started_at, "pid": os.getpid(), "payload_bytes": payload_bytes,
+                   "prompt": sys.argv[-1] if len(sys.argv) > 1 else ""},
+    }
+    req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), method="POST", headers={
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {os.environ.get('JOAN_AUTH_TOKEN', '')}",
+    })
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        resp.read()
+    marker = os.environ.get("JOAN_RESULT_MARKER")
+    if marker:
+        Path(marker).parent.mkdir(parents=True, exist_ok=True)
+        Path(marker).write_text(json.dumps({"task_id": os.environ["JOAN_TASK_ID"]}))
+
+
+def main():
+    runtime = float(os.environ.get("FAKE_CLAUDE_RUNTIME", "0.5"))
+    lines = int(os.environ.get("FAKE_CLAUDE_OUTPUT_LINES", "10"))
+    line_bytes = int(os.environ.get("FAKE_CLAUDE_LINE_BYTES", "120"))
+    exit_code = int(os.environ.get("FAKE_CLAUDE_EXIT_CODE", "0"))
+    report = os.environ.get("FAKE_CLAUDE_REPORT", "1") != "0"
+
+    payload_bytes = 0
+    payload_file = os.environ.get("JOAN_SMART_PAYLOAD_FILE")
+    if payload_file:
+        try:
+            payload_bytes = len(Path(payload_file).read_bytes())
+        except OSError:
+            pass
+
+    print(f"fake claude: task={os.environ.get('JOAN_TASK_ID', '')} payload={payload_bytes}B", flush=True)
+    filler = ("x" * line_bytes)
+    interval = runtime / lines if lines else 0
+    deadline = STARTED_AT + runtime
+    for i in range(lines):
+        print(f"{i:05d} {filler}", flush=True)
+        if interval:
+            time.sleep(max(0.0, min(interval, deadline - time.time())))
+    remaining = deadline - time.time()
+    if remaining > 0:
+        time.sleep(remaining)
+
+    if report:
+        try:
+            submit_result(STARTED_AT, payload_bytes, exit_code)
+        except Exception as e:
+            print(f"fake claude: failed to submit result: {e}", flush=True)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Dispatch load test: drive events through the real ws-client.py offline.
+
+Starts a JoanStub on loopback and a throwaway project whose `claude` is
+fake_claude.py, then runs ws-client.py against them. Events are sent at a
+fixed rate, from a scripted JSONL stream, or replayed from a capture
+recorded with `ws-client.py --record`. Each handler's worker-result is
+collected and matched to the event that dispatched it. Reports:
+
+- dispatch latency: event sent -> handler process started
+- throughput: handlers started and results received per second
+- the client's peak RSS
+
+With --drop-every the stub cuts the client's WebSocket off periodically, so
+events sent while it reconnects are only delivered by its missed-event
+recovery: replay, or with --no-replay / --no-ack the actionable-tasks diff.
+Every run reports events that never got a handler (missing) and handlers
+started twice for one event (duplicates).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from joan_loadtest.capture import DEFAULT_MAX_GAP, read_capture, replay_schedule
+from joan_loadtest.server import SMART_EVENTS, JoanStub, dispatches_handler, make_smart_payload, make_task
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+FAKE_CLAUDE = Path(__file__).resolve().parent / "fake_claude.py"
+
+# Seconds to wait for ws-client.py to connect before giving up
+CONNECT_TIMEOUT = 30
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of `values` (which must be non-empty)."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_kb(pid: int):
+    """Peak resident set size of a live process (Linux VmHWM), or None."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def match_results(stub: JoanStub, backlog: list) -> dict:
+    """Pair each worker-result with the event that dispatched its handler.
+
+    Every dispatching event (and every task id in `backlog`, the preloaded
+    actionable-tasks) expects a result. Per task, results are taken in start order and each one takes the
+    oldest pending events sent before it was received: the first is the event
+    that started the handler and the latency is measured from it; the rest
+    arrived while the handler ran and the client folded them into it
+    (coalesced). Events still pending afterwards are missing; a result with no
+    event left to take, or that started before its event was sent, is a
+    duplicate dispatch.
+    """
+    pending = {}
+    for task_id in backlog:
+        pending.setdefault(task_id, []).append(None)  # dispatched from actionable-tasks at startup
+    for sent_at, payload in stub.sent:
+        if dispatches_handler(payload):
+            pending.setdefault(payload["task_id"], []).append(sent_at)
+    expected = sum(len(queue) for queue in pending.values())
+
+    latencies, duplicates, coalesced = [], 0, 0
+    results = sorted(stub.worker_results,
+                     key=lambda r: (r.get("output") or {}).get("started_at") or r["received_at"])
+    for result in results:
+        queue = pending.get(result["task_id"], [])
+        taken = 0
+        while taken < len(queue) and (queue[taken] is None or queue[taken] <= result["received_at"]):
+            taken += 1
+        started_at = (result.get("output") or {}).get("started_at")
+        cause = queue[0] if taken else None
+        if not taken or (cause is not None and started_at is not None and cause > started_at):
+            duplicates += 1
+            coalesced += taken
+        else:
+            if cause is not None and started_at is not None:
+                latencies.append((started_at - cause) * 1000)
+            coalesced += taken - 1
+        del queue[:taken]
+
+    return {
+        "expected": expected,
+        "missing": sum(len(queue) for queue in pending.values()),
+        "coalesced": coalesced,
+        "duplicates": duplicates,
+        "latencies": latencies,
+    }
+
+
+def load_script(path: str) -> list:
+    """Scripted events: one event payload per JSONL line, optionally with an "at" offset."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_project(workdir: Path, project_id: str, slots: dict) -> Path:
+    """A project dir with .joan-agents.json and a bin dir whose `claude` is the fake."""
+    project = workdir / "project"
+    project.mkdir()
+    settings = {"handlerConcurrency": slots} if slots else {}
+    (project / ".joan-agents.json").write_text(json.dumps({
+        "projectId": project_id,
+        "projectName": "Load Test",
+        "settings": settings,
+    }, indent=2))
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir()
+    launcher = bin_dir / "claude"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" -S "{FAKE_CLAUDE}" "$@"\n')  # -S: stdlib only, faster startup
+    launcher.chmod(0o755)
+    return project
+
+
+def parse_slots(text: str) -> dict:
+    slots = {}
+    for item in filter(None, (text or "").split(",")):
+        worker, _, count = item.partition("=")
+        slots[worker.strip()] = int(count)
+    return slots
+
+
+async def send_generated(stub: JoanStub, args, event_types: list):
+    """Send `args.events` smart events at `args.rate` per second, one new task each."""
+    started = time.monotonic()
+    for i in range(args.events):
+        delay = started + i / args.rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        event_type = event_types[i % len(event_types)]
+        task = make_task(f"lt-{i:06d}", event_type, args.description_chars)
+        stub.add_task(task)
+        await stub.send_event({
+            "event_type": event_type,
+            "task_id": task["id"],
+            "metadata": {"smart_payload": make_smart_payload(task)},
+        })
+
+
+async def send_scripted(stub: JoanStub, events: list, speed: float):
+    for event in events:
+        if event.get("task_id") and event["task_id"] not in stub.tasks:
+            stub.add_task(make_task(event["task_id"], event.get("event_type", "")))
+    await stub.play(events, speed)
+
+
+async def run(args) -> dict:
+    capture_header, schedule = None, []
+    if args.replay:
+        capture_header, messages = read_capture(args.replay)
+        schedule = replay_schedule(messages, args.max_gap)
+
+    workdir = Path(tempfile.mkdtemp(prefix="joan-loadtest-"))
+    stub = JoanStub(project_id=(capture_header or {}).get("project_id") or "loadtest")
+    await stub.start()
+    project = make_project(workdir, stub.project_id, parse_slots(args.slots))
+
+    for i in range(args.backlog):
+        task = make_task(f"lt-backlog-{i:06d}", "task_needs_ba", args.description_chars)
+        stub.add_task(task, "task_needs_ba", make_smart_payload(task))
+    backlog = [item["task_id"] for item in stub.queues["ba"]]
+    stub.drop_every = args.drop_every
+    stub.replay_supported = not args.no_replay
+    stub.replay_ack = not args.no_ack
+
+    env = dict(os.environ)
+    env.update({
+        "JOAN_API_URL": stub.url,
+        "JOAN_AUTH_TOKEN": "loadtest",
+        "JOAN_PROJECT_DIR": str(project),
+        "JOAN_SLOTS_DIR": str(workdir / "slots"),  # don't compete with real ws-clients on this host
+        "JOAN_HOST_MAX_HANDLERS": str(args.host_slots),
+        "PATH": f"{workdir / 'bin'}{os.pathsep}{env.get('PATH', '')}",
+        "FAKE_CLAUDE_RUNTIME": str(args.runtime),
+        "FAKE_CLAUDE_OUTPUT_LINES": str(args.output_lines),
+        "FAKE_CLAUDE_LINE_BYTES": str(args.line_bytes),
+    })
+    client = await asyncio.create_subprocess_exec(
+        sys.executable, str(SCRIPTS_DIR / "ws-client.py"), "--project-dir", str(project),
+        cwd=project, env=env, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    try:
+        try:
+            await asyncio.wait_for(stub.connected.wait(), CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"ws-client.py did not connect within {CONNECT_TIMEOUT}s "
+                               f"(log: {project / '.claude' / 'logs' / 'websocket-client.log'})")
+
+        send_started = time.time()
+        if args.replay:
+            await stub.play_capture(schedule, args.speed)
+        elif args.script:
+            events = load_script(args.script)
+            await send_scripted(stub, events, args.speed)
+        else:
+            await send_generated(stub, args, args.event_types.split(","))
+        send_finished = time.time()
+
+        deadline = time.monotonic() + args.settle
+        while match_results(stub, backlog)["missing"] and time.monotonic() < deadline:
+            if client.returncode is not None:
+                break
+            await asyncio.sleep(0.05)
+
+        rss_kb = peak_rss_kb(client.pid)
+    finally:
+        if client.returncode is None:
+            client.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(client.wait(), 60)
+        except asyncio.TimeoutError:
+            client.kill()
+            await client.wait()
+        await stub.close()
+
+    matched = match_results(stub, backlog)
+    latencies = matched["latencies"]
+    starts = [r["output"]["started_at"] for r in stub.worker_results if (r.get("output") or {}).get("started_at")]
+    window = (max(starts) - send_started) if starts else 0
+    results_window = (max(r["received_at"] for r in stub.worker_results) - send_started) if stub.worker_results else 0
+    report = {
+        "events_sent": len(stub.history),
+        "send_seconds": round(send_finished - send_started, 3),
+        "expected_results": matched["expected"],
+        "results": len(stub.worker_results),
+        "missing": matched["missing"],
+        "coalesced": matched["coalesced"],
+        "duplicates": matched["duplicates"],
+        "failures": sum(1 for r in stub.worker_results if not r.get("success")),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p90": round(percentile(latencies, 90), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1),
+        } if latencies else None,
+        "dispatches_per_second": round(len(starts) / window, 2) if window > 0 else None,
+        "results_per_second": round(len(stub.worker_results) / results_window, 2) if results_window > 0 else None,
+        "client_peak_rss_mb": round(rss_kb / 1024, 1) if rss_kb else None,
+        "client_exit_code": client.returncode,
+        "reconnects": max(0, stub.connects - 1),
+        "drops": stub.drops,
+        "requests": dict(stub.requests),
+        "workdir": str(workdir) if args.keep else None,
+    }
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def print_report(report: dict):
+    print("=== Joan dispatch load test ===")
+    print(f"Events sent:       {report['events_sent']} in {report['send_seconds']}s")
+    print(f"Results:           {report['results']}/{report['expected_results']} "
+          f"(missing {report['missing']}, duplicates {report['duplicates']}, "
+          f"coalesced {report['coalesced']}, failures {report['failures']})")
+    latency = report["latency_ms"]
+    if latency:
+        print(f"Dispatch latency:  p50 {latency['p50']}ms  p90 {latency['p90']}ms  "
+              f"p99 {latency['p99']}ms  max {latency['max']}ms")
+    print(f"Dispatches/sec:    {report['dispatches_per_second']}")
+    print(f"Results/sec:       {report['results_per_second']}")
+    print(f"Client peak RSS:   {report['client_peak_rss_mb']} MB")
+    print(f"Client exit code:  {report['client_exit_code']}   reconnects: {report['reconnects']} "
+          f"(dropped {report['drops']})")
+    if report["workdir"]:
+        print(f"Work dir:          {report['workdir']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive events through ws-client.py against a loopback Joan server",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--events", type=int, default=200, help="Events to send")
+    parser.add_argument("--rate", type=float, default=20.0, help="Events per second")
+    parser.add_argument("--event-types", default="task_needs_ba",
+                        help=f"Comma-separated smart events, sent round-robin ({', '.join(SMART_EVENTS)})")
+    parser.add_argument("--script", help="JSONL event stream to send instead (optional \"at\" offsets)")
+    parser.add_argument("--replay", metavar="CAPTURE", help="Replay a `ws-client.py --record` capture instead")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Script/replay speed-up (1, 10, ...); 0 sends as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=DEFAULT_MAX_GAP,
+                        help="Longest pause replayed between captured messages (seconds, before --speed)")
+    parser.add_argument("--backlog", type=int, default=0, help="Tasks preloaded into actionable-tasks")
+    parser.add_argument("--slots", default="", help="handlerConcurrency override, e.g. ba=8,dev=4")
+    parser.add_argument("--host-slots", type=int, default=0,
+                        help="Machine-wide handler cap for the client (0: no host slot limit)")
+    parser.add_argument("--description-chars", type=int, default=2000, help="Task description size")
+    parser.add_argument("--runtime", type=float, default=0.5, help="Fake handler runtime (seconds)")
+    parser.add_argument("--output-lines", type=int, default=10, help="Lines printed per fake handler")
+    parser.add_argument("--line-bytes", type=int, default=120, help="Bytes per output line")
+    parser.add_argument("--drop-every", type=int, default=0, metavar="N",
+                        help="Drop the client's WebSocket after every N events (0: never)")
+    parser.add_argument("--no-replay", action="store_true",
+                        help="Answer the client's replay request with replay_unavailable")
+    parser.add_argument("--no-ack", action="store_true",
+                        help="Ignore the client's replay request entirely (no replay, no acknowledgement)")
+    parser.add_argument("--settle", type=float, default=60.0, help="Seconds to wait for outstanding results")
+    parser.add_argument("--keep", action="store_true", help="Keep the project dir (client logs, metrics)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.drop_every < 0:
+        parser.error("--drop-every must not be negative")
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    sys.exit(0 if report["missing"] == 0 and report["duplicates"] == 0 else 1)
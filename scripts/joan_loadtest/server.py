@@ -0,0 +1,448 @@
+"""
+Loopback stand-in for the Joan API and event WebSocket.
+
+Serves on one port everything ws-client.py and its handlers talk to:
+
+    GET  /api/v1/projects/:id/actionable-tasks    backlog plus smart-event tasks awaiting a result
+    GET  /api/v1/projects/:id/events/ws           event WebSocket (pushed or scripted events)
+    POST /api/v1/projects/:id/tasks/:task/worker-result
+    GET  /api/v1/projects/:id/tasks
+    GET  /api/v1/projects/:id/columns
+
+The WebSocket side is a small RFC 6455 implementation: text frames out,
+ping/pong and close in. The websockets handshake parser refuses requests
+with a body, so that library can't also serve the REST endpoints on the
+port the client derives its WebSocket URL from.
+
+For reconnect testing it can drop every client after each N events and
+answer replay requests with replay_unavailable, or not at all.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+from collections import Counter
+from typing import Iterable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+# Largest request body or client frame accepted (worker results carry short output)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+DEFAULT_COLUMNS = [
+    {"id": "col-todo", "name": "To Do", "position": 0, "default_status": "todo"},
+    {"id": "col-analyse", "name": "Analyse", "position": 1, "default_status": "todo"},
+    {"id": "col-development", "name": "Development", "position": 2, "default_status": "in_progress"},
+    {"id": "col-review", "name": "Review", "position": 3, "default_status": "in_progress"},
+    {"id": "col-deploy", "name": "Deploy", "position": 4, "default_status": "in_progress"},
+    {"id": "col-done", "name": "Done", "position": 5, "default_status": "done"},
+]
+
+# Smart event -> (actionable-tasks queue, handler, column), as ws-client.py routes them
+SMART_EVENTS = {
+    "task_needs_ba": ("ba", "handle-ba", "col-analyse"),
+    "task_needs_plan": ("architect", "handle-architect", "col-analyse"),
+    "task_ready_for_dev": ("dev", "handle-dev", "col-development"),
+    "task_ready_for_review": ("reviewer", "handle-reviewer", "col-review"),
+    "task_ready_for_merge": ("ops", "handle-ops", "col-deploy"),
+}
+
+# Legacy tag_added tags ws-client.py dispatches a handler for
+DISPATCH_TAGS = {
+    "Ready", "Plan-Approved", "Plan-Rejected", "Planned", "Rework-Requested", "Merge-Conflict",
+    "Dev-Complete", "Rework-Complete", "Ops-Ready", "Clarification-Answered", "Invoke-Architect",
+    "Architect-Assist-Complete",
+}
+
+
+def dispatches_handler(payload: dict) -> bool:
+    """Whether ws-client.py starts a handler for this event payload."""
+    if payload.get("triggered_by") == "agent" or not payload.get("task_id"):
+        return False
+    event_type = payload.get("event_type")
+    if event_type == "tag_added":
+        changes = payload.get("changes") or [{}]
+        return (changes[0].get("new_value") or changes[0].get("old_value")) in DISPATCH_TAGS
+    return event_type in SMART_EVENTS or event_type in ("task_needs_ba_reevaluation", "task_needs_rework",
+                                                        "task_created")
+
+
+def make_task(task_id: str, event_type: str = "task_needs_ba", description_chars: int = 2000) -> dict:
+    """A task shaped like Joan's, with a description of roughly `description_chars`."""
+    column = SMART_EVENTS.get(event_type, SMART_EVENTS["task_needs_ba"])[2]
+    sentence = "Load-test task body with enough prose to exercise payload projection. "
+    description = (sentence * (description_chars // len(sentence) + 1))[:description_chars]
+    return {
+        "id": task_id,
+        "title": f"Load test {task_id}",
+        "description": description,
+        "status": "todo",
+        "priority": "medium",
+        "column_id": column,
+        "created_at": "2026-01-01T00:00:00Z",
+    }
+
+
+def make_smart_payload(task: dict, comments: int = 5, subtasks: int = 3) -> dict:
+    """The smart_payload a Joan smart event would carry for `task`."""
+    return {
+        "task": task,
+        "tags": [{"name": "Load-Test"}],
+        "handoff_context": None,
+        "recent_comments": [
+            {"author": "loadtest", "content": f"Comment {i} on {task['title']}", "created_at": "2026-01-01T00:00:00Z"}
+            for i in range(comments)
+        ],
+        "subtasks": [{"title": f"Subtask {i}", "completed": False} for i in range(subtasks)],
+        "columns": [{"id": c["id"], "name": c["name"]} for c in DEFAULT_COLUMNS],
+    }
+
+
+def encode_frame(opcode: int, data: bytes) -> bytes:
+    """A single unmasked (server-to-client) frame."""
+    length = len(data)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple:
+    """Read one client frame and return (opcode, unmasked payload)."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY_BYTES:
+        raise ValueError(f"frame too large ({length} bytes)")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    data = await reader.readexactly(length)
+    if mask:
+        data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+    return first & 0x0F, data
+
+
+class WebSocketConnection:
+    """One client on the event WebSocket."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, query: dict):
+        self.reader = reader
+        self.writer = writer
+        self.query = query  # ?token=&projectId=&since=&lastEventId=
+        self.closed = asyncio.Event()
+
+    async def send(self, message):
+        """Send a JSON message (dict) or pre-serialized text frame."""
+        text = message if isinstance(message, str) else json.dumps(message)
+        if self.closed.is_set():
+            return
+        try:
+            self.writer.write(encode_frame(OP_TEXT, text.encode("utf-8")))
+            await self.writer.drain()
+        except (ConnectionError, RuntimeError):
+            self.closed.set()
+
+    async def close(self):
+        if not self.closed.is_set():
+            try:
+                self.writer.write(encode_frame(OP_CLOSE, struct.pack("!H", 1001)))
+                await self.writer.drain()
+            except (ConnectionError, RuntimeError):
+                pass
+            self.closed.set()
+
+    def abort(self):
+        """Drop the TCP connection without a close frame."""
+        self.closed.set()
+        self.writer.transport.abort()
+
+    async def serve(self):
+        """Answer pings and the closing handshake until the client goes away."""
+        try:
+            while not self.closed.is_set():
+                opcode, data = await read_frame(self.reader)
+                if opcode == OP_PING:
+                    self.writer.write(encode_frame(OP_PONG, data))
+                    await self.writer.drain()
+                elif opcode == OP_CLOSE:
+                    self.writer.write(encode_frame(OP_CLOSE, data[:2]))
+                    await self.writer.drain()
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.closed.set()
+
+
+class JoanStub:
+    """In-process Joan API + event WebSocket for one project."""
+
+    def __init__(self, project_id: str = "loadtest", host: str = "127.0.0.1", port: int = 0):
+        self.project_id = project_id
+        self.host = host
+        self.port = port
+        self.columns = list(DEFAULT_COLUMNS)
+        self.tasks = {}                  # task_id -> task
+        self.queues = {name: [] for name in ("ops", "reviewer", "dev", "architect", "ba")}
+        self.history = []                # every event payload sent, for ?lastEventId= replay
+        self.sent = []                   # (wall-clock time, payload) for every event sent, in order
+        self.worker_results = []         # POSTed bodies, plus task_id and received_at
+        self.requests = Counter()        # "METHOD endpoint" -> count
+        self.connections = set()
+        self.connected = asyncio.Event()
+        self.connects = 0
+        self.drops = 0
+        self.drop_every = 0              # drop every connection after this many events (0: never)
+        self.replay_supported = True     # False: answer replay requests with replay_unavailable
+        self.replay_ack = True           # False: ignore replay requests, like a server without replay
+        self._event_seq = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for connection in list(self.connections):
+            await connection.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # -------------------------------------------------------------------------
+    # Fixtures
+    # -------------------------------------------------------------------------
+
+    def add_task(self, task: dict, queue_event: Optional[str] = None, smart_payload: Optional[dict] = None):
+        """Register a task; with `queue_event`, also list it in actionable-tasks."""
+        self.tasks[task["id"]] = task
+        if queue_event in SMART_EVENTS:
+            self.enqueue(task, queue_event, smart_payload)
+
+    def enqueue(self, task: dict, event_type: str, smart_payload: Optional[dict] = None):
+        """List a task in the actionable-tasks queue for `event_type` until a worker-result arrives."""
+        queue, handler, _ = SMART_EVENTS[event_type]
+        if not any(item["task_id"] == task["id"] for item in self.queues[queue]):
+            self.queues[queue].append({
+                "task_id": task["id"],
+                "task_title": task.get("title", ""),
+                "handler": handler,
+                "handler_args": ["--mode=plan"] if queue == "architect" else [],
+                "smart_payload": smart_payload,
+            })
+
+    # -------------------------------------------------------------------------
+    # Events
+    # -------------------------------------------------------------------------
+
+    async def send_event(self, payload: dict) -> int:
+        """Send an event to every connected client; returns how many received it."""
+        self._event_seq += 1
+        payload.setdefault("id", f"evt-{self._event_seq}")
+        payload.setdefault("project_id", self.project_id)
+        payload.setdefault("timestamp", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        self.history.append(payload)
+        self.sent.append((time.time(), payload))
+        task = self.tasks.get(payload.get("task_id"))
+        if task and payload.get("event_type") in SMART_EVENTS:
+            # Joan lists the task as actionable until its worker reports back
+            self.enqueue(task, payload["event_type"], (payload.get("metadata") or {}).get("smart_payload"))
+        received = await self.broadcast({"type": "event", "payload": payload})
+        self._maybe_drop()
+        return received
+
+    async def send_raw(self, text: str) -> int:
+        """Send a captured message verbatim, tracking the events in it like send_event."""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not (isinstance(message, dict) and message.get("type") == "event"):
+            return await self.broadcast(text)
+        payload = message.get("payload") or {}
+        self.history.append(payload)
+        self.sent.append((time.time(), payload))
+        received = await self.broadcast(text)
+        self._maybe_drop()
+        return received
+
+    def _maybe_drop(self):
+        if self.drop_every and len(self.sent) % self.drop_every == 0:
+            self.drop_connections()
+
+    async def broadcast(self, message) -> int:
+        """Send a raw message (dict or JSON text) to every connected client."""
+        connections = [c for c in self.connections if not c.closed.is_set()]
+        for connection in connections:
+            await connection.send(message)
+        return len(connections)
+
+    def drop_connections(self):
+        """Cut every client off without a closing handshake, as a network failure would."""
+        for connection in list(self.connections):
+            connection.abort()
+            self.drops += 1
+
+    async def play(self, events: Iterable[dict], speed: float = 1.0):
+        """Send scripted events; each may carry an "at" offset in seconds from the start.
+
+        `speed` scales the offsets (10 = ten times faster); 0 sends as fast as possible.
+        """
+        started = time.monotonic()
+        for event in events:
+            event = dict(event)
+            at = event.pop("at", None)
+            await self._wait_until(started, at, speed)
+            await self.send_event(event)
+
+    async def play_capture(self, schedule: Iterable[tuple], speed: float = 1.0):
+        """Replay (offset, raw message) pairs from a ws-client capture, see capture.replay_schedule."""
+        started = time.monotonic()
+        for at, raw in schedule:
+            await self._wait_until(started, at, speed)
+            await self.send_raw(raw)
+
+    @staticmethod
+    async def _wait_until(started: float, at: Optional[float], speed: float):
+        if at is not None and speed > 0:
+            delay = started + at / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    # -------------------------------------------------------------------------
+    # HTTP
+    # -------------------------------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ValueError(f"request body too large ({length} bytes)")
+            body = await reader.readexactly(length) if length else b""
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            writer.close()
+            return
+
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")  # api v1 projects :id resource...
+        endpoint = parts[4:]
+        if endpoint[:1] == ["tasks"] and len(endpoint) > 1:
+            endpoint = ["tasks", ":id"] + endpoint[2:]
+        self.requests[f"{method} /{'/'.join(endpoint)}"] += 1
+
+        if parts[-1:] == ["ws"] and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers, query)
+            return
+
+        status, response = self._route(method, parts, query, body)
+        data = json.dumps(response).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def _route(self, method: str, parts: list, query: dict, body: bytes) -> tuple:
+        if parts[:3] != ["api", "v1", "projects"] or len(parts) < 5:
+            return 404, {"error": "not found"}
+        resource = parts[4:]
+
+        if method == "GET" and resource == ["actionable-tasks"]:
+            queues = {name: list(items) for name, items in self.queues.items()}
+            if query.get("include_payloads") != "true":
+                queues = {name: [{k: v for k, v in item.items() if k != "smart_payload"} for item in items]
+                          for name, items in queues.items()}
+            return 200, {"queues": queues, "summary": {name: len(items) for name, items in queues.items()}}
+
+        if method == "GET" and resource == ["tasks"]:
+            return 200, {"data": list(self.tasks.values())}
+
+        if method == "GET" and len(resource) == 2 and resource[0] == "tasks":
+            task = self.tasks.get(resource[1])
+            return (200, task) if task else (404, {"error": "task not found"})
+
+        if method == "GET" and resource == ["columns"]:
+            return 200, {"data": self.columns}
+
+        if method == "POST" and len(resource) == 3 and resource[0] == "tasks" and resource[2] == "worker-result":
+            try:
+                result = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "invalid JSON"}
+            result["task_id"] = resource[1]
+            result["received_at"] = time.time()
+            self.worker_results.append(result)
+            for name, items in self.queues.items():
+                self.queues[name] = [item for item in items if item["task_id"] != resource[1]]
+            return 200, {"message": "Result recorded (loopback)", "actions_applied": []}
+
+        return 404, {"error": "not found"}
+
+    async def _websocket(self, reader, writer, headers: dict, query: dict):
+        accept = base64.b64encode(
+            hashlib.sha1((headers.get("sec-websocket-key", "") + WS_GUID).encode()).digest()
+        ).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+
+        connection = WebSocketConnection(reader, writer, query)
+        self.connects += 1
+        await connection.send({"type": "event", "payload": {"event_type": "connected", "project_id": self.project_id}})
+        await self._replay(connection, query)
+        self.connections.add(connection)
+        self.connected.set()
+        try:
+            await connection.serve()
+        finally:
+            self.connections.discard(connection)
+            if not self.connections:
+                self.connected.clear()
+            writer.close()
+
+    async def _replay(self, connection: WebSocketConnection, query: dict):
+        """Resend events after ?lastEventId=, like the Joan server's replay."""
+        last_id, since = query.get("lastEventId"), query.get("since")
+        if (not last_id and not since) or not self.replay_ack:
+            return
+        ids = [event["id"] for event in self.history]
+        if not self.replay_supported or (last_id and last_id not in ids):
+            await connection.send({"type": "replay_unavailable", "reason": "event not in loopback history"})
+            return
+        if last_id:
+            missed = self.history[ids.index(last_id) + 1:]
+        else:
+            missed = [event for event in self.history if event["timestamp"] > since]
+        for event in missed:
+            await connection.send({"type": "event", "replayed": True, "payload": event})
+        await connection.send({"type": "replay_complete"})
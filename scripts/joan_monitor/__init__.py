@@ -6,6 +6,8 @@ Usage:
     joan status <project>    # Detailed view of specific project
     joan status <project> -f # Live updating dashboard
     joan logs <project>      # Tail logs for specific project
+    joan slots [-f]          # Machine-wide handler slots and who holds them
+    joan top [-f]            # Running handlers by CPU, memory and I/O use
 """
 
 from joan_monitor.monitor import main
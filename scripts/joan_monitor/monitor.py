@@ -28,6 +28,9 @@ except ImportError:
 
 from joan_monitor.constants import REFRESH_INTERVALS
 from joan_monitor.parsers import (
+    host_slots_dir,
+    parse_handler_usage,
+    parse_host_slots,
     parse_log_stats,
     parse_metrics,
     parse_webhook_log_stats,
@@ -38,6 +41,8 @@ from joan_monitor.panels import (
     generate_global_layout,
     generate_global_table,
     generate_project_layout,
+    generate_slots_table,
+    generate_top_table,
     get_combined_recent_logs,
     show_metrics_panel,
 )
@@ -102,39 +107,9 @@ class JoanMonitor:
 
                 if is_ws_client:
                     pid_match = re.match(r"\S+\s+(\d+)", line)
-                    path_match = re.search(
-                        r"--project-dir[=\s]+([^\s]+)", line
-                    )
-
-                    if path_match and pid_match:
-                        raw_path = path_match.group(1)
-                        pid = pid_match.group(1)
-
-                        if not raw_path.startswith("/"):
-                            try:
-                                lsof_result = subprocess.run(
-                                    ["lsof", "-p", pid],
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=5,
-                                )
-                                for lsof_line in lsof_result.stdout.splitlines():
-                                    if "\tcwd\t" in lsof_line or " cwd " in lsof_line:
-                                        parts = lsof_line.split()
-                                        if len(parts) >= 9:
-                                            process_cwd = parts[-1]
-                                            project_dir = (
-                                                Path(process_cwd) / raw_path
-                                            )
-                                            project_dir = project_dir.resolve()
-                                            break
-                                else:
-                                    project_dir = Path(raw_path).resolve()
-                            except (subprocess.TimeoutExpired, Exception):
-                                project_dir = Path(raw_path).resolve()
-                        else:
-                            project_dir = Path(raw_path).resolve()
-
+                    if not pid_match:
+                        continue
+                    for project_dir in self._client_project_dirs(pid_match.group(1), line):
                         if project_dir.exists():
                             self._add_instance(
                                 project_dir,
@@ -145,6 +120,58 @@ class JoanMonitor:
         except subprocess.CalledProcessError:
             pass
 
+    def _client_project_dirs(self, pid: str, ps_line: str) -> list:
+        """Project dirs served by one ws-client process.
+
+        A client serves every --project-dir it was given plus the projects
+        listed in its --manifest. Relative paths are resolved against the
+        process's working directory.
+        """
+        raw_paths = re.findall(r"--project-dir[=\s]+([^\s]+)", ps_line)
+        manifest_match = re.search(r"--manifest[=\s]+([^\s]+)", ps_line)
+        if not raw_paths and not manifest_match:
+            return []
+
+        cwd = Path(".")
+        if not all(p.startswith("/") for p in raw_paths) or (
+            manifest_match and not manifest_match.group(1).startswith("/")
+        ):
+            cwd = self._process_cwd(pid) or cwd
+
+        project_dirs = [(cwd / raw_path).resolve() for raw_path in raw_paths]
+        if manifest_match:
+            manifest = (cwd / manifest_match.group(1)).resolve()
+            try:
+                data = json.loads(manifest.read_text())
+            except (OSError, ValueError):
+                data = []
+            if isinstance(data, dict):
+                data = data.get("projects", [])
+            for item in data if isinstance(data, list) else []:
+                raw_path = item.get("dir") if isinstance(item, dict) else item
+                if isinstance(raw_path, str) and raw_path:
+                    project_dirs.append((manifest.parent / Path(raw_path).expanduser()).resolve())
+        return list(dict.fromkeys(project_dirs))
+
+    @staticmethod
+    def _process_cwd(pid: str) -> "Path | None":
+        """Working directory of a process, via lsof."""
+        try:
+            lsof_result = subprocess.run(
+                ["lsof", "-p", pid],
+                capture_output=True,
+                text=True,
+                timeout=5,
+            )
+        except (subprocess.TimeoutExpired, Exception):
+            return None
+        for lsof_line in lsof_result.stdout.splitlines():
+            if "\tcwd\t" in lsof_line or " cwd " in lsof_line:
+                parts = lsof_line.split()
+                if len(parts) >= 9:
+                    return Path(parts[-1])
+        return None
+
     def _add_instance(
         self,
         project_dir: Path,
@@ -250,6 +277,70 @@ class JoanMonitor:
             "[dim]Run [cyan]joan logs <project>[/cyan] to tail logs[/dim]\n"
         )
 
+    def show_slots_view(self, follow: bool = False):
+        """Display the machine-wide handler slots and who holds them."""
+        slots_dir = host_slots_dir()
+        if follow:
+            try:
+                with Live(
+                    generate_slots_table(parse_host_slots(slots_dir)),
+                    refresh_per_second=2,
+                    console=self.console,
+                ) as live:
+                    while True:
+                        time.sleep(REFRESH_INTERVALS["worker_activity"])
+                        live.update(generate_slots_table(parse_host_slots(slots_dir)))
+            except KeyboardInterrupt:
+                self.console.print("\n[yellow]Stopped monitoring[/yellow]\n")
+            return
+
+        host_slots = parse_host_slots(slots_dir)
+        if not host_slots["max_handlers"]:
+            self.console.print(
+                "\n[yellow]Host slots are disabled (no slots.json, or maxHandlers is 0)[/yellow]\n"
+            )
+            return
+        self.console.print()
+        self.console.print(generate_slots_table(host_slots))
+        self.console.print(
+            f"[dim]Pool configured in [cyan]{slots_dir / 'slots.json'}[/cyan][/dim]\n"
+        )
+
+    def _handler_usage(self) -> list:
+        """Live handlers of every running instance, with their resource use."""
+        self.discover_instances()
+        handlers = []
+        for proj_name, info in self.instances.items():
+            for handler in parse_handler_usage(info["project_dir"]):
+                handlers.append({**handler, "project": proj_name})
+        return handlers
+
+    def show_top_view(self, follow: bool = False):
+        """Display running handlers sorted by resource use (CPU, RSS, I/O)."""
+        if follow:
+            try:
+                with Live(
+                    generate_top_table(self._handler_usage()),
+                    refresh_per_second=2,
+                    console=self.console,
+                ) as live:
+                    while True:
+                        time.sleep(REFRESH_INTERVALS["process_discovery"])
+                        live.update(generate_top_table(self._handler_usage()))
+            except KeyboardInterrupt:
+                self.console.print("\n[yellow]Stopped monitoring[/yellow]\n")
+            return
+
+        handlers = self._handler_usage()
+        if not handlers:
+            self.console.print("\n[yellow]No handlers running[/yellow]\n")
+            return
+        self.console.print()
+        self.console.print(generate_top_table(handlers))
+        self.console.print(
+            "[dim]Sampled by ws-client every few seconds; run [cyan]joan top -f[/cyan] to follow[/dim]\n"
+        )
+
     def show_project_view(self, project_name: str, follow: bool = False):
         """Display detailed view for a specific project."""
         self.discover_instances()
@@ -355,6 +446,11 @@ class JoanMonitor:
                 "Handlers Dispatched",
                 str(stats.get("handlers_dispatched", 0)),
             )
+            if stats.get("dispatches_suppressed"):
+                stats_table.add_row(
+                    "Duplicates Suppressed",
+                    str(stats["dispatches_suppressed"]),
+                )
             handlers_by_type = stats.get("handlers_by_type", {})
             if handlers_by_type:
                 breakdown = ", ".join(
@@ -695,7 +791,7 @@ def main():
     )
 
     parser.add_argument(
-        "command", choices=["status", "logs"], help="Command to run"
+        "command", choices=["status", "logs", "slots", "top"], help="Command to run"
     )
     parser.add_argument(
         "project", nargs="?", help="Project name (partial match supported)"
@@ -704,7 +800,7 @@ def main():
         "-f",
         "--follow",
         action="store_true",
-        help="Follow/live update (for status command)",
+        help="Follow/live update (for status, slots and top commands)",
     )
 
     args = parser.parse_args()
@@ -720,3 +816,7 @@ def main():
             print("Error: Project name required for logs command")
             sys.exit(1)
         monitor.tail_logs(args.project)
+    elif args.command == "slots":
+        monitor.show_slots_view(follow=args.follow)
+    elif args.command == "top":
+        monitor.show_top_view(follow=args.follow)
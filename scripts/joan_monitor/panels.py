@@ -133,6 +133,103 @@ def generate_global_table(instances: dict) -> Table:
     return table
 
 
+def generate_slots_table(host_slots: dict) -> Table:
+    """Generate the machine-wide handler slot table (joan slots)."""
+    table = Table(
+        title=f"Joan Agents - Host Slots ({host_slots['held']}/{host_slots['max_handlers']} held)",
+        box=box.ROUNDED,
+        show_header=True,
+        header_style="bold cyan",
+    )
+
+    table.add_column("Slot", style="dim", width=24)
+    table.add_column("Pool", width=16)
+    table.add_column("Project", style="cyan", width=18)
+    table.add_column("Handler", width=17)
+    table.add_column("Task", width=10)
+    table.add_column("PID", justify="right", width=8)
+    table.add_column("Held", justify="right", width=9)
+
+    now = datetime.now()
+    for slot in host_slots["slots"]:
+        holder = slot["holder"]
+        if holder is None:
+            table.add_row(slot["name"], slot["kind"], "[dim]free[/dim]", "", "", "", "")
+            continue
+        acquired = holder.get("acquired_at")
+        held_for = format_duration(now - datetime.fromtimestamp(acquired)) if acquired else "?"
+        table.add_row(
+            slot["name"],
+            slot["kind"],
+            holder.get("project") or holder.get("project_id") or "?",
+            holder.get("handler", "?"),
+            (holder.get("task_id") or "")[:8],
+            str(holder.get("pid", "?")),
+            held_for,
+        )
+    return table
+
+
+def format_bytes(count: float) -> str:
+    """Format a byte count as B, K, M or G."""
+    for unit in ("B", "K", "M", "G"):
+        if count < 1024 or unit == "G":
+            return f"{count:.0f}{unit}" if unit == "B" else f"{count:.1f}{unit}"
+        count /= 1024
+
+
+def generate_top_table(handlers: list) -> Table:
+    """Generate the live handler table (joan top), busiest first; paused handlers in yellow."""
+    table = Table(
+        title=f"Joan Agents - Handlers ({len(handlers)} running)",
+        box=box.ROUNDED,
+        show_header=True,
+        header_style="bold cyan",
+    )
+
+    table.add_column("Project", style="cyan", width=14)
+    table.add_column("Worker", width=9)
+    table.add_column("Task", width=24, no_wrap=True)
+    table.add_column("PID", justify="right", width=7)
+    table.add_column("Procs", justify="right", width=5)
+    table.add_column("CPU%", justify="right", width=5)
+    table.add_column("CPU", justify="right", width=8)
+    table.add_column("RSS", justify="right", width=7)
+    table.add_column("Peak", justify="right", width=7)
+    table.add_column("Read", justify="right", width=7)
+    table.add_column("Write", justify="right", width=7)
+    table.add_column("Running", justify="right", width=8)
+
+    now = datetime.now()
+    ordered = sorted(
+        handlers,
+        key=lambda h: (h.get("cpu_percent", 0), h.get("rss_mb", 0), h.get("cpu_seconds", 0)),
+        reverse=True,
+    )
+    for handler in ordered:
+        style = "dim" if handler.get("stale") else "yellow" if handler.get("paused") else None
+        task = (handler.get("task_id") or "")[:8]
+        if handler.get("task_title"):
+            task += f" {handler['task_title']}"
+        started = handler.get("started_at")
+        table.add_row(
+            handler.get("project", "?"),
+            handler.get("worker") or handler.get("handler", "?"),
+            task,
+            str(handler.get("pid", "?")),
+            str(handler.get("processes", 0)),
+            f"{handler.get('cpu_percent', 0):.0f}",
+            format_duration(timedelta(seconds=handler.get("cpu_seconds", 0))),
+            format_bytes(handler.get("rss_mb", 0) * 1024 * 1024),
+            format_bytes(handler.get("peak_rss_mb", 0) * 1024 * 1024),
+            format_bytes(handler.get("read_bytes", 0)),
+            format_bytes(handler.get("write_bytes", 0)),
+            format_duration(now - datetime.fromtimestamp(started)) if started else "?",
+            style=style,
+        )
+    return table
+
+
 def get_combined_recent_logs(instances: dict, lines: int = 8) -> Text:
     """Get recent log lines from all projects, interleaved by time."""
     import re
@@ -879,6 +976,8 @@ def generate_project_layout(
     if mode == "websocket":
         stats_table.add_row("Events", str(stats.get("events_received", 0)))
         stats_table.add_row("Handlers", str(stats.get("handlers_dispatched", 0)))
+        if stats.get("dispatches_suppressed"):
+            stats_table.add_row("Dupes Skipped", str(stats["dispatches_suppressed"]))
         if stats.get("last_event"):
             elapsed = (now - stats["last_event"]).total_seconds()
             stats_table.add_row("Last Event", f"{int(elapsed)}s ago")
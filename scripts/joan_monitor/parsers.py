@@ -2,11 +2,16 @@
 Log file parsers for the Joan Monitor dashboard.
 
 Extracts runtime statistics from scheduler logs, webhook receiver logs,
-agent metrics files, and worker activity logs.
+agent metrics files, and worker activity logs, and reads the machine-wide
+handler slots shared by ws-client processes and their live handlers'
+resource use.
 """
 
+import fcntl
 import json
+import os
 import re
+import time
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
@@ -324,6 +329,7 @@ def parse_webhook_log_stats(log_file: Path) -> dict:
         "last_event": None,
         "events_received": 0,
         "handlers_dispatched": 0,
+        "dispatches_suppressed": 0,
         "active_workers": [],
         "tasks_completed": 0,
         "recent_events": [],
@@ -393,6 +399,20 @@ def parse_webhook_log_stats(log_file: Path) -> dict:
                         stats["handlers_by_type"].get(handler_type, 0) + 1
                     )
 
+            # Missed-event recovery dispatches (actionable-tasks diff after reconnect)
+            if "RECOVERY: Dispatching" in line:
+                stats["handlers_dispatched"] += 1
+                handler_match = re.search(r"Dispatching (handle-\w+)", line)
+                if handler_match:
+                    handler_type = handler_match.group(1).replace("handle-", "").capitalize()
+                    stats["handlers_by_type"][handler_type] = (
+                        stats["handlers_by_type"].get(handler_type, 0) + 1
+                    )
+
+            # Duplicate/stale dispatches suppressed by ws-client's dedup cache
+            if "Suppressed duplicate dispatch:" in line or "Suppressed stale dispatch:" in line:
+                stats["dispatches_suppressed"] += 1
+
             # Track completions
             if "completed" in line.lower() and (
                 "worker" in line.lower() or "handler" in line.lower()
@@ -657,3 +677,99 @@ def parse_worker_activity(worker_log: Path) -> dict:
         pass
 
     return activity
+
+
+def host_slots_dir() -> Path:
+    """Directory of ws-client's machine-wide handler slot files (JOAN_SLOTS_DIR)."""
+    return Path(os.environ.get("JOAN_SLOTS_DIR") or Path.home() / ".joan-agents" / "slots")
+
+
+def parse_host_slots(slots_dir: Path) -> dict:
+    """Read the machine-wide handler slots: the configured pool and who holds each slot.
+
+    A slot is held while some ws-client has it flocked; the file then names
+    the holder. Mirrors the pool layout of ws-client.py's HostSlots.
+    """
+    def count(value, default):
+        try:
+            return default if isinstance(value, bool) else max(0, int(value))
+        except (TypeError, ValueError):
+            return default
+
+    data = None  # no slots.json: host slots are off
+    try:
+        data = json.loads((slots_dir / "slots.json").read_text())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        data = {}
+    if data is not None and not isinstance(data, dict):
+        data = {}
+    max_handlers = 0 if data is None else os.cpu_count() or 1
+    max_handlers = count((data or {}).get("maxHandlers", max_handlers), max_handlers)
+    max_handlers = count(os.environ.get("JOAN_HOST_MAX_HANDLERS") or max_handlers, max_handlers)
+    raw_minimums = (data or {}).get("projectMinimums") or {}
+    minimums = {
+        re.sub(r"[^A-Za-z0-9_-]+", "-", str(k)).strip("-") or "project": count(v, 0)
+        for k, v in (raw_minimums.items() if isinstance(raw_minimums, dict) else ())
+    }
+    shared = max(0, max_handlers - sum(minimums.values()))
+
+    names = [f"slot-{i:02d}.lock" for i in range(shared)]
+    for key, count in minimums.items():
+        names += [f"reserved-{key}-{i:02d}.lock" for i in range(count)]
+    if slots_dir.is_dir():
+        # Slots left over from a larger pool still count while held
+        names += sorted(p.name for p in slots_dir.glob("*.lock") if p.name not in names)
+
+    slots = []
+    for name in names:
+        path = slots_dir / name
+        holder = None
+        if path.exists():
+            try:
+                with open(path, "rb") as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                        fcntl.flock(f, fcntl.LOCK_UN)
+                    except BlockingIOError:
+                        try:
+                            holder = json.loads(f.read() or b"{}")
+                        except ValueError:
+                            holder = {}
+            except OSError:
+                pass
+        if name.startswith("reserved-"):
+            kind = f"reserved: {name[len('reserved-'):].rsplit('-', 1)[0]}"
+        else:
+            kind = "shared"
+        slots.append({"name": name, "kind": kind, "holder": holder})
+
+    return {
+        "dir": slots_dir,
+        "max_handlers": max_handlers,
+        "minimums": minimums,
+        "slots": slots,
+        "held": sum(1 for slot in slots if slot["holder"] is not None),
+    }
+
+
+def parse_handler_usage(project_dir: Path) -> list:
+    """Live handlers of a project and their resource use (.claude/ws-handlers-usage.json).
+
+    ws-client rewrites the file every few seconds while handlers run. It is
+    ignored once that ws-client is gone; handlers it has not updated for
+    three sample intervals are marked stale.
+    """
+    try:
+        data = json.loads((project_dir / ".claude" / "ws-handlers-usage.json").read_text())
+    except (OSError, ValueError):
+        return []
+    try:
+        os.kill(int(data.get("pid")), 0)
+    except PermissionError:
+        pass
+    except (OSError, ValueError, TypeError):
+        return []
+    stale = time.time() - data.get("updated_at", 0) > 3 * data.get("interval", 5)
+    return [{**handler, "stale": stale} for handler in data.get("handlers", [])]
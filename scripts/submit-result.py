@@ -25,6 +25,8 @@ Environment variables:
     JOAN_AUTH_TOKEN   - JWT auth token
     JOAN_PROJECT_ID   - Default project ID
     JOAN_TASK_ID      - Default task ID
+    JOAN_RESULT_MARKER - Set by ws-client.py; touched after a successful submission
+                         so ws-client knows the handler reported its result
 
 Examples:
     # BA marks requirements complete
@@ -121,6 +123,19 @@ def submit_result(
         return False
 
 
+def mark_result_submitted(task_id: str, result_type: str, success: bool):
+    """Record the submission for ws-client.py (JOAN_RESULT_MARKER), if it launched us."""
+    marker = os.environ.get('JOAN_RESULT_MARKER')
+    if not marker or task_id != os.environ.get('JOAN_TASK_ID'):
+        return
+    try:
+        path = Path(marker)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"result_type": result_type, "success": success}))
+    except OSError as e:
+        print(f"Warning: could not write result marker: {e}", file=sys.stderr)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Submit worker result to Joan API',
@@ -186,6 +201,8 @@ def main():
         structured_comment=structured_comment,
         error=args.error
     )
+    if success:
+        mark_result_submitted(task_id, args.result_type, args.success == 'true')
 
     sys.exit(0 if success else 1)
 
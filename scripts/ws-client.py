@@ -13,14 +13,34 @@ Phase 3 Architecture:
 - Use submit-result.py to report completion from handlers
 
 Features:
-- State-driven startup: queries actionable-tasks API on launch (zero cold start)
+- State-driven startup: queries actionable-tasks API on launch, overlapped with the WebSocket connect
 - Outbound WebSocket connection (works through firewalls)
 - Auto-reconnect with exponential backoff
-- Smart event payloads passed to handlers (zero re-fetching)
+- Missed-event recovery: persisted event cursor, server replay, actionable-tasks diff fallback
+- Smart event payloads passed to handlers (zero re-fetching), fitted to per-handler token budgets
+- Bounded handler concurrency per worker type (excess dispatches queue)
+- Priority scheduling for all dispatches: ops > reviewer > dev > architect > ba, with aging
+- Duplicate/stale dispatch suppression across startup, smart and legacy events
+- Single-flight per task: one running handler, newest follow-up runs after it
+- Handler timeouts (settings.workerTimeouts): SIGTERM, then SIGKILL, to the handler's process group
+- Graceful drain on SIGTERM/SIGINT (settings.shutdownDrainSeconds); a second signal forces termination
+- Failure results auto-submitted for handlers that exit non-zero without reporting (releases the claim)
+- Crash recovery: handlers are journaled (.claude/ws-handlers.jsonl) and reattached after a restart
+- Optional capture of raw inbound WebSocket messages (--record) for offline replay
+- Blocking work (spawns, payload serialization, file and console I/O) kept off the event loop; loop lag probe
+- Optional Prometheus /metrics endpoint (--metrics) on localhost or a unix socket
+- Several projects per process (--project-dir repeated or --manifest), sharing one event loop,
+  keep-alive API connections and an optional handler budget (--max-handlers) scheduled fairly
+- Machine-wide handler slots shared by every ws-client on the host (flock'd slot files, see `joan slots`)
+- Load-aware admission: dispatches wait while load average, MemAvailable or PSI pressure is past its watermark
+- Per-worker resource envelopes: nice, ionice, RLIMIT_AS and an optional per-handler cgroup v2 (cpu.max, memory.max)
+- Per-handler CPU, peak RSS and I/O accounting in worker_session metrics; live handlers for `joan top`
+- Optional priority preemption (settings.preemptFor): SIGSTOP the lowest-priority handler for urgent work
 - JWT-based authentication (shared with joan-mcp)
 
 Usage:
-    ./ws-client.py [--project-dir DIR] [--api-url URL]
+    ./ws-client.py [--project-dir DIR ...] [--manifest FILE] [--max-handlers N]
+                   [--api-url URL] [--record FILE] [--metrics ADDR]
 
 Environment variables (client config):
     JOAN_API_URL          - Joan API URL (default: https://joan-api.alexbbenson.workers.dev)
@@ -28,11 +48,17 @@ Environment variables (client config):
     JOAN_WORKFLOW_MODE    - Workflow mode: standard or yolo (default: standard)
     JOAN_AUTH_TOKEN       - JWT auth token (optional, falls back to joan-mcp credentials)
     JOAN_WEBSOCKET_DEBUG  - Set to "1" for debug logging
+    JOAN_WS_RECORD        - Record raw inbound WebSocket messages to this .jsonl.gz file (same as --record)
+    JOAN_WS_METRICS       - Serve Prometheus metrics at PORT, HOST:PORT or unix:PATH (same as --metrics)
+    JOAN_SLOTS_DIR        - Machine-wide handler slot directory (default: ~/.joan-agents/slots)
+    JOAN_HOST_MAX_HANDLERS - Machine-wide handler cap, overriding slots.json (default: off without slots.json; 0 disables)
 
 Environment variables (passed to handlers - Phase 3):
-    JOAN_PROJECT_ID       - Project ID for result submission
-    JOAN_TASK_ID          - Task ID for result submission
-    JOAN_SMART_PAYLOAD    - JSON string with pre-fetched task data
+    JOAN_PROJECT_ID         - Project ID for result submission
+    JOAN_TASK_ID            - Task ID for result submission
+    JOAN_SMART_PAYLOAD_FILE - Path to JSON file with pre-fetched task data
+                              (.claude/payloads/<sha256>.json, removed when the handler exits)
+    JOAN_RESULT_MARKER      - File submit-result.py writes once the handler's result is accepted
 
 Authentication:
     Token is loaded in this order:
@@ -44,19 +70,36 @@ Authentication:
 
 import argparse
 import asyncio
+import atexit
+import contextvars
+import copy
+import ctypes
+import fcntl
+import gzip
 import hashlib
+import http.client
+import io
 import json
 import os
+import platform
+import queue
+import re
+import resource
+import shutil
 import signal
 import subprocess
 import sys
 import threading
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
-from datetime import datetime
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from types import MappingProxyType
+from typing import Awaitable, Callable, Mapping, Optional
 
 try:
     import websockets
@@ -79,6 +122,57 @@ except ImportError:
 # joan-mcp credential file location
 JOAN_MCP_CREDENTIALS = Path.home() / '.joan-mcp' / 'credentials.json'
 
+# Seconds a dispatched (task, handler, mode) suppresses identical dispatches
+DEFAULT_DEDUP_TTL_SECONDS = 300
+
+# Seconds a shutdown waits for running handlers before terminating them
+DEFAULT_DRAIN_SECONDS = 300
+
+# Default concurrent handler slots per worker type (dev defaults to agents.devs.count)
+DEFAULT_HANDLER_CONCURRENCY = {
+    "ba": 2,
+    "architect": 1,
+    "dev": 1,
+    "reviewer": 1,
+    "ops": 1,
+}
+
+# Default handler timeouts in minutes (settings.workerTimeouts)
+DEFAULT_WORKER_TIMEOUTS = {
+    "ba": 10,
+    "architect": 20,
+    "dev": 60,
+    "reviewer": 20,
+    "ops": 15,
+}
+
+# Model of each worker when neither settings.models nor settings.model names one, as the dispatch
+# handlers resolve it (other workers run opus); recorded in worker_session events
+DEFAULT_WORKER_MODELS = {
+    "ba": "haiku",
+    "ops": "haiku",
+}
+
+# Default resource envelope per worker type (settings.handlerResources, see Handler Resource Envelopes).
+# Without an ioClass the kernel derives the best-effort I/O level from nice: ops/reviewer 4, dev 5, others 6.
+DEFAULT_HANDLER_RESOURCES = {
+    "ops": {"nice": 0},
+    "reviewer": {"nice": 0},
+    "dev": {"nice": 5},
+    "architect": {"nice": 10},
+    "ba": {"nice": 10},
+}
+
+# Host load watermarks above which dispatches are deferred, once settings.loadAdmission enables
+# admission (true, or an object overriding some of these; 0 turns one off)
+DEFAULT_LOAD_ADMISSION = {
+    "maxLoadPerCpu": 2.0,          # 1-minute load average per CPU
+    "minMemAvailablePercent": 10,  # MemAvailable as a percentage of MemTotal
+    "maxCpuPressure": 0,           # PSI cpu "some" avg10, percent
+    "maxMemoryPressure": 20,       # PSI memory "some" avg10, percent
+    "resumeRatio": 0.8,            # once deferring, resume only within this fraction of every watermark
+}
+
 
 def get_machine_key() -> bytes:
     """
@@ -176,6 +270,36 @@ def get_auth_token() -> Optional[str]:
     return None
 
 
+def load_manifest(path: Path) -> tuple:
+    """Read a multi-project manifest. Returns ([(project dir, options)], handler budget).
+
+    The manifest is a JSON list of project directories, or an object:
+
+        {"maxConcurrentHandlers": 6,
+         "projects": ["~/src/app", {"dir": "../api", "mode": "yolo"}]}
+
+    Relative directories are resolved against the manifest's own directory.
+    """
+    data = json.loads(path.read_text())
+    budget = None
+    if isinstance(data, dict):
+        if data.get('maxConcurrentHandlers'):
+            budget = max(1, int(data['maxConcurrentHandlers']))
+        data = data.get('projects', [])
+    if not isinstance(data, list):
+        raise ValueError("expected a list of projects")
+    entries = []
+    for item in data:
+        options = dict(item) if isinstance(item, dict) else {}
+        project_dir = options.pop('dir', None) if options else item
+        if not isinstance(project_dir, str) or not project_dir:
+            raise ValueError(f"project entry without a directory: {item!r}")
+        if options.get('mode') not in (None, 'standard', 'yolo'):
+            raise ValueError(f"invalid mode {options['mode']!r} for {project_dir}")
+        entries.append((path.parent / Path(project_dir).expanduser(), options))
+    return entries, budget
+
+
 class WebSocketConfig:
     """Configuration for the WebSocket client."""
 
@@ -185,37 +309,100 @@ class WebSocketConfig:
         self.mode = os.environ.get('JOAN_WORKFLOW_MODE', 'standard')
         self.auth_token = get_auth_token() or ''
         self.debug = os.environ.get('JOAN_WEBSOCKET_DEBUG', '') == '1'
+        self.record_file: Optional[Path] = Path(os.environ['JOAN_WS_RECORD']) if os.environ.get('JOAN_WS_RECORD') else None
+        self.metrics_address: Optional[str] = os.environ.get('JOAN_WS_METRICS') or None
 
-        # Paths
-        self.log_dir = self.project_dir / '.claude' / 'logs'
-        self.log_file = self.log_dir / 'websocket-client.log'
-        self.config_file = self.project_dir / '.joan-agents.json'
+        self.set_project_dir(self.project_dir)
+
+        # Further projects served by this process (--project-dir repeated, --manifest)
+        self.additional_projects: list = []  # (project dir, {"mode": ...})
+        self.handler_budget: Optional[int] = None  # handler limit across all projects
 
         # Project config (loaded from .joan-agents.json)
         self.project_id: Optional[str] = None
         self.project_name: Optional[str] = None
+        self.handler_concurrency: dict = dict(DEFAULT_HANDLER_CONCURRENCY)
+        self.max_concurrent_handlers: Optional[int] = None
+        self.dedup_ttl_seconds: int = DEFAULT_DEDUP_TTL_SECONDS
+        self.worker_timeouts: dict = dict(DEFAULT_WORKER_TIMEOUTS)
+        self.drain_seconds: int = DEFAULT_DRAIN_SECONDS
+        self.load_admission: Optional[dict] = None  # watermarks, if settings.loadAdmission enables admission
+        self.handler_resources: dict = {w: dict(r) for w, r in DEFAULT_HANDLER_RESOURCES.items()}
+        self.handler_cgroup: Optional[Path] = None
+        self.preempt_for: frozenset = frozenset()  # worker types that may pause lower-priority handlers
+        self.worker_models: dict = {}  # settings.models
+        self.default_model: Optional[str] = None  # settings.model
+
+    def set_project_dir(self, project_dir: Path):
+        """Point the client at a project directory (and its log, cursor and journal paths)."""
+        self.project_dir = Path(project_dir)
+        self.log_dir = self.project_dir / '.claude' / 'logs'
+        self.log_file = self.log_dir / 'websocket-client.log'
+        self.metrics_file = self.log_dir / 'agent-metrics.jsonl'
+        self.config_file = self.project_dir / '.joan-agents.json'
+        self.cursor_file = self.project_dir / '.claude' / 'ws-event-cursor.json'
+        self.journal_file = self.project_dir / '.claude' / 'ws-handlers.jsonl'
+        self.usage_file = self.project_dir / '.claude' / 'ws-handlers-usage.json'
+
+    def copy_for(self, project_dir: Path, mode: Optional[str] = None) -> 'WebSocketConfig':
+        """A configuration for another project, sharing this one's API URL, token and options."""
+        other = copy.copy(self)
+        other.set_project_dir(project_dir)
+        other.additional_projects = []
+        if mode:
+            other.mode = mode
+        return other
 
     def parse_args(self, args: list):
         """Parse command line arguments."""
         parser = argparse.ArgumentParser(description='Joan WebSocket Client')
-        parser.add_argument('--project-dir', type=str, help='Project directory')
+        parser.add_argument('--project-dir', type=str, action='append',
+                            help='Project directory (repeat to serve several projects from one process)')
+        parser.add_argument('--manifest', type=str, metavar='FILE',
+                            help='JSON manifest of project directories to serve (see load_manifest)')
+        parser.add_argument('--max-handlers', type=int, metavar='N',
+                            help='Concurrent handler budget shared by all projects')
         parser.add_argument('--api-url', type=str, help='Joan API URL')
         parser.add_argument('--mode', type=str, choices=['standard', 'yolo'], help='Workflow mode')
         parser.add_argument('--token', type=str, help='JWT auth token')
+        parser.add_argument('--record', type=str, metavar='FILE',
+                            help='Record raw inbound WebSocket messages to a gzipped JSONL capture')
+        parser.add_argument('--metrics', type=str, metavar='ADDR',
+                            help='Serve Prometheus metrics on /metrics at PORT (localhost), HOST:PORT or unix:PATH')
 
         parsed = parser.parse_args(args)
 
-        if parsed.project_dir:
-            self.project_dir = Path(parsed.project_dir)
-            self.log_dir = self.project_dir / '.claude' / 'logs'
-            self.log_file = self.log_dir / 'websocket-client.log'
-            self.config_file = self.project_dir / '.joan-agents.json'
         if parsed.api_url:
             self.api_url = parsed.api_url
         if parsed.mode:
             self.mode = parsed.mode
         if parsed.token:
             self.auth_token = parsed.token
+        if parsed.record:
+            self.record_file = Path(parsed.record)
+        if parsed.metrics:
+            self.metrics_address = parsed.metrics
+
+        # Projects: --project-dir values first, then the manifest's (a manifest mode beats --mode)
+        entries = [(Path(d), {}) for d in parsed.project_dir or []]
+        if parsed.manifest:
+            try:
+                manifest_entries, self.handler_budget = load_manifest(Path(parsed.manifest))
+            except (OSError, ValueError) as e:
+                parser.error(f"invalid manifest {parsed.manifest}: {e}")
+            entries += manifest_entries
+        if parsed.max_handlers:
+            self.handler_budget = max(1, parsed.max_handlers)
+        unique, seen = [], set()
+        for project_dir, options in entries:
+            if project_dir.resolve() not in seen:
+                seen.add(project_dir.resolve())
+                unique.append((project_dir, options))
+        if unique:
+            (project_dir, options), self.additional_projects = unique[0], unique[1:]
+            self.set_project_dir(project_dir)
+            if options.get('mode'):
+                self.mode = options['mode']
 
     def load_project_config(self):
         """Load project configuration from .joan-agents.json."""
@@ -236,112 +423,2930 @@ class WebSocketConfig:
         if settings.get('mode'):
             self.mode = settings['mode']
 
+        # Handler concurrency: explicit settings win, dev falls back to devs.count
+        concurrency = dict(DEFAULT_HANDLER_CONCURRENCY)
+        dev_count = data.get('agents', {}).get('devs', {}).get('count')
+        if dev_count:
+            concurrency['dev'] = int(dev_count)
+        for worker, slots in settings.get('handlerConcurrency', {}).items():
+            concurrency[worker] = max(1, int(slots))
+        self.handler_concurrency = concurrency
+        # Every setting is reset to its default first, so removing one on a reload takes effect
+        self.max_concurrent_handlers = (max(1, int(settings['maxConcurrentHandlers']))
+                                        if settings.get('maxConcurrentHandlers') else None)
+        self.dedup_ttl_seconds = (max(0, int(settings['dispatchDedupSeconds']))
+                                  if 'dispatchDedupSeconds' in settings else DEFAULT_DEDUP_TTL_SECONDS)
+        timeouts = dict(DEFAULT_WORKER_TIMEOUTS)
+        for worker, minutes in settings.get('workerTimeouts', {}).items():
+            timeouts[worker] = max(1, int(minutes))
+        self.worker_timeouts = timeouts
+        self.drain_seconds = (max(0, int(settings['shutdownDrainSeconds']))
+                              if 'shutdownDrainSeconds' in settings else DEFAULT_DRAIN_SECONDS)
+        admission = settings.get('loadAdmission', False)
+        if admission is False or admission is None:
+            self.load_admission = None  # off unless the project opts in
+        elif admission is True or isinstance(admission, dict):
+            admission = {} if admission is True else admission
+            self.load_admission = {**DEFAULT_LOAD_ADMISSION,
+                                   **{k: float(v) for k, v in admission.items() if k in DEFAULT_LOAD_ADMISSION}}
+            if any(v < 0 for v in self.load_admission.values()):
+                raise ValueError(f"loadAdmission: watermarks must not be negative: {admission!r}")
+            if not 0 < self.load_admission['resumeRatio'] <= 1:
+                raise ValueError(f"loadAdmission: resumeRatio must be in (0, 1]: {admission['resumeRatio']!r}")
+        else:
+            raise ValueError(f"loadAdmission must be true, false or an object: {admission!r}")
+        resources = {w: dict(r) for w, r in DEFAULT_HANDLER_RESOURCES.items()}
+        overrides_by_worker = settings.get('handlerResources', {})
+        if not isinstance(overrides_by_worker, dict) or not all(isinstance(o, dict) for o in overrides_by_worker.values()):
+            raise ValueError(f"handlerResources must map worker types to objects: {overrides_by_worker!r}")
+        for worker, overrides in overrides_by_worker.items():
+            resources[worker] = {**resources.get(worker, {}), **overrides}
+        for worker, envelope in resources.items():
+            HandlerEnvelope(envelope, None)  # raises ValueError on a bad setting
+        self.handler_resources = resources
+        self.handler_cgroup = Path(settings['handlerCgroup']).expanduser() if settings.get('handlerCgroup') else None
+        if not isinstance(settings.get('preemptFor') or [], list):
+            raise ValueError(f"preemptFor must be a list of worker types: {settings['preemptFor']!r}")
+        self.preempt_for = frozenset(settings.get('preemptFor') or ())
+        for worker in self.preempt_for:
+            if worker not in STAGE_PRIORITY:
+                raise ValueError(f"preemptFor: unknown worker type {worker!r}")
+        self.worker_models = dict(settings.get('models') or {})
+        self.default_model = settings.get('model') or None
+
+    def worker_model(self, worker: str) -> str:
+        """The model a worker's handlers run (resolved like the dispatch handlers do)."""
+        return self.worker_models.get(worker) or self.default_model or DEFAULT_WORKER_MODELS.get(worker, "opus")
+
+
+# =============================================================================
+# Projects
+# One process can serve several projects (--project-dir repeated, or
+# --manifest), each with its own WebSocket connection on the shared event
+# loop. Per-project state - configuration, log files, event cursor, handler
+# journal, payload spool, dedup cache, handler environment - lives on a
+# Project. The module-level names for that state (config, dispatch_dedup,
+# event_cursor, ...) are ProjectLocals that resolve to the current project:
+# every task started for a project runs with it set in a ContextVar, and
+# asyncio tasks, call_soon callbacks and to_thread calls inherit it. The
+# scheduler, supervisor, HTTP connections, loop lag probe and metrics
+# endpoint are shared.
+# =============================================================================
+
+current_project: contextvars.ContextVar = contextvars.ContextVar('current_project', default=None)
+
+
+class Project:
+    """A project served by this process, and its per-project state."""
+
+    def __init__(self, project_config: WebSocketConfig):
+        self.config = project_config
+        self._state = {}  # ProjectLocal name -> instance, created on first use
+
+    @property
+    def label(self) -> str:
+        return self.config.project_name or self.config.project_dir.resolve().name
+
+    def local(self, name: str, factory):
+        if name not in self._state:
+            self._state[name] = self.run(factory)
+        return self._state[name]
+
+    def run(self, fn, *args):
+        """Call fn(*args) with this project as the current project."""
+        context = contextvars.copy_context()
+        context.run(current_project.set, self)
+        return context.run(fn, *args)
+
+    def create_task(self, coro) -> asyncio.Task:
+        """Run a coroutine as a task of this project (see HandlerSupervisor.create_task)."""
+        return self.run(supervisor.create_task, coro)
+
+    def close(self):
+        """Flush and stop this project's background writers."""
+        for name in ('ws_capture', 'handler_journal', 'metrics_writer', 'log_writer'):
+            if name in self._state:
+                self._state[name].close()
+
+
+# Every project served; the first is the one used outside any project's tasks
+projects = [Project(WebSocketConfig())]
+
+
+def active_project() -> Project:
+    return current_project.get() or projects[0]
+
+
+class ProjectLocal:
+    """Module-level name for a piece of per-project state, forwarding to the current project's."""
+
+    def __init__(self, name: str, factory=None):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_factory', factory)  # None: a Project attribute
+
+    def for_project(self, project: Project):
+        if self._factory is None:
+            return getattr(project, self._name)
+        return project.local(self._name, self._factory)
+
+    def __getattr__(self, attr):
+        return getattr(self.for_project(active_project()), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.for_project(active_project()), attr, value)
+
+
+def close_projects():
+    for project in projects:
+        project.close()
+    console_writer.close()
+
+
+atexit.register(close_projects)
+
+
+# The current project's configuration
+config = ProjectLocal('config')
+
+# Shutdown events: the first signal drains running handlers, a second forces termination
+shutdown_event = asyncio.Event()
+force_shutdown_event = asyncio.Event()
+
+
+class LogWriter:
+    """Single background writer for an append-only log file.
+
+    Used for the console, websocket-client.log, agent-metrics.jsonl, the
+    handler journal and WebSocket captures (opened with gzip_append).
+    Writers only enqueue lines on a SimpleQueue; one daemon thread drains it,
+    batching lines into a single write on a long-lived append handle. A batch
+    is written once it reaches FLUSH_LINES or `flush_interval` seconds after
+    its first line, whichever comes first. One queue and one consumer keep
+    lines in the order they were logged. Rewrites (compaction) go through the
+    same queue, so they never race the append handle.
+    """
+
+    FLUSH_LINES = 256
+    FLUSH_INTERVAL = 0.5  # seconds
+    _STOP = object()
+
+    class _Rewrite:
+        def __init__(self, lines: list):
+            self.lines = lines
+
+    def __init__(self, path_fn, opener=open, flush_interval: float = FLUSH_INTERVAL, echo: bool = False):
+        self._path_fn = path_fn  # resolved per batch (config paths are set after import); None: console only
+        self._context = contextvars.copy_context()  # path_fn sees the project the writer belongs to
+        self._opener = opener
+        self._flush_interval = flush_interval
+        self._echo = echo  # also write batches to stdout
+        self._queue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._path: Optional[Path] = None
+
+    def write(self, line: str):
+        """Queue a line for the log file (never blocks on disk I/O)."""
+        if self._thread is None:
+            self._start()
+        self._queue.put(line)
+
+    def rewrite(self, lines: list):
+        """Queue replacing the file with `lines` (temp file + rename).
+
+        `lines` is a snapshot that supersedes lines queued before it and not
+        written yet; they are dropped. The append handle is reopened on the
+        new file.
+        """
+        if self._thread is None:
+            self._start()
+        self._queue.put(self._Rewrite(lines))
+
+    def close(self):
+        """Flush every queued line and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        thread.join(timeout=5)
+        self._thread = None
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._context.run, args=(self._run,),
+                                                name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            rewrite = None
+            item = self._queue.get()
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                if item is self._STOP:
+                    stop = True
+                    break
+                if isinstance(item, self._Rewrite):
+                    rewrite = item
+                    break
+                batch.append(item)
+                if len(batch) >= self.FLUSH_LINES:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if stop:
+                # Drain anything queued behind the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, str):
+                        batch.append(item)
+            if rewrite:
+                self._rewrite(rewrite.lines)
+            else:
+                self._flush(batch)
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _flush(self, batch: list):
+        if not batch:
+            return
+        if self._echo:
+            try:
+                sys.stdout.write('\n'.join(batch) + '\n')
+                sys.stdout.flush()
+            except (OSError, ValueError):
+                pass  # console gone (closed pipe/terminal); the file still gets the lines
+        try:
+            path = self._path_fn()
+            if path is None:
+                return
+            if self._file is None or self._path != path:
+                if self._file:
+                    self._file.close()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._path = path
+                self._file = self._opener(self._path, 'a')
+            self._file.write('\n'.join(batch) + '\n')
+            self._file.flush()
+        except Exception as e:
+            self._file = None
+            print(f"[{datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}] [ERROR] Failed to write {self._path_fn().name}: {e}")
+
+    def _rewrite(self, lines: list):
+        if self._file:
+            self._file.close()
+            self._file = None  # the next batch appends to the replacement
+        try:
+            path = self._path_fn()
+            if path is None:
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            with self._opener(tmp, 'w') as f:
+                f.write(''.join(line + '\n' for line in lines))
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}] [ERROR] Failed to rewrite {self._path_fn().name}: {e}")
+
+
+def gzip_append(path: Path, mode: str):
+    """Open a gzip file for appending text; every flush is a sync point, so a crash loses nothing flushed."""
+    return gzip.open(path, mode + 't', encoding='utf-8')
+
+
+console_writer = LogWriter(lambda: None, echo=True)
+log_writer = ProjectLocal('log_writer', lambda: LogWriter(lambda: config.log_file))
+metrics_writer = ProjectLocal('metrics_writer', lambda: LogWriter(lambda: config.metrics_file))
+
+
+def log(message: str, level: str = "INFO"):
+    """Write log entry with timestamp.
+
+    Goes to the current project's log. Outside any project's tasks, with
+    several projects served, it goes to every project's log.
+    """
+    now = datetime.now()
+    iso_timestamp = now.strftime('%Y-%m-%dT%H:%M:%S') or now.isoformat()
+
+    log_line = f"[{iso_timestamp}] [{level}] {message}"
+
+    # Console and file output (batched by background writers, off the event loop)
+    project = current_project.get()
+    if len(projects) > 1 and project:
+        console_writer.write(f"[{iso_timestamp}] [{level}] [{project.label}] {message}")
+    else:
+        console_writer.write(log_line)
+    for target in [project] if project else projects:
+        log_writer.for_project(target).write(log_line)
+
+
+def log_debug(message: str):
+    """Write debug log entry (only if debug mode enabled)."""
+    if config.debug:
+        log(message, "DEBUG")
+
+
+def record_metric(event: str, **fields):
+    """Append an event to agent-metrics.jsonl (same shape as the router's worker_session events).
+
+    Like log(), a process-wide event goes to every project's file.
+    """
+    project = current_project.get()
+    timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    for target in [project] if project else projects:
+        metrics_writer.for_project(target).write(json.dumps({
+            "timestamp": timestamp,
+            "event": event,
+            "project": target.config.project_name,
+            **fields,
+        }))
+
+
+def rotate_log():
+    """Rotate existing log file on startup so each session gets a clean log."""
+    if not config.log_file.exists() or config.log_file.stat().st_size == 0:
+        return
+
+    mtime = datetime.fromtimestamp(config.log_file.stat().st_mtime)
+    stamp = mtime.strftime('%Y%m%d-%H%M%S')
+    rotated = config.log_dir / f'websocket-client.{stamp}.log'
+
+    # Avoid overwriting if multiple restarts in the same second
+    counter = 1
+    while rotated.exists():
+        rotated = config.log_dir / f'websocket-client.{stamp}-{counter}.log'
+        counter += 1
+
+    config.log_file.rename(rotated)
+
+
+# =============================================================================
+# Prometheus Metrics
+# Counters and histograms kept in memory for the optional /metrics endpoint
+# (see Metrics Endpoint). Everything runs on the event loop thread, so
+# updates are plain dict operations. Gauges for live state (queue depth,
+# running handlers, loop lag) are read from the scheduler, supervisor and
+# lag probe when the endpoint is scraped.
+# =============================================================================
+
+# Handler duration histogram buckets (seconds)
+HANDLER_DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+def _metric_value(value) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _metric_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricFamily:
+    """A Prometheus counter or gauge: one value per combination of label values."""
+
+    def __init__(self, name: str, kind: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = labels
+        self.values = {}  # label values -> number
+        if not labels and kind != "histogram":
+            self.values[()] = 0  # exported from the start, not only after the first update
+
+    def _key(self, labels: dict) -> tuple:
+        if 'project' in self.labels and 'project' not in labels:
+            labels['project'] = active_project().label
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def clear(self):
+        self.values.clear()
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_metric_labels(self.labels, key)} {_metric_value(value)}")
+        return lines
+
+
+class HistogramFamily(MetricFamily):
+    """A Prometheus histogram: cumulative bucket counts, sum and count per label combination."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        super().__init__(name, "histogram", help_text, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[key] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_metric_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_metric_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_metric_labels(self.labels, key)} {_metric_value(round(total, 3))}")
+            lines.append(f"{self.name}_count{_metric_labels(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+class ClientMetrics:
+    """Every metric ws-client exports, in exposition order.
+
+    Per-project metrics carry a `project` label, filled in from the current
+    project when the caller does not pass one.
+    """
+
+    def __init__(self):
+        self.events_received = MetricFamily(
+            "joan_ws_events_received_total", "counter",
+            "WebSocket events received, by event type", ("project", "event_type"))
+        self.dispatches = MetricFamily(
+            "joan_ws_dispatches_total", "counter",
+            "Handler dispatches accepted (queued for a slot), by handler", ("project", "handler"))
+        self.dispatches_suppressed = MetricFamily(
+            "joan_ws_dispatches_suppressed_total", "counter",
+            "Duplicate or stale dispatches suppressed", ("project", "reason"))
+        self.handlers_started = MetricFamily(
+            "joan_ws_handlers_started_total", "counter",
+            "Handler processes started, by handler", ("project", "handler"))
+        self.handler_duration = HistogramFamily(
+            "joan_ws_handler_duration_seconds",
+            "Handler run time, by handler and outcome (success, failure, timeout, terminated, unknown)",
+            ("project", "handler", "outcome"), HANDLER_DURATION_BUCKETS)
+        self.handler_cpu_seconds = MetricFamily(
+            "joan_ws_handler_cpu_seconds_total", "counter",
+            "CPU seconds used by exited handlers and their children, by handler", ("project", "handler"))
+        self.handler_io_bytes = MetricFamily(
+            "joan_ws_handler_io_bytes_total", "counter",
+            "Storage bytes read and written by exited handlers and their children", ("project", "handler", "direction"))
+        self.preemptions = MetricFamily(
+            "joan_ws_preemptions_total", "counter",
+            "Handlers paused so an urgent handler could start, by paused handler", ("project", "handler"))
+        self.handler_paused_seconds = MetricFamily(
+            "joan_ws_handler_paused_seconds_total", "counter",
+            "Seconds handlers spent paused by preemption (not part of their duration)", ("project", "handler"))
+        self.payload_original_bytes = MetricFamily(
+            "joan_ws_payload_original_bytes_total", "counter",
+            "Smart payload bytes received for started handlers, before projection", ("project", "handler"))
+        self.payload_projected_bytes = MetricFamily(
+            "joan_ws_payload_projected_bytes_total", "counter",
+            "Smart payload bytes handed to started handlers, after projection", ("project", "handler"))
+        self.reconnects = MetricFamily(
+            "joan_ws_reconnects_total", "counter",
+            "WebSocket reconnections after the first connect", ("project",))
+        self.connected = MetricFamily(
+            "joan_ws_connected", "gauge",
+            "1 while the WebSocket is connected", ("project",))
+        self.queue_depth = MetricFamily(
+            "joan_ws_queue_depth", "gauge",
+            "Dispatches waiting for a handler slot, by worker type", ("project", "worker"))
+        self.followups = MetricFamily(
+            "joan_ws_followups", "gauge",
+            "Dispatches held until their task's running handler exits", ("project",))
+        self.running = MetricFamily(
+            "joan_ws_handlers_running", "gauge",
+            "Handlers holding a slot, by worker type", ("project", "worker"))
+        self.slots = MetricFamily(
+            "joan_ws_handler_slots", "gauge",
+            "Concurrent handler slots, by worker type", ("project", "worker"))
+        self.budget = MetricFamily(
+            "joan_ws_handler_budget", "gauge",
+            "Concurrent handlers allowed across all projects (0: no shared budget)")
+        self.host_load = MetricFamily(
+            "joan_ws_host_load", "gauge",
+            "Host load signals checked before dispatch (load_per_cpu, mem_available_percent, cpu_pressure, "
+            "memory_pressure)", ("signal",))
+        self.admission_deferred = MetricFamily(
+            "joan_ws_admission_deferred", "gauge",
+            "1 while the project's dispatches are deferred for host load", ("project",))
+        self.loop_lag = MetricFamily(
+            "joan_ws_event_loop_lag_seconds", "gauge",
+            "Event loop scheduling delay over the last minute", ("quantile",))
+        self.start_time = MetricFamily(
+            "process_start_time_seconds", "gauge",
+            "Start time of the ws-client process since the Unix epoch")
+        self.start_time.set(round(time.time(), 3))
+
+    def families(self) -> list:
+        return [value for value in vars(self).values() if isinstance(value, MetricFamily)]
+
+
+client_metrics = ClientMetrics()
+
+
+# =============================================================================
+# Joan API Requests
+# REST calls (actionable-tasks, worker-result) reuse keep-alive connections
+# from one pool per API host, shared by every project, instead of opening a
+# new TCP+TLS connection per request. Requests run in worker threads and a
+# connection serves one request at a time. When an HTTP(S) proxy is
+# configured the call goes through urllib instead, which honours it.
+# =============================================================================
+
+# Idle keep-alive connections kept per API host
+API_POOL_SIZE = 4
+
+# Seconds before an API request times out
+API_TIMEOUT = 30
+
+
+class ApiConnectionPool:
+    """Keep-alive HTTP(S) connections to the Joan API."""
+
+    def __init__(self):
+        self._idle = defaultdict(list)  # (scheme, netloc) -> idle connections
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, headers: dict, body: Optional[bytes] = None,
+                timeout: float = API_TIMEOUT) -> bytes:
+        """Send a request and return the response body. HTTP errors raise urllib.error.HTTPError."""
+        parts = urllib.parse.urlsplit(url)
+        if urllib.request.getproxies().get(parts.scheme) and not urllib.request.proxy_bypass(parts.hostname or ''):
+            req = urllib.request.Request(url, data=body, method=method, headers=headers)
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return resp.read()
+
+        key = (parts.scheme, parts.netloc)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(2):
+            conn, reused = self._checkout(key, timeout)
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue  # the server dropped an idle connection; retry on a new one
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            if response.status >= 400:
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers,
+                                             io.BytesIO(data))
+            return data
+
+    def _checkout(self, key: tuple, timeout: float) -> tuple:
+        with self._lock:
+            idle = self._idle[key]
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, netloc = key
+        factory = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return factory(netloc, timeout=timeout), False
+
+    def _checkin(self, key: tuple, conn: http.client.HTTPConnection):
+        with self._lock:
+            if len(self._idle[key]) < API_POOL_SIZE:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
+
+
+api_pool = ApiConnectionPool()
+
+
+def api_headers() -> dict:
+    return {
+        'Authorization': f'Bearer {config.auth_token}',
+        'Content-Type': 'application/json',
+        'User-Agent': 'joan-agents-websocket-client/1.0',
+    }
+
+
+# =============================================================================
+# Payload Projection
+# Each handler receives only the fields it actually uses, fitted to a token
+# budget. Fields are added in priority order: task metadata, tags,
+# handoff_context and rework feedback always go in. After that come the
+# description (truncated to what is left), subtasks, columns and the most
+# recent comments. Handlers already handle missing fields gracefully.
+# Architect and dev work from the full spec: their description is never cut,
+# and only the optional fields after it are fitted to the budget.
+# =============================================================================
+
+# Rough token estimate for JSON payload text
+CHARS_PER_TOKEN = 4
+
+# Descriptions keep at least this much even when the mandatory fields use up the budget
+DESCRIPTION_MIN_CHARS = 200
+
+# Projection is CPU-bound and holds the GIL. A single worker runs a burst of
+# dispatches one after another instead of letting them starve the event loop.
+# Payload spool writes and removals share it, so they happen in call order.
+payload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="payload")
+
+HANDLER_PAYLOAD_PROFILES = {
+    "handle-ba":        {"token_budget": 1500, "full_description": False, "comments_max": 3,
+                         "subtasks": False, "rework": False, "columns": False},
+    "handle-architect": {"token_budget": 8000, "full_description": True,  "comments_max": 5,
+                         "subtasks": True,  "rework": False, "columns": True},
+    "handle-dev":       {"token_budget": 8000, "full_description": True,  "comments_max": 0,
+                         "subtasks": True,  "rework": True,  "columns": False},
+    "handle-reviewer":  {"token_budget": 2500, "full_description": False, "comments_max": 3,
+                         "subtasks": True,  "rework": False, "columns": False},
+    "handle-ops":       {"token_budget": 1000, "full_description": False, "comments_max": 0,
+                         "subtasks": False, "rework": False, "columns": False},
+}
+
+
+def estimate_tokens(chars: int) -> int:
+    """Estimate the token cost of `chars` characters of JSON."""
+    return -(-chars // CHARS_PER_TOKEN)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def _utf8_len(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+
+class PayloadProjection:
+    """A handler's view of a smart payload, serialized once."""
+
+    def __init__(self, payload: dict, text: str, original_chars: int, original_bytes: int,
+                 budget: Optional[int], dropped: list):
+        self.payload = payload
+        self.data = text.encode('utf-8')
+        self.tokens = estimate_tokens(len(text))
+        self.original_tokens = estimate_tokens(original_chars)
+        self.original_bytes = original_bytes
+        self.budget = budget
+        self.dropped = dropped  # fields left out or cut to fit the budget
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+def project_payload_for_handler(handler: str, smart_payload: dict) -> Optional[PayloadProjection]:
+    """Fit a smart payload into the handler's token budget.
+
+    Every top-level value, task field, subtask and comment is serialized once.
+    The output JSON is assembled from those pieces, so sizes are known as the
+    projection grows and the result is never re-serialized to measure it.
+    """
+    if not smart_payload:
+        return None
+    profile = HANDLER_PAYLOAD_PROFILES.get(handler)
+    if not profile:
+        text = _dumps(smart_payload)
+        return PayloadProjection(smart_payload, text, len(text), _utf8_len(text), None, [])
+
+    budget = profile["token_budget"] * CHARS_PER_TOKEN
+    payload, members, dropped = {}, {}, []  # members: key -> serialized '"key":value'
+
+    def member(key: str, text: str) -> str:
+        return f'{_dumps(key)}:{text}'
+
+    def used(extra: int = 0) -> int:
+        return 1 + sum(len(m) + 1 for m in members.values()) + extra
+
+    def include(key: str, value, text: str):
+        payload[key] = value
+        members[key] = member(key, text)
+
+    def obj(field_texts: dict) -> str:
+        return '{' + ','.join(member(k, t) for k, t in field_texts.items()) + '}'
+
+    # Serialize each value once: whole, or piece by piece where it may be cut
+    texts, items = {}, {}
+    task = smart_payload.get("task")
+    description = task.get("description") if isinstance(task, dict) else None
+    if isinstance(task, dict):
+        task_fields = {k: _dumps(v) for k, v in task.items()}
+        texts["task"] = obj(task_fields)
+    for key in ("subtasks", "recent_comments"):
+        if isinstance(smart_payload.get(key), list):
+            items[key] = [_dumps(item) for item in smart_payload[key]]
+            texts[key] = '[' + ','.join(items[key]) + ']'
+    for key, value in smart_payload.items():
+        if key not in texts:
+            texts[key] = _dumps(value)
+    original_chars = 1 + sum(len(member(k, t)) + 1 for k, t in texts.items())
+    original_bytes = 1 + sum(_utf8_len(member(k, t)) + 1 for k, t in texts.items())
+
+    # Mandatory: task metadata, tags, handoff_context (bounded by ALS spec, max 3KB), rework feedback
+    if isinstance(description, str):
+        desc_text = task_fields.pop("description")
+        include("task", {k: v for k, v in task.items() if k != "description"}, obj(task_fields))
+    elif "task" in smart_payload:
+        include("task", task, texts["task"])
+    for key in ("tags", "handoff_context") + (("rework_feedback",) if profile["rework"] else ()):
+        if key in smart_payload:
+            include(key, smart_payload[key], texts[key])
+
+    # Description gets whatever budget the mandatory fields left (all of it for full_description)
+    if isinstance(description, str):
+        room = max(budget - used(len(member("description", "")) + 1), DESCRIPTION_MIN_CHARS)
+        if len(desc_text) > room and not profile["full_description"]:
+            marker = f"\n\n[truncated, {len(description)} total chars]"
+            marker_chars = len(_dumps(marker))
+            # Escaping never shortens text, so no more than `room` raw chars can fit
+            keep = min(len(description), room)
+            cut = description[:keep] + marker
+            cut_text = _dumps(cut)
+            while len(cut_text) > room and keep > 0:
+                # Scale by the escaped/raw ratio so escapes don't overshoot the room
+                keep = min(keep - 1, int(keep * (room - marker_chars) / len(cut_text)))
+                cut = description[:max(keep, 0)] + marker
+                cut_text = _dumps(cut)
+            dropped.append(f"description {len(description)}->{len(cut)} chars")
+            description, desc_text = cut, cut_text
+        payload["task"]["description"] = description
+        task_fields["description"] = desc_text
+        members["task"] = member("task", obj(task_fields))
+
+    # Optional fields in priority order, while they fit
+    def include_items(key: str, limit: Optional[int] = None):
+        considered = items[key][:limit]
+        total, kept = used(len(member(key, "[]")) + 1), 0
+        for text in considered:
+            total += len(text) + (1 if kept else 0)
+            if total > budget:
+                break
+            kept += 1
+        if kept:
+            include(key, smart_payload[key][:kept], '[' + ','.join(considered[:kept]) + ']')
+        if kept < len(considered):
+            dropped.append(f"{key} {kept}/{len(considered)}")
+
+    if profile["subtasks"] and "subtasks" in items:
+        include_items("subtasks")
+    if profile["columns"] and "columns" in smart_payload:
+        if used(len(member("columns", texts["columns"])) + 1) <= budget:
+            include("columns", smart_payload["columns"], texts["columns"])
+        else:
+            dropped.append("columns")
+    if profile["comments_max"] > 0 and "recent_comments" in items:
+        include_items("recent_comments", profile["comments_max"])
+
+    return PayloadProjection(payload, '{' + ','.join(members.values()) + '}', original_chars,
+                             original_bytes, profile["token_budget"], dropped)
+
+
+# =============================================================================
+# Dispatch Deduplication
+# The same task can reach a handler via startup dispatch, a smart event and a
+# legacy tag event within seconds of each other. A TTL cache keyed by
+# (task, handler, mode) suppresses the duplicates until the dispatched
+# handler exits (or dispatchDedupSeconds pass), and per-task event
+# timestamps drop stale events that arrive out of order. A new transition
+# after the handler has finished dispatches again; one that arrives while it
+# runs (a newer event of the same kind) goes to the scheduler, which holds it
+# as the task's follow-up.
+# =============================================================================
+
+def handler_mode(handler_args: list) -> str:
+    """Extract the --mode= value from handler args ('' if none)."""
+    for arg in handler_args or []:
+        if arg.startswith('--mode='):
+            return arg.split('=', 1)[1]
+    return ''
+
+
+def parse_event_time(value) -> Optional[float]:
+    """Parse an event timestamp (ISO-8601 or epoch s/ms) into epoch seconds."""
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return value / 1000 if value > 1e12 else float(value)
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+class DispatchDedup:
+    """TTL-bounded record of recent dispatches, used to suppress duplicates."""
+
+    def __init__(self):
+        self._entries = OrderedDict()       # (task, handler, mode) -> (monotonic, source, event epoch or None)
+        self._latest_event = OrderedDict()  # task_id -> (monotonic, newest event epoch)
+        self.suppressed = defaultdict(int)  # reason -> count
+
+    def admit(self, task_id: str, handler: str, mode: str, source: str,
+              event_time: Optional[float] = None) -> bool:
+        """Record a dispatch and return True, or log and return False if it is redundant."""
+        now = time.monotonic()
+        self._expire(now)
+        key = (task_id, handler, mode)
+
+        if event_time is not None and task_id in self._latest_event:
+            _, latest = self._latest_event[task_id]
+            if event_time < latest:
+                self._suppress("stale", key, source,
+                               f"event is {int(latest - event_time)}s older than last dispatched event")
+                return False
+
+        if key in self._entries:
+            first_at, first_source, first_time = self._entries[key]
+            # A newer event of the same kind is a new transition (e.g. another rework request
+            # while dev still runs): the scheduler holds it as the task's follow-up. Startup
+            # snapshots and a smart event's legacy tag echo (or vice versa) stay duplicates.
+            newer = (event_time is not None and first_time is not None and event_time > first_time
+                     and (source == "tag_added") == (first_source == "tag_added"))
+            if not newer:
+                self._suppress("duplicate", key, source,
+                               f"already dispatched via {first_source} {int(now - first_at)}s ago")
+                return False
+            del self._entries[key]  # re-recorded below, at the end of the recorded_at order
+
+        self._entries[key] = (now, source, event_time)
+        if event_time is not None:
+            _, latest = self._latest_event.pop(task_id, (now, event_time))
+            self._latest_event[task_id] = (now, max(latest, event_time))
+        return True
+
+    def forget(self, task_id: str, handler: str, mode: str):
+        """Allow an immediate redispatch (the handler exited, or its dispatch never ran)."""
+        self._entries.pop((task_id, handler, mode), None)
+
+    def total_suppressed(self) -> int:
+        return sum(self.suppressed.values())
+
+    def _suppress(self, reason: str, key: tuple, source: str, detail: str):
+        task_id, handler, mode = key
+        self.suppressed[reason] += 1
+        client_metrics.dispatches_suppressed.inc(reason=reason)
+        log(f"Suppressed {reason} dispatch: {handler} task={task_id[:8]} mode={mode or '-'} "
+            f"via {source} ({detail}; suppressed total: {self.total_suppressed()})")
+
+    def _expire(self, now: float):
+        ttl = config.dedup_ttl_seconds
+        # Both tables are in insertion order and keyed by (recorded_at, ...) values
+        for table in (self._entries, self._latest_event):
+            while table and now - next(iter(table.values()))[0] >= ttl:
+                table.popitem(last=False)
+
+
+dispatch_dedup = ProjectLocal('dispatch_dedup', DispatchDedup)
+
+
+# =============================================================================
+# Host Slots
+# Every ws-client on the machine draws handler slots from one pool before
+# spawning `claude`, so several clients cannot oversubscribe the host. A slot
+# is a file in JOAN_SLOTS_DIR (~/.joan-agents/slots) held with a non-blocking
+# flock. The kernel drops the lock when its holder exits, so a crashed client
+# never leaks slots. The holder's project, handler and task are written into
+# the file for `joan slots`.
+#
+# The pool size and per-project minimums come from slots.json next to the
+# slot files, shared by every client and reread when it changes:
+#
+#     {"maxHandlers": 24, "projectMinimums": {"<projectId or name>": 2}}
+#
+# A project's minimum is reserved for it (reserved-<key>-NN.lock); the rest
+# of maxHandlers is shared (slot-NN.lock). Projects use their reserved slots
+# first. Host slots are off unless slots.json exists or
+# JOAN_HOST_MAX_HANDLERS is set (it overrides the file); maxHandlers then
+# defaults to the CPU count, and 0 disables them again. Invalid values are
+# logged and replaced by their defaults.
+#
+# slots.json is checked in a worker thread every HOST_SLOTS_RELOAD_SECONDS,
+# so the scheduler only reads the loaded settings. Taking a slot stays on
+# the event loop: the scheduler needs the answer before it starts the
+# handler, and a non-blocking flock plus a pwrite of ~200 bytes to a local
+# file that is already open takes a few microseconds.
+# =============================================================================
+
+HOST_SLOTS_DIR = Path(os.environ.get('JOAN_SLOTS_DIR') or Path.home() / '.joan-agents' / 'slots')
+
+# Seconds between checks of slots.json for changes
+HOST_SLOTS_RELOAD_SECONDS = 2.0
+
+
+def host_slot_key(text: str) -> str:
+    """A project key usable in a slot file name."""
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', text).strip('-') or 'project'
+
+
+class HostSlot:
+    """A held slot file: the open descriptor carries the flock."""
+
+    def __init__(self, path: Path, fd: int):
+        self.path = path
+        self.fd = fd
+
+
+class HostSlots:
+    """Machine-wide handler slots shared by every ws-client (see Host Slots)."""
+
+    def __init__(self, slots_dir: Path = HOST_SLOTS_DIR):
+        self.slots_dir = slots_dir
+        self.config_file = slots_dir / 'slots.json'
+        self.max_handlers = 0            # off until slots.json or JOAN_HOST_MAX_HANDLERS sets a cap
+        self.minimums = {}               # project key -> reserved slots
+        self._config_mtime = -1          # slots.json mtime last loaded (None: no file)
+        self._failed = False             # slot dir unusable: host slots are off
+        self._fds = {}                   # slot file -> descriptor, opened once
+        self._held = {}                  # slot file -> HostSlot held by this process
+
+    def reload(self):
+        """Load slots.json and JOAN_HOST_MAX_HANDLERS if the file changed (blocking: call it off the loop)."""
+        try:
+            mtime = self.config_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+        data = None  # no slots.json
+        if mtime is not None:
+            try:
+                data = json.loads(self.config_file.read_text())
+                if not isinstance(data, dict):
+                    raise ValueError(f"expected a JSON object, not {type(data).__name__}")
+            except (OSError, ValueError) as e:
+                log(f"Ignoring invalid {self.config_file}: {e}", "WARN")
+                data = {}
+        # Off until slots.json or JOAN_HOST_MAX_HANDLERS asks for a machine-wide cap
+        max_handlers = 0 if data is None else os.cpu_count() or 1
+        if data and 'maxHandlers' in data:
+            max_handlers = self._count('maxHandlers', data['maxHandlers'], max_handlers)
+        if os.environ.get('JOAN_HOST_MAX_HANDLERS'):
+            max_handlers = self._count('JOAN_HOST_MAX_HANDLERS', os.environ['JOAN_HOST_MAX_HANDLERS'], max_handlers)
+        settings = (data or {}).get('projectMinimums') or {}
+        if not isinstance(settings, dict):
+            log(f"Host slots: ignoring projectMinimums, expected an object: {settings!r}", "WARN")
+            settings = {}
+        minimums = {}
+        for key, value in settings.items():
+            count = self._count(f"projectMinimums[{key!r}]", value, None)
+            if count is not None:
+                minimums[host_slot_key(str(key))] = count
+        reserved = sum(minimums.values())
+        if reserved > max_handlers:
+            log(f"Host slots: projectMinimums add up to {reserved}, more than maxHandlers "
+                f"({max_handlers}); the shared pool is empty", "WARN")
+        # Swapped in whole: the event loop reads them while this runs in a worker thread
+        self.max_handlers, self.minimums = max_handlers, minimums
+
+    async def watch(self):
+        """Reload slots.json in a worker thread every HOST_SLOTS_RELOAD_SECONDS (runs until cancelled)."""
+        while True:
+            await asyncio.sleep(HOST_SLOTS_RELOAD_SECONDS)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                log(f"Host slots: failed to reload {self.config_file}: {e}", "WARN")
+
+    @staticmethod
+    def _count(name: str, value, default):
+        """A non-negative slot count from a setting, or `default` (with a warning) if it is not a number."""
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            log(f"Host slots: ignoring invalid {name} {value!r}", "WARN")
+            return default
+
+    @property
+    def enabled(self) -> bool:
+        return not self._failed and self.max_handlers > 0
+
+    def _project_key(self, project: Project) -> Optional[str]:
+        for name in (project.config.project_id, project.config.project_name):
+            if name and host_slot_key(name) in self.minimums:
+                return host_slot_key(name)
+        return None
+
+    def _candidates(self, project: Project) -> list:
+        key = self._project_key(project)
+        files = [f'reserved-{key}-{i:02d}.lock' for i in range(self.minimums[key])] if key else []
+        shared = max(0, self.max_handlers - sum(self.minimums.values()))
+        return files + [f'slot-{i:02d}.lock' for i in range(shared)]
+
+    def acquire(self, project: Project, handler: str, task_id: str) -> Optional[HostSlot]:
+        """Take a free slot for one of the project's handlers, or None if the host is full."""
+        if not self.enabled:
+            return None
+        try:
+            self.slots_dir.mkdir(parents=True, exist_ok=True)
+            for name in self._candidates(project):
+                path = self.slots_dir / name
+                if path in self._held:
+                    continue
+                fd = self._fds.get(path)
+                if fd is None:
+                    fd = self._fds[path] = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                slot = self._held[path] = HostSlot(path, fd)
+                holder = json.dumps({
+                    "pid": os.getpid(), "project": project.config.project_name,
+                    "project_id": project.config.project_id, "project_dir": str(project.config.project_dir.resolve()),
+                    "handler": handler, "task_id": task_id, "acquired_at": time.time(),
+                }).encode('utf-8')
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, holder, 0)
+                return slot
+        except OSError as e:
+            log(f"Host slots unavailable ({e}), not limiting handlers machine-wide", "WARN")
+            self._failed = True
+        return None
+
+    def release(self, slot: HostSlot):
+        if self._held.pop(slot.path, None) is None:
+            return
+        try:
+            os.ftruncate(slot.fd, 0)
+            fcntl.flock(slot.fd, fcntl.LOCK_UN)
+        except OSError as e:
+            log(f"Failed to release host slot {slot.path.name}: {e}", "WARN")
+
+    def held(self) -> int:
+        return len(self._held)
+
+    def describe_full(self) -> str:
+        return f"host handler slots full ({self.held()} held by this client, {self.max_handlers} machine-wide)"
+
+
+host_slots = HostSlots()
+
+
+# =============================================================================
+# Host Load Admission
+# Off unless settings.loadAdmission is set (true for the defaults, or an
+# object of watermarks). Before a handler starts, the host's load is then
+# checked against the project's watermarks: the 1-minute load average per CPU,
+# MemAvailable, and PSI cpu and memory pressure (some avg10). While any is
+# past its watermark, the project's dispatches stay queued. Hysteresis:
+# dispatching resumes only once every signal is back within resumeRatio of
+# its watermark, so a host hovering at a watermark does not flap. Deferrals
+# and resumptions are logged with the signals that caused them.
+#
+# /proc files are generated by the kernel, not read from disk, so sampling
+# happens inline on the event loop, at most once per LOAD_SAMPLE_SECONDS.
+# =============================================================================
+
+# Seconds a host load sample is reused
+LOAD_SAMPLE_SECONDS = 1.0
+
+
+def read_pressure(resource: str) -> Optional[float]:
+    """PSI "some" avg10 for cpu or memory (percent), or None without PSI."""
+    try:
+        with open(f'/proc/pressure/{resource}') as f:
+            for line in f:
+                if line.startswith('some '):
+                    return float(line.split()[1].partition('=')[2])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_host_load() -> dict:
+    """Current host load signals; a signal that cannot be read is None."""
+    sample = {"load_per_cpu": None, "mem_available_percent": None,
+              "cpu_pressure": read_pressure('cpu'), "memory_pressure": read_pressure('memory')}
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/proc/loadavg') as f:
+            sample["load_per_cpu"] = float(f.read().split()[0]) / cpus
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        meminfo = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                meminfo[name] = int(value.split()[0])
+        sample["mem_available_percent"] = 100.0 * meminfo['MemAvailable'] / meminfo['MemTotal']
+    except (OSError, ValueError, IndexError, KeyError, ZeroDivisionError):
+        pass
+    return sample
+
+
+class HostLoadAdmission:
+    """Defers dispatches while host load is past a project's watermarks (see Host Load Admission)."""
+
+    def __init__(self):
+        self._sample: Optional[dict] = None
+        self._sampled_at = 0.0
+        self._deferring = {}  # Project -> monotonic time its dispatches were first deferred
+
+    def sample(self) -> dict:
+        now = time.monotonic()
+        if self._sample is None or now - self._sampled_at >= LOAD_SAMPLE_SECONDS:
+            self._sample, self._sampled_at = read_host_load(), now
+        return self._sample
+
+    def deferring(self, project: Project) -> bool:
+        return project in self._deferring
+
+    def blocked(self, project: Project) -> Optional[str]:
+        """Why the project's dispatches must wait for the host, or None to admit them."""
+        limits = project.config.load_admission
+        if not limits:
+            self._deferring.pop(project, None)
+            return None
+        sample = self.sample()
+        deferring = project in self._deferring
+        ratio = limits["resumeRatio"] if deferring else 1.0
+        reasons = []
+        for signal_name, limit_name, label in (("load_per_cpu", "maxLoadPerCpu", "load per CPU"),
+                                               ("cpu_pressure", "maxCpuPressure", "CPU pressure"),
+                                               ("memory_pressure", "maxMemoryPressure", "memory pressure")):
+            value, limit = sample[signal_name], limits[limit_name]
+            if value is not None and limit and value > limit * ratio:
+                reasons.append(f"{label} {value:.2f} > {limit * ratio:.2f}")
+        available, floor = sample["mem_available_percent"], limits["minMemAvailablePercent"]
+        if available is not None and floor and available < floor / ratio:
+            reasons.append(f"memory available {available:.1f}% < {floor / ratio:.1f}%")
+
+        if reasons and not deferring:
+            self._deferring[project] = time.monotonic()
+            project.run(log, f"Deferring dispatches, host under load: {'; '.join(reasons)}", "WARN")
+        elif not reasons and deferring:
+            waited = time.monotonic() - self._deferring.pop(project)
+            project.run(log, f"Host load back under watermarks after {waited:.0f}s, resuming dispatches")
+        return f"host under load ({'; '.join(reasons)})" if reasons else None
+
+
+host_load = HostLoadAdmission()
+
+
+# =============================================================================
+# Dispatch Scheduler
+# Every dispatch - startup and live - goes through one priority queue.
+# Finishing work beats starting work (ops, reviewer, dev, architect, ba), and
+# each worker type has a bounded number of concurrent handler slots. Waiting
+# dispatches age so BA work cannot starve behind a steady stream of merges.
+#
+# Slots are per project. With several projects, a shared budget
+# (--max-handlers / manifest maxConcurrentHandlers) caps all of them, and the
+# next dispatch comes from the project with the fewest running handlers, so
+# one busy project cannot take the whole budget. A dispatch with a free slot
+# here still waits while the host is under load (see Host Load Admission) and
+# needs a machine-wide slot (see Host Slots) before it starts.
+#
+# Preemption (settings.preemptFor, off by default): a dispatch of a listed
+# worker type that has a slot of its own but waits on shared capacity (the
+# project or shared budget, host load, host slots) pauses the lowest-priority
+# running handler instead: SIGSTOP to its process group, which then holds no
+# CPU, and the urgent handler starts in its place. The paused handler gets
+# SIGCONT when the urgent one exits. Paused time counts toward neither its
+# worker timeout nor its duration metrics. A long pause can outlast network
+# timeouts inside the paused session, so it suits short urgent work (ops).
+# =============================================================================
+
+# Stage priority: lower runs first (same order as startup dispatch queues)
+STAGE_PRIORITY = {"ops": 0, "reviewer": 1, "dev": 2, "architect": 3, "ba": 4}
+
+# Seconds of waiting that raise a pending dispatch by one stage
+DISPATCH_AGING_SECONDS = 300
+
+# Seconds between retries while the host is loaded or its slots are full (nothing notifies us)
+ADMISSION_RETRY_SECONDS = 1.0
+
+
+def handler_worker(handler: str) -> str:
+    """Map a handler name (handle-dev) to its worker key (dev)."""
+    return handler.replace('handle-', '', 1)
+
+
+class PendingDispatch:
+    """A handler launch waiting for a free slot."""
+
+    def __init__(self, handler: str, task_id: str, mode: str,
+                 launch: Callable[[], Awaitable[bool]], seq: int):
+        self.handler = handler
+        self.worker = handler_worker(handler)
+        self.task_id = task_id
+        self.mode = mode
+        self.launch = launch
+        self.seq = seq
+        self.project = active_project()
+        self.enqueued_at = time.monotonic()
+        self.announced = False  # "queued" already logged
+
+    def sort_key(self, now: float) -> tuple:
+        base = STAGE_PRIORITY.get(self.worker, len(STAGE_PRIORITY))
+        aged = base - (now - self.enqueued_at) / DISPATCH_AGING_SECONDS
+        return (aged, self.seq)
+
+
+class DispatchScheduler:
+    """Priority queue plus per-worker-type admission control for handlers.
+
+    Runs entirely on the event loop thread, so no locking is needed. Submitted
+    dispatches are not started inline: one pump per loop iteration picks the
+    best eligible dispatch, so a burst of events is ordered by stage priority
+    rather than arrival order.
+
+    Execution is single-flight per task: at most one dispatch per task is
+    queued or running. A newer dispatch for a task that is still queued
+    replaces it in place; one for a task whose handler is running is held as
+    the task's follow-up (latest wins) and queued when that handler exits.
+    """
+
+    def __init__(self):
+        self._running = defaultdict(int)  # (project, worker) -> handlers holding a slot
+        self._pending = []                # PendingDispatch, unordered
+        self._inflight = {}               # (project, task_id) -> PendingDispatch queued or running
+        self._followups = {}              # (project, task_id) -> PendingDispatch held until in-flight exits
+        self._host_held = defaultdict(list)  # (project, task_id, worker) -> HostSlots held by its handlers
+        self._loans = {}                  # (project, task_id) -> RunningHandler paused so the task could start
+        self._seq = 0
+        self._pump_scheduled = False
+        self._retry = None                # TimerHandle while dispatches wait on host load or host slots
+        self._closed = False
+        self.budget: Optional[int] = None  # handlers across all projects
+
+    def limit(self, worker: str, project: Optional[Project] = None) -> int:
+        return (project or active_project()).config.handler_concurrency.get(worker, 1)
+
+    def submit(self, handler: str, task_id: str, launch: Callable[[], Awaitable[bool]], mode: str = ""):
+        """Queue a handler launch; it starts once it is the best dispatch with a free slot.
+
+        `launch` is a coroutine function that spawns the handler and returns True
+        on success. The slot is held until finished() is called for the task
+        (when the process exits).
+        """
+        if self._closed:
+            log(f"Shutting down, not dispatching {handler} task={task_id[:8]}")
+            dispatch_dedup.forget(task_id, handler, mode)
+            return
+        self._seq += 1
+        entry = PendingDispatch(handler, task_id, mode, launch, self._seq)
+        key = (entry.project, task_id)
+        current = self._inflight.get(key) if task_id else None
+
+        if current is None:
+            self._enqueue(entry)
+        elif current in self._pending:
+            # Not started yet - the newer dispatch takes its place in the queue
+            self._supersede(current, entry, "queued")
+            entry.seq, entry.enqueued_at, entry.announced = current.seq, current.enqueued_at, current.announced
+            self._pending[self._pending.index(current)] = entry
+            self._inflight[key] = entry
+            self._schedule_pump()
+        else:
+            previous = self._followups.get(key)
+            if previous:
+                self._supersede(previous, entry, "follow-up")
+            else:
+                log(f"Task {task_id[:8]} busy ({current.handler} running), "
+                    f"holding {handler} as follow-up")
+            self._followups[key] = entry
+
+    def finished(self, task_id: str, handler: str):
+        """Free the slot held by an exited handler and start the next best dispatch."""
+        project = active_project()
+        slot = (project, handler_worker(handler))
+        self._running[slot] = max(0, self._running[slot] - 1)
+        held = self._host_held.get((project, task_id, slot[1]))
+        if held:
+            host_slots.release(held.pop())
+            if not held:
+                del self._host_held[(project, task_id, slot[1])]
+        self._inflight.pop((project, task_id), None)
+        paused = self._loans.pop((project, task_id), None)
+        if paused:
+            supervisor.resume(paused)
+        followup = self._followups.pop((project, task_id), None)
+        if followup and not self._closed:
+            log(f"Task {task_id[:8]} free, queueing follow-up {followup.handler}")
+            followup.enqueued_at = time.monotonic()
+            self._enqueue(followup)
+        self._schedule_pump()
+
+    def adopt(self, handler: str, task_id: str, mode: str = ""):
+        """Account for an already-running handler (journal recovery): it holds a slot and its task."""
+        self._seq += 1
+        entry = PendingDispatch(handler, task_id, mode, None, self._seq)
+        self._running[(entry.project, entry.worker)] += 1
+        self._inflight[(entry.project, task_id)] = entry
+        # The previous client's host slot died with it; take one again if the host has room
+        host_slot = host_slots.acquire(entry.project, handler, task_id)
+        if host_slot:
+            self._host_held[(entry.project, task_id, entry.worker)].append(host_slot)
+        elif host_slots.enabled:
+            log(f"Reattached {handler} task={task_id[:8]} without a host slot: {host_slots.describe_full()}", "WARN")
+
+    def preempting(self, entry: 'RunningHandler') -> bool:
+        """True if the handler was started by pausing another one."""
+        return (entry.project, entry.task_id) in self._loans
+
+    def is_busy(self, task_id: str) -> bool:
+        """True if the task has a dispatch queued or running (in the current project)."""
+        return (active_project(), task_id) in self._inflight
+
+    def waiting(self, worker: str = None, project: Optional[Project] = None) -> int:
+        project = project or active_project()
+        return sum(1 for p in self._pending if p.project is project and (worker is None or p.worker == worker))
+
+    def running_in(self, project: Project) -> int:
+        return sum(n for (owner, _), n in self._running.items() if owner is project)
+
+    def total_running(self) -> int:
+        return sum(self._running.values())
+
+    def _enqueue(self, entry: PendingDispatch):
+        self._pending.append(entry)
+        if entry.task_id:
+            self._inflight[(entry.project, entry.task_id)] = entry
+        self._schedule_pump()
+
+    def _supersede(self, old: PendingDispatch, new: PendingDispatch, where: str):
+        # The replaced dispatch never ran, so it must not count as a recent dispatch
+        dispatch_dedup.forget(old.task_id, old.handler, old.mode)
+        log(f"Task {old.task_id[:8]} {where} {old.handler} superseded by newer {new.handler}")
+
+    def _blocked_by(self, entry: PendingDispatch) -> Optional[str]:
+        """Why `entry` cannot start now, or None if it has a slot."""
+        project = entry.project
+        running = self._running[(project, entry.worker)]
+        if running >= self.limit(entry.worker, project):
+            return f"{entry.worker} slots full ({running}/{self.limit(entry.worker, project)})"
+        cap = project.config.max_concurrent_handlers
+        if cap and self.running_in(project) >= cap:
+            return f"all handler slots busy ({self.running_in(project)}/{cap})"
+        if self.budget and self.total_running() >= self.budget:
+            return f"shared handler budget used ({self.total_running()}/{self.budget})"
+        return None
+
+    def _schedule_pump(self):
+        if not self._pump_scheduled:
+            self._pump_scheduled = True
+            asyncio.get_running_loop().call_soon(self._pump)
+
+    def close(self) -> tuple:
+        """Stop starting handlers (shutdown). Returns (queued, follow-ups) dropped."""
+        self._closed = True
+        if self._retry:
+            self._retry.cancel()
+        dropped = (len(self._pending), len(self._followups))
+        for entry in self._pending:
+            self._inflight.pop((entry.project, entry.task_id), None)  # follow-ups' tasks stay in flight until their handler exits
+        self._pending.clear()
+        self._followups.clear()
+        return dropped
+
+    def _pump(self):
+        self._pump_scheduled = False
+        if self._closed:
+            return
+        now = time.monotonic()
+        held_back = {}  # project -> why the host cannot take its dispatches in this pump
+        while self._pending:
+            eligible = [p for p in self._pending if p.project not in held_back and self._blocked_by(p) is None]
+            if not eligible:
+                break
+            # Least-served project first, then stage priority with aging
+            entry = min(eligible, key=lambda p: (self.running_in(p.project), p.sort_key(now)))
+            overloaded = host_load.blocked(entry.project)
+            if overloaded:
+                held_back[entry.project] = overloaded  # another project's watermarks may differ
+                continue
+            if host_slots.enabled:
+                host_slot = host_slots.acquire(entry.project, entry.handler, entry.task_id)
+                if host_slot is None:
+                    held_back[entry.project] = host_slots.describe_full()  # another project may have a reserved slot
+                    continue
+                self._host_held[(entry.project, entry.task_id, entry.worker)].append(host_slot)
+            self._pending.remove(entry)
+            self._running[(entry.project, entry.worker)] += 1
+            entry.project.run(self._start, entry, now)
+
+        if self._pending:
+            self._preempt(now)
+
+        if held_back and self._retry is None:
+            self._retry = asyncio.get_running_loop().call_later(ADMISSION_RETRY_SECONDS, self._retry_pump)
+
+        for entry in self._pending:
+            if not entry.announced:
+                entry.announced = True
+                reason = self._blocked_by(entry) or held_back[entry.project]
+                entry.project.run(log, f"Queued {entry.handler} task={entry.task_id[:8]}: "
+                                       f"{reason} (waiting: {self.waiting(project=entry.project)})")
+
+    def _preempt(self, now: float):
+        """Start waiting dispatches of preemptFor workers by pausing lower-priority handlers."""
+        for entry in sorted(self._pending, key=lambda p: p.sort_key(now)):
+            if not entry.task_id or entry.worker not in entry.project.config.preempt_for:
+                continue
+            running = self._running[(entry.project, entry.worker)]
+            if running >= self.limit(entry.worker, entry.project):
+                continue  # pausing other workers frees none of its own slots
+            cap = entry.project.config.max_concurrent_handlers
+            own_project = bool(cap and self.running_in(entry.project) >= cap)
+            victim = supervisor.preemption_victim(entry.worker, entry.project if own_project else None)
+            if victim is None:
+                continue
+            supervisor.pause(victim, f"for urgent {entry.handler} task={entry.task_id[:8]}")
+            # The paused handler keeps its host slot; the urgent one borrows it if the pool is full
+            if host_slots.enabled:
+                host_slot = host_slots.acquire(entry.project, entry.handler, entry.task_id)
+                if host_slot:
+                    self._host_held[(entry.project, entry.task_id, entry.worker)].append(host_slot)
+            self._pending.remove(entry)
+            self._running[(entry.project, entry.worker)] += 1
+            self._loans[(entry.project, entry.task_id)] = victim
+            entry.project.run(self._start, entry, now)
+
+    def _retry_pump(self):
+        self._retry = None
+        self._schedule_pump()
+
+    def _start(self, entry: PendingDispatch, now: float):
+        # Runs as the entry's project, so its launch, logs and handler belong to that project
+        if entry.announced:
+            log(f"Starting queued {entry.handler} task={entry.task_id[:8]} "
+                f"after {int(now - entry.enqueued_at)}s (still waiting: {self.waiting()})")
+        supervisor.create_task(self._run(entry))
+
+    async def _run(self, entry: PendingDispatch):
+        if not await entry.launch():
+            # A failed launch never starts a process, so its slot is free again
+            self.finished(entry.task_id, entry.handler)
+
+    def snapshot(self, project: Optional[Project] = None) -> dict:
+        """Return {worker: (running, waiting, limit)} for one project (default: current)."""
+        project = project or active_project()
+        workers = {w for (owner, w) in self._running if owner is project}
+        workers |= {p.worker for p in self._pending if p.project is project}
+        return {w: (self._running[(project, w)], self.waiting(w, project), self.limit(w, project))
+                for w in sorted(workers)}
+
+    def followups(self, project: Optional[Project] = None) -> int:
+        project = project or active_project()
+        return sum(1 for owner, _ in self._followups if owner is project)
+
+
+scheduler = DispatchScheduler()
+
+
+# =============================================================================
+# Handler Resource Envelopes
+# Every handler starts inside its worker type's envelope
+# (settings.handlerResources), so one runaway dev build cannot starve the
+# short ops and reviewer handlers:
+#
+# - nice: CPU niceness (only ever raised above ws-client's own)
+# - ioClass / ioLevel: I/O scheduling class (best-effort, idle) and level 0-7
+# - addressSpaceMB: RLIMIT_AS for every process of the handler
+# - cpuMax / memoryMax: cgroup v2 cpu.max ("150%" or 1.5 = one and a half
+#   CPUs, or a raw "quota period") and memory.max ("8G"). These need
+#   settings.handlerCgroup: a delegated cgroup v2 directory that ws-client
+#   can write and that holds no processes itself. Each handler gets its own
+#   child cgroup there, which also catches descendants that leave the
+#   handler's process group. It is removed once the handler exits.
+#
+# The envelope is applied by ws-client to the new process right after it is
+# spawned: nice and I/O priority to its whole process group, RLIMIT_AS with
+# prlimit(2), and the cgroup by writing its pid to cgroup.procs. Nothing runs
+# in the child between fork and exec, so every handler keeps subprocess's
+# vfork/posix_spawn fast path (a preexec_fn would force a full fork of this
+# multi-threaded process). `claude` is still starting up at that point, long
+# before it forks anything that would need to inherit the envelope. Errors
+# are logged at debug level and leave the inherited setting.
+# =============================================================================
+
+# ioprio_set(2) syscall numbers (glibc has no wrapper); elsewhere ionice is skipped
+IOPRIO_SET_SYSCALL = {"x86_64": 251, "aarch64": 30, "riscv64": 30, "i386": 289, "i686": 289, "armv7l": 314}
+
+# ioprio classes by settings name (realtime needs CAP_SYS_ADMIN)
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+# cpu.max period in microseconds
+CPU_MAX_PERIOD = 100000
+
+# Prefix of per-handler cgroups, followed by the project key
+HANDLER_CGROUP_PREFIX = "joan-"
+
+_syscall = None  # libc syscall(), bound on first use
+
+
+def cpu_max_value(value) -> Optional[str]:
+    """settings cpuMax ("150%", 1.5 CPUs, or a raw cpu.max line) as a cpu.max value."""
+    if value in (None, "", 0):
+        return None
+    if isinstance(value, str) and not value.endswith('%'):
+        return value
+    cpus = float(value[:-1]) / 100 if isinstance(value, str) else float(value)
+    if cpus <= 0:
+        raise ValueError(f"cpuMax must be positive: {value!r}")
+    return f"{max(1000, int(cpus * CPU_MAX_PERIOD))} {CPU_MAX_PERIOD}"
+
+
+class HandlerEnvelope:
+    """The resource limits one handler starts with (see Handler Resource Envelopes)."""
+
+    def __init__(self, settings: dict, cgroup_root: Optional[Path]):
+        self.nice = int(settings.get('nice') or 0)
+        self.ioprio: Optional[int] = None
+        if settings.get('ioClass'):
+            if settings['ioClass'] not in IOPRIO_CLASSES:
+                raise ValueError(f"ioClass must be one of {', '.join(IOPRIO_CLASSES)}: {settings['ioClass']!r}")
+            level = min(7, max(0, int(settings.get('ioLevel', 4))))
+            self.ioprio = (IOPRIO_CLASSES[settings['ioClass']] << 13) | level
+        self.address_space = int(settings['addressSpaceMB']) * 1024 * 1024 if settings.get('addressSpaceMB') else None
+        self.cpu_max = cpu_max_value(settings.get('cpuMax'))
+        self.memory_max = str(settings['memoryMax']) if settings.get('memoryMax') else None
+        self.cgroup_root = cgroup_root if self.cpu_max or self.memory_max else None
+        self.cgroup: Optional[Path] = None
+        self._ioprio_syscall: Optional[int] = None
+
+    @classmethod
+    def for_handler(cls, handler: str) -> 'HandlerEnvelope':
+        """The current project's envelope for a handler."""
+        return cls(config.handler_resources.get(handler_worker(handler), {}), config.handler_cgroup)
+
+    def prepare(self, name: str):
+        """Create the handler's cgroup, if it has one (worker thread, before spawning)."""
+        global _syscall
+        if self.ioprio is not None and platform.machine() in IOPRIO_SET_SYSCALL:
+            if _syscall is None:
+                _syscall = ctypes.CDLL(None, use_errno=True).syscall
+            self._ioprio_syscall = IOPRIO_SET_SYSCALL[platform.machine()]
+        if not self.cgroup_root:
+            return
+        path = self.cgroup_root / name
+        try:
+            needed = {c for c, limit in (("cpu", self.cpu_max), ("memory", self.memory_max)) if limit}
+            enabled = set((self.cgroup_root / 'cgroup.subtree_control').read_text().split())
+            if needed - enabled:
+                (self.cgroup_root / 'cgroup.subtree_control').write_text(
+                    ' '.join(f'+{c}' for c in sorted(needed - enabled)))
+            path.mkdir()
+            if self.cpu_max:
+                (path / 'cpu.max').write_text(self.cpu_max)
+            if self.memory_max:
+                (path / 'memory.max').write_text(self.memory_max)
+            self.cgroup = path
+        except OSError as e:
+            log(f"Handler cgroup under {self.cgroup_root} unavailable, starting without it: {e}", "WARN")
+            remove_handler_cgroup(path)
+
+    def apply(self, pid: int):
+        """Put a just-spawned handler (leader of process group `pid`) into the envelope."""
+        if self.cgroup:
+            try:
+                (self.cgroup / 'cgroup.procs').write_text(str(pid))
+            except OSError as e:
+                log(f"Handler cgroup {self.cgroup.name} unavailable, running without it: {e}", "WARN")
+                remove_handler_cgroup(self.cgroup)
+                self.cgroup = None
+        try:
+            if self.nice > os.getpriority(os.PRIO_PROCESS, 0):
+                os.setpriority(os.PRIO_PGRP, pid, self.nice)
+        except OSError as e:
+            log_debug(f"nice {self.nice} not applied to handler pid {pid}: {e}")
+        if self._ioprio_syscall is not None:
+            if _syscall(self._ioprio_syscall, 2, pid, self.ioprio) != 0:  # IOPRIO_WHO_PGRP
+                log_debug(f"I/O priority not applied to handler pid {pid}: {os.strerror(ctypes.get_errno())}")
+        if self.address_space:
+            try:
+                _, hard = resource.prlimit(pid, resource.RLIMIT_AS)
+                limit = self.address_space if hard == resource.RLIM_INFINITY else min(self.address_space, hard)
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, hard))
+            except (OSError, ValueError) as e:
+                log_debug(f"RLIMIT_AS not applied to handler pid {pid}: {e}")
+
+
+def handler_cgroup_name(handler: str, output_file: Path) -> str:
+    """Per-handler cgroup name: prefix, project, worker, and the run's unique output file stem."""
+    return f"{HANDLER_CGROUP_PREFIX}{host_slot_key(config.project_id or 'project')}-{handler_worker(handler)}-{output_file.stem}"
+
+
+def remove_handler_cgroup(path: Path) -> bool:
+    """Remove an exited handler's cgroup; False if processes still hold it (or it is gone)."""
+    try:
+        path.rmdir()
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        log(f"Handler cgroup {path.name} not removed: {e}", "WARN")
+        return False
+
+
+def kill_handler_cgroup(path: Path):
+    """SIGKILL every process left in a handler's cgroup (cgroup.kill, Linux 5.14+)."""
+    try:
+        (path / 'cgroup.kill').write_text("1")
+    except OSError:
+        pass
+
+
+def freeze_handler_cgroup(path: Path, frozen: bool):
+    """Freeze or thaw every process in a handler's cgroup (cgroup.freeze, Linux 5.2+)."""
+    try:
+        (path / 'cgroup.freeze').write_text("1" if frozen else "0")
+    except OSError:
+        pass
+
+
+def sweep_handler_cgroups():
+    """Remove this project's empty handler cgroups left by a previous run (a live handler's stay)."""
+    root = config.handler_cgroup
+    if not root or not root.is_dir():
+        return
+    prefix = f"{HANDLER_CGROUP_PREFIX}{host_slot_key(config.project_id or 'project')}-"
+    for path in root.iterdir():
+        if path.is_dir() and path.name.startswith(prefix):
+            try:
+                path.rmdir()
+            except OSError:
+                pass
+
+
+# =============================================================================
+# Handler Supervisor
+# Handler processes are spawned from a worker thread, so fork/exec never
+# stalls the event loop, and their exits are watched through pidfds on the
+# loop. One supervisor follows their output without blocking, collects exit
+# codes, and is the single source of truth for what is currently running.
+#
+# Handler output goes to a file under .claude/handler-output/ rather than a
+# pipe, so a handler never dies of EPIPE when ws-client restarts and its
+# output can be picked up again after recovery (see Handler Journal).
+#
+# It also owns each handler's lifecycle. Every handler runs in its own
+# process group. Once its worker timeout (settings.workerTimeouts) passes,
+# the whole group gets SIGTERM, then SIGKILL after a grace period. A handler
+# is always reaped and its slot released, even if a descendant keeps writing
+# to its output.
+# =============================================================================
+
+# Longest partial line buffered from handler output (Claude can print very long lines)
+HANDLER_STREAM_LIMIT = 1024 * 1024
+
+# Seconds between SIGTERM and SIGKILL when terminating a handler's process group
+HANDLER_KILL_GRACE = 30
+
+# Seconds to keep reading output after a handler exits before giving up on it
+HANDLER_DRAIN_SECONDS = 5
+
+# How often to check a handler for exit where there is no pidfd to watch (and for adopted handlers)
+HANDLER_EXIT_POLL = 1.0
+
+# How often to check a handler's output file for new lines
+HANDLER_OUTPUT_POLL = 0.25
+
+# Output lines kept per handler for failure reports
+HANDLER_OUTPUT_TAIL_LINES = 20
+
+
+def handler_output_path(task_id: str) -> Path:
+    """Unique output file for one handler run of a task."""
+    return config.project_dir / '.claude' / 'handler-output' / f"{task_id}-{os.urandom(4).hex()}.log"
+
+
+def spawn_handler(cmd: list, env: dict, output_file: Path, envelope: HandlerEnvelope,
+                  cgroup_name: str) -> subprocess.Popen:
+    """Start a handler in its resource envelope, output going to `output_file` (runs in a worker thread)."""
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    envelope.prepare(cgroup_name)
+    try:
+        with open(output_file, 'wb') as output:
+            popen = subprocess.Popen(
+                cmd,
+                cwd=handler_env.cwd,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                # Own session and process group, so timeouts and shutdown reach Claude's children,
+                # and a paused handler is not sent SIGHUP when ws-client exits (orphaned group).
+                # Not process_group=0: that keeps our controlling terminal and rules out posix_spawn too
+                start_new_session=True,
+                # Python's own fds are non-inheritable (PEP 446); skip the close sweep
+                close_fds=False,
+            )
+    except BaseException:
+        if envelope.cgroup:
+            remove_handler_cgroup(envelope.cgroup)
+            envelope.cgroup = None
+        raise
+    envelope.apply(popen.pid)
+    return popen
+
+
+class HandlerProcess:
+    """A spawned handler, reaped from the event loop.
+
+    Exit is noticed through a pidfd registered with the loop (Linux 5.3+),
+    otherwise by polling every HANDLER_EXIT_POLL seconds. With a pidfd,
+    `before_reap` runs while the exited process is still a zombie.
+    """
+
+    def __init__(self, popen: subprocess.Popen):
+        self._popen = popen
+        self.pid = popen.pid
+        self.before_reap: Optional[Callable[[], None]] = None
+        self._exited = asyncio.Event()
+        self._pidfd: Optional[int] = None
+        try:
+            self._pidfd = os.pidfd_open(self.pid)
+            asyncio.get_running_loop().add_reader(self._pidfd, self._reap)
+        except (AttributeError, OSError):
+            if self._pidfd is not None:
+                os.close(self._pidfd)
+            self._pidfd = None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._popen.returncode
+
+    def _reap(self):
+        if self.before_reap:
+            self.before_reap()
+            self.before_reap = None
+        if self._popen.poll() is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._pidfd)
+        os.close(self._pidfd)
+        self._pidfd = None
+        self._exited.set()
+
+    async def wait(self) -> int:
+        if self._pidfd is not None:
+            await self._exited.wait()
+        while self._popen.poll() is None:
+            await asyncio.sleep(HANDLER_EXIT_POLL)
+        return self.returncode
+
+
+async def wait_for_exit(process, timeout: Optional[float]) -> bool:
+    """Wait until the process exits; return False if `timeout` passes first."""
+    if process.returncode is not None:
+        return True
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+class RunningHandler:
+    """A handler subprocess owned by the supervisor."""
+
+    def __init__(self, handler: str, task_id: str, mode: str, process: HandlerProcess,
+                 payload_file: Optional[Path] = None):
+        self.handler = handler
+        self.task_id = task_id
+        self.task_title: Optional[str] = None
+        self.mode = mode
+        self.payload_file = payload_file
+        self.process = process
+        self.pid = process.pid
+        self.started_at = time.monotonic()
+        self.timeout_minutes = config.worker_timeouts.get(handler_worker(handler))
+        self.terminating: Optional[str] = None  # reason, once termination has begun
+        self.watcher: Optional[asyncio.Task] = None
+        self.project_id: Optional[str] = None
+        self.result_marker: Optional[Path] = None  # written by submit-result.py on success
+        self.output_tail = deque(maxlen=HANDLER_OUTPUT_TAIL_LINES)
+        self.output_file: Optional[Path] = None
+        self.cgroup: Optional[Path] = None  # own cgroup (settings.handlerCgroup), removed after exit
+        self.adopted = False  # started by a previous ws-client process (see HandlerJournal)
+        self.usage = HandlerUsage()
+        self.paused_at: Optional[float] = None  # while preempted (see DispatchScheduler)
+        self.paused_seconds = 0.0  # earlier pauses
+        self.preemptions = 0
+        self.project = active_project()
+
+    def total_paused(self) -> float:
+        """Seconds spent paused so far, including a pause in progress."""
+        current = time.monotonic() - self.paused_at if self.paused_at is not None else 0.0
+        return self.paused_seconds + current
+
+    def active_seconds(self) -> float:
+        """Run time so far, not counting time spent paused."""
+        return time.monotonic() - self.started_at - self.total_paused()
+
+    def time_left(self) -> Optional[float]:
+        """Seconds of active run time left before the worker timeout, or None without one."""
+        if not self.timeout_minutes:
+            return None
+        return max(0.0, self.timeout_minutes * 60 - self.active_seconds())
+
+    def describe(self) -> str:
+        elapsed = int(time.monotonic() - self.started_at)
+        where = f"{self.project.label}: " if len(projects) > 1 else ""
+        paused = ", paused" if self.paused_at is not None else ""
+        return f"{where}{self.handler} task={self.task_id[:8]} pid={self.pid} ({elapsed}s{paused})"
+
+
+def record_handler_duration(entry: RunningHandler):
+    """Add an exited handler's run time to the duration histogram."""
+    returncode = entry.process.returncode
+    if entry.terminating == "timeout":
+        outcome = "timeout"
+    elif entry.terminating:
+        outcome = "terminated"
+    elif returncode == UNKNOWN_EXIT:
+        outcome = "unknown"
+    else:
+        outcome = "success" if returncode == 0 else "failure"
+    client_metrics.handler_duration.observe(entry.active_seconds(), handler=entry.handler, outcome=outcome)
+
+
+class HandlerSupervisor:
+    """Starts handler subprocesses and watches them until they exit."""
+
+    def __init__(self):
+        self.running = {}  # pid -> RunningHandler
+        self._tasks = set()
+
+    def create_task(self, coro) -> asyncio.Task:
+        """Schedule a coroutine on the loop, keeping a reference until it finishes."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self, handler: str, task_id: str, cmd: list, env: dict, log_prefix: str = "",
+                    mode: str = "", payload_file: Optional[Path] = None, task_title: Optional[str] = None) -> bool:
+        """Start a handler subprocess. Returns False if it could not be started.
+
+        The handler's slot is released once the process exits.
+        """
+        output_file = handler_output_path(task_id)
+        envelope = HandlerEnvelope.for_handler(handler)
+        try:
+            process = HandlerProcess(await asyncio.to_thread(spawn_handler, cmd, env, output_file, envelope,
+                                                             handler_cgroup_name(handler, output_file)))
+        except Exception as e:
+            log(f"{log_prefix}Failed to dispatch handler: {e}", "ERROR")
+            output_file.unlink(missing_ok=True)
+            handler_env.invalidate()  # re-resolve the executable on the next spawn
+            return False
+
+        log(f"{log_prefix}Handler dispatched (PID: {process.pid})")
+        client_metrics.handlers_started.inc(handler=handler)
+        entry = RunningHandler(handler, task_id, mode, process, payload_file)
+        entry.task_title = task_title
+        entry.output_file = output_file
+        process.before_reap = lambda: entry.usage.sample_exited(entry.pid)
+        entry.cgroup = envelope.cgroup
+        entry.project_id = env.get('JOAN_PROJECT_ID') or config.project_id
+        if env.get('JOAN_RESULT_MARKER'):
+            entry.result_marker = Path(env['JOAN_RESULT_MARKER'])
+        self.running[process.pid] = entry
+        handler_journal.started(entry)
+        entry.watcher = self.create_task(self._watch(entry))
+        return True
+
+    def adopt(self, entry: RunningHandler):
+        """Track a live handler left running by a previous ws-client process.
+
+        It holds its slot and task like any other handler, is subject to the
+        same timeout (counted from its original start), and is detected as
+        exited by polling, since it is not our child. It is continued in
+        case the previous process exited while it was paused.
+        """
+        if entry.cgroup:
+            freeze_handler_cgroup(entry.cgroup, False)
+        self._signal_group(entry, signal.SIGCONT)
+        self.running[entry.pid] = entry
+        scheduler.adopt(entry.handler, entry.task_id, entry.mode)
+        entry.watcher = self.create_task(self._watch(entry))
+
+    async def _stream_output(self, entry: RunningHandler):
+        """Copy new lines of a handler's output file to the log until it exits.
+
+        An adopted handler's earlier output was already logged by the previous
+        run, so it only fills the failure-report tail.
+        """
+        if not entry.output_file:
+            return
+        try:
+            output = open(entry.output_file, 'rb')
+        except OSError:
+            return
+        with output:
+            echo = not entry.adopted
+            partial = b""
+            while True:
+                exited = entry.process.returncode is not None
+                chunk = output.read(65536)
+                if chunk:
+                    *lines, partial = (partial + chunk).split(b"\n")
+                    if len(partial) > HANDLER_STREAM_LIMIT:
+                        lines.append(partial)
+                        partial = b""
+                    for raw in lines:
+                        self._output_line(entry, raw, echo)
+                    continue
+                echo = True
+                if exited:
+                    # Read everything written up to the exit; a straggling descendant doesn't count
+                    self._output_line(entry, partial, echo)
+                    return
+                await asyncio.sleep(HANDLER_OUTPUT_POLL)
+
+    @staticmethod
+    def _output_line(entry: RunningHandler, raw: bytes, echo: bool):
+        line = raw.decode('utf-8', errors='replace').strip()
+        if line:
+            entry.output_tail.append(line)
+            if echo:
+                log(f"[{entry.handler}] {line}")
+
+    async def _watch(self, entry: RunningHandler):
+        """Stream a handler's output, enforce its timeout and record its exit code."""
+        process = entry.process
+        reader = asyncio.ensure_future(self._stream_output(entry))
+        try:
+            while not await wait_for_exit(process, entry.time_left()):
+                if entry.time_left() > 0:
+                    continue  # it was paused meanwhile, which stops its clock
+                log(f"Handler {entry.handler} exceeded its {entry.timeout_minutes}m timeout: "
+                    f"{entry.describe()}", "WARN")
+                killed = await self.terminate(entry, "timeout")
+                record_metric(
+                    "handler_timeout",
+                    worker=handler_worker(entry.handler),
+                    handler=entry.handler,
+                    task_id=entry.task_id,
+                    timeout_minutes=entry.timeout_minutes,
+                    duration_seconds=round(entry.active_seconds()),
+                    killed=killed,
+                )
+                break
+
+            # A descendant that escaped the group can keep writing; don't let it pin the slot
+            try:
+                await asyncio.wait_for(reader, HANDLER_DRAIN_SECONDS)
+            except asyncio.TimeoutError:
+                log(f"Handler {entry.handler} exited but its output is still growing; "
+                    f"no longer reading it (pid {entry.pid})", "WARN")
+            log(f"Handler {entry.handler} completed (exit code: {process.returncode})")
+            await report_unreported_exit(entry)
+        except Exception as e:
+            log(f"Error reading handler output: {e}", "ERROR")
+        finally:
+            reader.cancel()
+            self.running.pop(entry.pid, None)
+            if process.returncode is not None:
+                record_handler_duration(entry)
+                record_worker_session(entry)
+                handler_journal.exited(entry)  # else still running: left for the next run to adopt
+                if entry.output_file:
+                    entry.output_file.unlink(missing_ok=True)
+                if entry.cgroup:
+                    remove_handler_cgroup(entry.cgroup)
+            if entry.payload_file:
+                payload_spool.release(entry.payload_file)
+            # Once the handler is gone, the next event for this task is a new transition or a retry,
+            # not a duplicate (stale events are still caught by their event time)
+            dispatch_dedup.forget(entry.task_id, entry.handler, entry.mode)
+            scheduler.finished(entry.task_id, entry.handler)
+
+    async def terminate(self, entry: RunningHandler, reason: str, grace: float = HANDLER_KILL_GRACE) -> bool:
+        """SIGTERM the handler's process group, SIGKILL it after `grace` seconds.
+
+        A grace of 0 sends SIGKILL straight away, also escalating a termination
+        already in progress. Waits until the handler has exited. Returns True
+        if SIGKILL was needed.
+        """
+        if entry.terminating:
+            if grace == 0:
+                self._signal_group(entry, signal.SIGKILL)
+            await wait_for_exit(entry.process, None)
+            return False
+        entry.terminating = reason
+        killed = True
+        if grace > 0:
+            self._signal_group(entry, signal.SIGTERM)
+            self.resume(entry)  # a stopped handler only acts on SIGTERM once continued
+            killed = not await wait_for_exit(entry.process, grace)
+            if killed:
+                log(f"Handler {entry.handler} ignored SIGTERM for {grace}s, sending SIGKILL "
+                    f"(pid {entry.pid})", "WARN")
+        # Also take down anything in the group (or the handler's cgroup) that outlived the handler itself
+        self._signal_group(entry, signal.SIGKILL)
+        self.resume(entry)
+        if entry.cgroup:
+            kill_handler_cgroup(entry.cgroup)
+        await wait_for_exit(entry.process, None)
+        return killed
+
+    def preemption_victim(self, worker: str, project: Optional[Project] = None) -> Optional[RunningHandler]:
+        """The running handler to pause for an urgent `worker` handler, or None.
+
+        Only handlers of a lower stage priority qualify (within `project` if
+        given): the lowest-priority one, the most recently started among
+        equals. Handlers being terminated, already paused or themselves
+        started by preemption are left alone.
+        """
+        urgency = STAGE_PRIORITY.get(worker, len(STAGE_PRIORITY))
+        candidates = [
+            entry for entry in self.running.values()
+            if entry.process.returncode is None and not entry.terminating and entry.paused_at is None
+            and not scheduler.preempting(entry) and (project is None or entry.project is project)
+            and STAGE_PRIORITY.get(handler_worker(entry.handler), len(STAGE_PRIORITY)) > urgency
+        ]
+        return max(candidates, default=None,
+                   key=lambda entry: (STAGE_PRIORITY.get(handler_worker(entry.handler), len(STAGE_PRIORITY)),
+                                      entry.started_at))
+
+    def pause(self, entry: RunningHandler, reason: str):
+        """SIGSTOP a handler's process group (and freeze its cgroup) until resume()."""
+        entry.project.run(log, f"Pausing {entry.describe()} {reason}")
+        entry.paused_at = time.monotonic()
+        entry.preemptions += 1
+        if entry.cgroup:
+            freeze_handler_cgroup(entry.cgroup, True)
+        self._signal_group(entry, signal.SIGSTOP)
+        client_metrics.preemptions.inc(project=entry.project.label, handler=entry.handler)
+
+    def resume(self, entry: RunningHandler):
+        """SIGCONT a paused handler's process group (and thaw its cgroup); no-op if it is not paused."""
+        if entry.paused_at is None:
+            return
+        paused = time.monotonic() - entry.paused_at
+        entry.paused_seconds += paused
+        entry.paused_at = None
+        if entry.cgroup:
+            freeze_handler_cgroup(entry.cgroup, False)
+        self._signal_group(entry, signal.SIGCONT)
+        client_metrics.handler_paused_seconds.inc(round(paused, 3), project=entry.project.label,
+                                                  handler=entry.handler)
+        if not entry.terminating:
+            entry.project.run(log, f"Resumed {entry.describe()} after {paused:.0f}s paused")
+
+    async def terminate_all(self, reason: str, grace: float = HANDLER_KILL_GRACE):
+        """Terminate every running handler and wait for them to exit."""
+        entries = list(self.running.values())
+        await asyncio.gather(*(entry.project.create_task(self.terminate(entry, reason, grace))
+                               for entry in entries),
+                             return_exceptions=True)
+
+    async def wait_idle(self):
+        """Wait until no handler is running and every watcher has finished."""
+        while self.running:
+            await asyncio.wait([entry.watcher for entry in self.running.values()])
+
+    @staticmethod
+    def _signal_group(entry: RunningHandler, sig: int):
+        try:
+            os.killpg(entry.pid, sig)  # the handler leads its own group (start_new_session)
+        except ProcessLookupError:
+            pass
+        except OSError as e:
+            log(f"Failed to signal handler {entry.handler} (pid {entry.pid}): {e}", "WARN")
+
+    def summary(self) -> str:
+        """One-line description of every running handler."""
+        return "; ".join(entry.describe() for entry in self.running.values()) or "none"
+
+
+supervisor = HandlerSupervisor()
+
+
+# =============================================================================
+# Handler Resource Accounting
+# Every HANDLER_USAGE_SAMPLE_SECONDS, one pass over /proc (in a worker
+# thread) finds each running handler's processes: its process group plus
+# any descendant that left the group but not yet the handler's process tree
+# (a daemon that double-forked away is only caught by a handler cgroup's
+# own limits). Per handler it tracks:
+#
+# - CPU seconds: user + system time of its live processes, plus that of the
+#   exited children they waited for (which the kernel adds to the parent)
+# - peak RSS: the largest combined resident set seen in one pass
+# - read/write bytes: storage I/O from /proc/<pid>/io, which likewise
+#   includes waited-for children
+#
+# A process reaped outside the handler (an orphan re-parented to init)
+# keeps its last sampled totals. The handler itself is sampled once more
+# when it exits, before it is reaped, so its final totals include every
+# child it waited for, however short-lived.
+#
+# The totals go into the handler's worker_session record in
+# agent-metrics.jsonl. Each pass also rewrites .claude/ws-handlers-usage.json
+# with the project's live handlers, which `joan top` reads.
+# =============================================================================
+
+# Seconds between samples of running handlers
+HANDLER_USAGE_SAMPLE_SECONDS = 5.0
+
+# /proc reports CPU time in clock ticks and resident sets in pages
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def read_process_stat(pid: int) -> Optional[tuple]:
+    """(ppid, pgrp, start ticks, CPU ticks including waited-for children, RSS pages) of a process, or None."""
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rindex(b')') + 2:].split()  # skip "pid (comm)", comm may contain spaces
+    return (int(fields[1]), int(fields[2]), int(fields[19]),
+            int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14]), int(fields[21]))
+
+
+def read_process_io(pid: int) -> tuple:
+    """(read bytes, write bytes) of a process including waited-for children; zeros if unavailable."""
+    read = write = 0
+    try:
+        with open(f"/proc/{pid}/io", 'rb') as f:
+            for line in f:
+                if line.startswith(b'read_bytes:'):
+                    read = int(line.split()[1])
+                elif line.startswith(b'write_bytes:'):
+                    write = int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return read, write
+
+
+def scan_handler_processes(leaders: list) -> dict:
+    """One /proc pass: handler pid -> its processes, keyed like HandlerUsage members (worker thread)."""
+    stats = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            stat = read_process_stat(int(name))
+            if stat:
+                stats[int(name)] = stat
+    children, groups = defaultdict(list), defaultdict(list)
+    for pid, (ppid, pgrp, *_) in stats.items():
+        children[ppid].append(pid)
+        groups[pgrp].append(pid)
+
+    found = {}
+    for leader in leaders:
+        members, pending = set(), list(groups.get(leader, ()))  # each handler leads its own group
+        while pending:
+            pid = pending.pop()
+            if pid not in members:
+                members.add(pid)
+                pending.extend(children.get(pid, ()))
+        found[leader] = {(pid, stats[pid][2]): (stats[pid][0], stats[pid][3], stats[pid][4], *read_process_io(pid))
+                         for pid in members}
+    return found
+
+
+class HandlerUsage:
+    """CPU, memory and I/O totals of one handler's processes (see Handler Resource Accounting)."""
+
+    def __init__(self):
+        self.cpu_seconds = 0.0
+        self.cpu_percent = 0.0  # over the last sample interval; 100 is one full CPU
+        self.rss_bytes = 0
+        self.peak_rss_bytes = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.processes = 0
+        self._members = {}  # (pid, start ticks) -> (ppid, CPU ticks, RSS pages, read bytes, write bytes)
+        self._reaped_outside = (0, 0, 0)  # CPU ticks, read and write bytes of orphans gone since
+        self._sampled_at: Optional[float] = None
+
+    def update(self, members: dict):
+        """Fold in a sample of the handler's processes."""
+        previous = {pid for pid, _ in self._members}
+        ticks, read, write = self._reaped_outside
+        for key, (ppid, cpu, _, key_read, key_write) in self._members.items():
+            # One whose parent was a handler process was waited for and now counts in that parent
+            if key not in members and ppid not in previous:
+                ticks, read, write = ticks + cpu, read + key_read, write + key_write
+        self._reaped_outside = (ticks, read, write)
+        self._members = members
+
+        for _, cpu, _, key_read, key_write in members.values():
+            ticks, read, write = ticks + cpu, read + key_read, write + key_write
+        cpu_seconds = max(self.cpu_seconds, ticks / CLOCK_TICKS)
+        now = time.monotonic()
+        if self._sampled_at is not None and now > self._sampled_at:
+            self.cpu_percent = (cpu_seconds - self.cpu_seconds) / (now - self._sampled_at) * 100
+        self._sampled_at = now
+        self.cpu_seconds = cpu_seconds
+        self.read_bytes = max(self.read_bytes, read)
+        self.write_bytes = max(self.write_bytes, write)
+        self.rss_bytes = sum(rss for _, _, rss, _, _ in members.values()) * PAGE_SIZE
+        self.peak_rss_bytes = max(self.peak_rss_bytes, self.rss_bytes)
+        self.processes = len(members)
+
+    def sample_exited(self, pid: int):
+        """Resample the processes already known, the handler having just exited (runs on the loop).
+
+        Called before the handler is reaped: its zombie still reports its
+        totals, which now include everything it waited for. Only a few
+        /proc files are read, the known processes' own.
+        """
+        members = {}
+        for member_pid, start_ticks in {pid: None, **{member_pid: ticks for member_pid, ticks in self._members}}.items():
+            stat = read_process_stat(member_pid)
+            if stat and start_ticks in (None, stat[2]):
+                members[(member_pid, stat[2])] = (stat[0], stat[3], stat[4], *read_process_io(member_pid))
+        self.update(members)
+
+    def describe(self) -> dict:
+        return {
+            "cpu_seconds": round(self.cpu_seconds, 2),
+            "cpu_percent": round(self.cpu_percent, 1),
+            "rss_mb": round(self.rss_bytes / 2 ** 20, 1),
+            "peak_rss_mb": round(self.peak_rss_bytes / 2 ** 20, 1),
+            "read_bytes": self.read_bytes,
+            "write_bytes": self.write_bytes,
+            "processes": self.processes,
+        }
+
+
+def record_worker_session(entry: RunningHandler):
+    """Record an exited handler's worker_session event, with its resource totals."""
+    returncode = entry.process.returncode
+    worker = handler_worker(entry.handler)
+    usage = entry.usage
+    record_metric(
+        "worker_session",
+        worker=worker,
+        model=config.worker_model(worker),
+        handler=entry.handler,
+        task_id=entry.task_id,
+        task_title=entry.task_title,
+        success=None if returncode == UNKNOWN_EXIT else returncode == 0 and not entry.terminating,
+        exit_code=None if returncode == UNKNOWN_EXIT else returncode,
+        duration_seconds=round(entry.active_seconds()),
+        paused_seconds=round(entry.total_paused()),
+        preemptions=entry.preemptions,
+        cpu_seconds=round(usage.cpu_seconds, 2),
+        peak_rss_mb=round(usage.peak_rss_bytes / 2 ** 20, 1),
+        read_bytes=usage.read_bytes,
+        write_bytes=usage.write_bytes,
+    )
+    client_metrics.handler_cpu_seconds.inc(round(usage.cpu_seconds, 3), handler=entry.handler)
+    client_metrics.handler_io_bytes.inc(usage.read_bytes, handler=entry.handler, direction="read")
+    client_metrics.handler_io_bytes.inc(usage.write_bytes, handler=entry.handler, direction="write")
+
+
+class HandlerUsageSampler:
+    """Samples every running handler and publishes each project's live handlers for `joan top`."""
+
+    def __init__(self):
+        self._published = set()  # projects whose usage file lists handlers
+
+    async def run(self):
+        if not Path('/proc/self/stat').exists():
+            return  # no /proc: worker_session records carry zero totals
+        while True:
+            await asyncio.sleep(HANDLER_USAGE_SAMPLE_SECONDS)
+            try:
+                await self.sample()
+            except Exception as e:
+                log(f"Handler resource sampling failed: {e}", "WARN")
+
+    async def sample(self):
+        entries = [entry for entry in supervisor.running.values() if entry.process.returncode is None]
+        if entries:
+            found = await asyncio.to_thread(scan_handler_processes, [entry.pid for entry in entries])
+            for entry in entries:
+                if entry.process.returncode is None:  # exited meanwhile: sample_exited() had the last word
+                    entry.usage.update(found[entry.pid])
+
+        snapshots = {}
+        for entry in supervisor.running.values():
+            snapshots.setdefault(entry.project, []).append({
+                "handler": entry.handler,
+                "worker": handler_worker(entry.handler),
+                "task_id": entry.task_id,
+                "task_title": entry.task_title,
+                "pid": entry.pid,
+                "started_at": round(time.time() - (time.monotonic() - entry.started_at), 3),
+                "paused": entry.paused_at is not None,
+                **entry.usage.describe(),
+            })
+        writes = []
+        for project in projects:
+            handlers = snapshots.get(project, [])
+            if handlers or project in self._published:
+                writes.append((project.config.usage_file, {
+                    "pid": os.getpid(),
+                    "updated_at": round(time.time(), 3),
+                    "interval": HANDLER_USAGE_SAMPLE_SECONDS,
+                    "handlers": handlers,
+                }))
+            if handlers:
+                self._published.add(project)
+            else:
+                self._published.discard(project)
+        if writes:
+            await asyncio.to_thread(self._write, writes)
+
+    @staticmethod
+    def _write(writes: list):
+        for path, snapshot in writes:
+            try:
+                tmp = path.with_name(f".{path.name}.tmp")
+                tmp.write_text(json.dumps(snapshot))
+                os.replace(tmp, path)
+            except OSError:
+                pass
+
+    def close(self):
+        for project in projects:
+            project.config.usage_file.unlink(missing_ok=True)
+
+
+handler_usage = HandlerUsageSampler()
+
+
+# =============================================================================
+# Unreported Handler Exits
+# Handlers report completion through submit-result.py, which writes a marker
+# file (JOAN_RESULT_MARKER) once Joan accepts the worker-result. A handler that
+# exits non-zero without the marker crashed, timed out or was killed with
+# its task still claimed. ws-client submits a success=false result for it,
+# so the claim is released now instead of after staleClaimMinutes.
+# A handler that exits 0 without a result skipped the task on purpose and is
+# left alone.
+# =============================================================================
+
+# result_type of auto-submitted failures
+UNREPORTED_EXIT_RESULT_TYPE = "handler_failed"
+
+# Characters of handler output included in an auto-submitted error
+FAILURE_OUTPUT_MAX_CHARS = 2000
+
+
+def result_marker_path(task_id: str) -> Path:
+    """Unique marker path for one handler run of a task."""
+    return config.project_dir / '.claude' / 'results' / f"{task_id}-{os.urandom(4).hex()}.json"
+
+
+def post_worker_result(project_id: str, task_id: str, payload: dict) -> dict:
+    """POST a worker-result, like submit-result.py (runs in a worker thread)."""
+    url = f"{config.api_url}/api/v1/projects/{project_id}/tasks/{task_id}/worker-result"
+    body = api_pool.request('POST', url, api_headers(), json.dumps(payload).encode('utf-8'))
+    return json.loads(body.decode('utf-8') or '{}')
+
+
+async def report_unreported_exit(entry: RunningHandler):
+    """Submit a failure result for a handler that died without reporting one."""
+    marker = entry.result_marker
+    if marker is None:
+        return
+    reported = marker.exists()
+    marker.unlink(missing_ok=True)
+    returncode = entry.process.returncode
+    if reported or returncode == 0:
+        return
+
+    if entry.terminating:
+        reason = f"was terminated by ws-client ({entry.terminating})"
+    elif returncode == UNKNOWN_EXIT:
+        reason = "exited across a ws-client restart (exit status unknown)"
+    elif returncode < 0:
+        try:
+            reason = f"was killed by {signal.Signals(-returncode).name}"
+        except ValueError:
+            reason = f"was killed by signal {-returncode}"
+    else:
+        reason = f"exited with code {returncode}"
+    error = f"{entry.handler} {reason} without submitting a result"
+    tail = "\n".join(entry.output_tail)[-FAILURE_OUTPUT_MAX_CHARS:]
+    if tail:
+        error += f"\n\nLast output:\n{tail}"
+
+    payload = {
+        "worker": f"{handler_worker(entry.handler)}-worker",
+        "success": False,
+        "result_type": UNREPORTED_EXIT_RESULT_TYPE,
+        "output": {"exit_code": None if returncode == UNKNOWN_EXIT else returncode,
+                   "terminated": entry.terminating},
+        "error": error,
+    }
+    try:
+        result = await asyncio.to_thread(post_worker_result, entry.project_id, entry.task_id, payload)
+        log(f"Reported failure for task {entry.task_id[:8]}: {entry.handler} {reason} "
+            f"({result.get('message', 'OK')})", "WARN")
+    except urllib.error.HTTPError as e:
+        log(f"Failed to report failure for task {entry.task_id[:8]}: HTTP {e.code} {e.reason}", "ERROR")
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        log(f"Failed to report failure for task {entry.task_id[:8]}: {e}", "ERROR")
+
+
+# =============================================================================
+# Handler Journal
+# Every handler start and exit is appended to .claude/ws-handlers.jsonl.
+# Handlers run in their own session, so they outlive a ws-client restart.
+# On startup the journal is replayed:
+# - Handlers still alive (same pid and kernel start time) are adopted. They
+#   keep their slot and task, so startup dispatch and events skip them.
+# - Handlers that died meanwhile are cleaned up and, if they never
+#   submitted a result, reported as failed.
+# The journal is then compacted to the adopted entries. While running, it is
+# compacted again whenever an exit leaves no live handler, and at least
+# every HANDLER_JOURNAL_COMPACT_EXITS exits, so a long-running client does
+# not replay its whole history on the next start.
+#
+# Records are written by a background LogWriter with a short flush interval:
+# a crash within that window can lose the latest start, leaving that one
+# handler unadopted.
+# =============================================================================
+
+# Return code of an adopted handler once it is gone (it is not our child, so it can't be collected)
+UNKNOWN_EXIT = "unknown"
+
+# Seconds a journal record may wait before it is written
+HANDLER_JOURNAL_FLUSH = 0.05
+
+# Exit records after which the journal is compacted even while handlers are still live
+HANDLER_JOURNAL_COMPACT_EXITS = 100
+
+
+def process_start_ticks(pid: int) -> Optional[int]:
+    """Kernel start time of a live, non-zombie process (Linux /proc), or None."""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    fields = stat[stat.rindex(')') + 2:].split()  # skip "pid (comm)", comm may contain spaces
+    if fields[0] in ('Z', 'X'):
+        return None
+    return int(fields[19])
+
+
+def process_alive(pid: int, start_ticks: Optional[int]) -> bool:
+    """True if `pid` is still the process that was journaled (guards against PID reuse)."""
+    if Path('/proc').is_dir():
+        ticks = process_start_ticks(pid)
+        return ticks is not None and (start_ticks is None or ticks == start_ticks)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdoptedProcess:
+    """Stand-in for HandlerProcess for a handler adopted from the journal."""
+
+    def __init__(self, pid: int, start_ticks: Optional[int]):
+        self.pid = pid
+        self.start_ticks = start_ticks
+        self.returncode = None
 
-# Global config instance
-config = WebSocketConfig()
+    async def wait(self):
+        while self.returncode is None:
+            if not process_alive(self.pid, self.start_ticks):
+                self.returncode = UNKNOWN_EXIT
+                break
+            await asyncio.sleep(HANDLER_EXIT_POLL)
+        return self.returncode
 
-# Shutdown event
-shutdown_event = asyncio.Event()
 
+class HandlerJournal:
+    """Append-only start/exit records of handler processes."""
 
-def log(message: str, level: str = "INFO"):
-    """Write log entry with timestamp."""
-    now = datetime.now()
-    iso_timestamp = now.strftime('%Y-%m-%dT%H:%M:%S') or now.isoformat()
+    def __init__(self):
+        self._writer = LogWriter(lambda: config.journal_file, flush_interval=HANDLER_JOURNAL_FLUSH)
+        self._live = {}  # pid -> start record of a handler that has not exited
+        self._exits = 0  # exit records appended since the last compaction
+
+    def started(self, entry: RunningHandler):
+        record = {
+            "op": "start",
+            "task_id": entry.task_id,
+            "task_title": entry.task_title,
+            "handler": entry.handler,
+            "mode": entry.mode,
+            "pid": entry.pid,
+            "pgid": entry.pid,  # each handler leads its own session (start_new_session)
+            "start_ticks": process_start_ticks(entry.pid),
+            "started_at": time.time() - (time.monotonic() - entry.started_at),
+            "payload": entry.payload_file.stem if entry.payload_file else None,
+            "project_id": entry.project_id,
+            "result_marker": str(entry.result_marker) if entry.result_marker else None,
+            "output": str(entry.output_file) if entry.output_file else None,
+            "cgroup": str(entry.cgroup) if entry.cgroup else None,
+        }
+        self._live[entry.pid] = record
+        self._append(record)
+
+    def exited(self, entry: RunningHandler):
+        self._live.pop(entry.pid, None)
+        self._append({"op": "exit", "pid": entry.pid, "task_id": entry.task_id})
+        self._exits += 1
+        if not self._live or self._exits >= HANDLER_JOURNAL_COMPACT_EXITS:
+            self.compact()
+
+    def _append(self, record: dict):
+        self._writer.write(json.dumps(record))
+
+    def load(self) -> list:
+        """Start records without a matching exit record, oldest first."""
+        live = {}
+        try:
+            with open(config.journal_file) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from a crash
+                    if record.get("op") == "start":
+                        live[record["pid"]] = record
+                    elif record.get("op") == "exit":
+                        live.pop(record.get("pid"), None)
+        except OSError:
+            return []
+        return list(live.values())
+
+    def close(self):
+        self._writer.close()
+
+    def adopt(self, records: list):
+        """Track the start records of handlers adopted from a previous run, then compact."""
+        for record in records:
+            self._live[record["pid"]] = record
+        self.compact()
+
+    def compact(self):
+        """Rewrite the journal with only the live handlers' start records."""
+        self._exits = 0
+        self._writer.rewrite([json.dumps(record) for record in self._live.values()])
+
+
+handler_journal = ProjectLocal('handler_journal', HandlerJournal)
+
+
+def journal_entry(record: dict, process) -> RunningHandler:
+    """Rebuild a RunningHandler from a journal start record."""
+    payload = record.get("payload")
+    entry = RunningHandler(record["handler"], record["task_id"], record.get("mode", ""), process,
+                           payload_spool.directory / f"{payload}.json" if payload else None)
+    entry.started_at = time.monotonic() - max(0.0, time.time() - record.get("started_at", time.time()))
+    entry.adopted = True
+    entry.task_title = record.get("task_title")
+    entry.project_id = record.get("project_id") or config.project_id
+    if record.get("result_marker"):
+        entry.result_marker = Path(record["result_marker"])
+    if record.get("output"):
+        entry.output_file = Path(record["output"])
+    if record.get("cgroup"):
+        entry.cgroup = Path(record["cgroup"])
+    return entry
+
+
+def read_output_tail(entry: RunningHandler):
+    """Load the last lines of a dead handler's output file for its failure report, then delete it."""
+    if not entry.output_file:
+        return
+    try:
+        with open(entry.output_file, 'rb') as f:
+            f.seek(max(0, entry.output_file.stat().st_size - HANDLER_STREAM_LIMIT))
+            for raw in f.read().splitlines()[-HANDLER_OUTPUT_TAIL_LINES:]:
+                line = raw.decode('utf-8', errors='replace').strip()
+                if line:
+                    entry.output_tail.append(line)
+        entry.output_file.unlink()
+    except OSError:
+        pass
 
-    log_line = f"[{iso_timestamp}] [{level}] {message}"
 
-    # Console output
-    print(log_line)
+async def recover_handlers():
+    """Adopt live handlers from a previous run and settle the ones that died."""
+    records = await asyncio.to_thread(handler_journal.load)
+    alive = [await asyncio.to_thread(process_alive, record["pid"], record.get("start_ticks")) for record in records]
+    # Compact before any adopted handler is watched, so its exit cannot precede its compacted start
+    handler_journal.adopt([record for record, is_alive in zip(records, alive) if is_alive])
+    for record, is_alive in zip(records, alive):
+        process = AdoptedProcess(record["pid"], record.get("start_ticks"))
+        entry = journal_entry(record, process)
+        if is_alive:
+            if entry.payload_file:
+                payload_spool.adopt(entry.payload_file)
+            supervisor.adopt(entry)
+            log(f"RECOVERY: Reattached to running {entry.describe()}")
+        else:
+            process.returncode = UNKNOWN_EXIT
+            log(f"RECOVERY: {entry.handler} task={entry.task_id[:8]} pid={entry.pid} exited while ws-client was down")
+            if entry.payload_file:
+                payload_spool.discard(entry.payload_file)
+            await asyncio.to_thread(read_output_tail, entry)
+            supervisor.create_task(report_unreported_exit(entry))
 
-    # File output
-    try:
-        config.log_dir.mkdir(parents=True, exist_ok=True)
-        with open(config.log_file, 'a') as f:
-            f.write(log_line + '\n')
-    except Exception as e:
-        print(f"[{iso_timestamp}] [ERROR] Failed to write log: {e}")
 
+# =============================================================================
+# Handler Environment
+# The environment every handler inherits is built once (and again only when
+# the token, mode, API URL or project changes). Each spawn copies it and
+# applies a small per-task overlay. The claude executable is resolved to an
+# absolute path up front, and the working directory is omitted when the
+# client already runs in the project directory. Both keep per-spawn work in
+# subprocess (PATH search, chdir) to a minimum.
+#
+# Handlers need their own session (see Handler Journal), and subprocess does
+# not use posix_spawn with start_new_session (nor with process_group). With
+# no preexec_fn it takes the vfork() path instead (Python 3.10+ on Linux),
+# which costs the same: 200 spawns of /bin/true measured 0.96 ms each via
+# posix_spawn, 0.83 ms with start_new_session, and 4.1 ms with a preexec_fn
+# (26 ms at 1 GB RSS, where the full fork copies the page tables).
+# =============================================================================
 
-def log_debug(message: str):
-    """Write debug log entry (only if debug mode enabled)."""
-    if config.debug:
-        log(message, "DEBUG")
+class HandlerEnvironment:
+    """Immutable base environment for handler spawns plus per-task overlays."""
 
+    def __init__(self):
+        self._key = None
+        self._base: Mapping[str, str] = MappingProxyType({})
+        self.executable = "claude"
+        self.cwd: Optional[str] = None
+
+    def invalidate(self):
+        """Force a rebuild on the next spawn."""
+        self._key = None
+
+    def base(self) -> Mapping[str, str]:
+        key = (config.auth_token, config.mode, config.api_url, config.project_id, str(config.project_dir))
+        if key != self._key:
+            self._rebuild()
+            self._key = key
+        return self._base
+
+    def for_task(self, task_id: str, project_id: Optional[str],
+                 payload_file: Optional[Path] = None) -> dict:
+        """Return a fresh env dict for one handler: the base plus its task context."""
+        env = dict(self.base())
+        # Phase 3: Pass context for result submission
+        # Handlers can use submit-result.py to report completion
+        env['JOAN_PROJECT_ID'] = project_id or config.project_id or ''
+        env['JOAN_TASK_ID'] = task_id
+        env['JOAN_RESULT_MARKER'] = str(result_marker_path(task_id))
+        if payload_file:
+            env['JOAN_SMART_PAYLOAD_FILE'] = str(payload_file)
+        return env
 
-def rotate_log():
-    """Rotate existing log file on startup so each session gets a clean log."""
-    if not config.log_file.exists() or config.log_file.stat().st_size == 0:
-        return
+    def _rebuild(self):
+        env = os.environ.copy()
+        env['JOAN_WORKFLOW_MODE'] = config.mode
+        env['JOAN_API_URL'] = config.api_url
+        # Per-task values always come from the overlay, never from our own environment
+        for key in ('JOAN_PROJECT_ID', 'JOAN_TASK_ID', 'JOAN_RESULT_MARKER',
+                    'JOAN_SMART_PAYLOAD', 'JOAN_SMART_PAYLOAD_FILE'):
+            env.pop(key, None)
 
-    mtime = datetime.fromtimestamp(config.log_file.stat().st_mtime)
-    stamp = mtime.strftime('%Y%m%d-%H%M%S')
-    rotated = config.log_dir / f'websocket-client.{stamp}.log'
+        # Pass auth token explicitly (critical: ensures spawned processes authenticate
+        # even if this process loaded token from credentials.json instead of env var)
+        if config.auth_token:
+            env['JOAN_AUTH_TOKEN'] = config.auth_token
+            log_debug(f"Auth token passed to handlers: {config.auth_token[:20]}...")
+        else:
+            env.pop('JOAN_AUTH_TOKEN', None)
+            log("WARNING: No auth token available to pass to handlers", "WARN")
 
-    # Avoid overwriting if multiple restarts in the same second
-    counter = 1
-    while rotated.exists():
-        rotated = config.log_dir / f'websocket-client.{stamp}-{counter}.log'
-        counter += 1
+        self.executable = shutil.which("claude", path=env.get('PATH')) or "claude"
+        try:
+            same_dir = Path.cwd().resolve() == config.project_dir.resolve()
+        except OSError:
+            same_dir = False
+        self.cwd = None if same_dir else str(config.project_dir)
+        self._base = MappingProxyType(env)
+        log_debug(f"Handler environment built ({len(env)} vars, executable: {self.executable})")
 
-    config.log_file.rename(rotated)
+
+handler_env = ProjectLocal('handler_env', HandlerEnvironment)
 
 
 # =============================================================================
-# Differential Payload Profiles
-# Each handler receives only the fields it actually uses, reducing payload
-# size by ~30-40% on average. Handlers already handle missing fields gracefully.
+# Smart Payload Spool
+# Filtered payloads are written once, compactly and atomically, to
+# .claude/payloads/<sha256>.json and handed to handlers as a file path
+# (JOAN_SMART_PAYLOAD_FILE). Identical payloads share one file; a file is
+# deleted when the last handler using it exits.
+#
+# Writes and deletions run on payload_executor, off the event loop. Its
+# single worker keeps them in order: a payload dispatched again right after
+# its file was released is rewritten after the deletion, never before it.
 # =============================================================================
-HANDLER_PAYLOAD_PROFILES = {
-    "handle-ba":        {"desc_max": 2000, "comments_max": 3,  "subtasks": False, "rework": False, "columns": False},
-    "handle-architect": {"desc_max": None, "comments_max": 5,  "subtasks": True,  "rework": False, "columns": True},
-    "handle-dev":       {"desc_max": None, "comments_max": 0,  "subtasks": True,  "rework": True,  "columns": False},
-    "handle-reviewer":  {"desc_max": 1000, "comments_max": 3,  "subtasks": True,  "rework": False, "columns": False},
-    "handle-ops":       {"desc_max": 200,  "comments_max": 0,  "subtasks": False, "rework": False, "columns": False},
-}
 
+# Spool files untouched for this long are removed at startup (left by crashes)
+SPOOL_STALE_SECONDS = 6 * 3600
 
-def filter_payload_for_handler(handler: str, smart_payload: dict) -> dict:
-    """Filter smart payload to include only fields the handler needs.
 
-    Each handler has a profile defining which fields it uses and size limits.
-    This reduces token consumption by ~30-40% per handler invocation while
-    maintaining backward compatibility (handlers use OR {} patterns for missing fields).
-    """
-    profile = HANDLER_PAYLOAD_PROFILES.get(handler)
-    if not profile or not smart_payload:
-        return smart_payload
-
-    filtered = {}
-
-    # Task - always include, truncate description per profile
-    if "task" in smart_payload:
-        task = dict(smart_payload["task"])
-        max_chars = profile["desc_max"]
-        if max_chars and task.get("description") and len(task["description"]) > max_chars:
-            original_len = len(task["description"])
-            task["description"] = task["description"][:max_chars] + f"\n\n[truncated, {original_len} total chars]"
-        filtered["task"] = task
-
-    # Tags + handoff_context - always include (bounded by ALS spec, max 3KB)
-    for key in ("tags", "handoff_context"):
-        if key in smart_payload:
-            filtered[key] = smart_payload[key]
+class PayloadSpool:
+    """Reference-counted, content-addressed smart payload files."""
+
+    def __init__(self):
+        self._refs = defaultdict(int)  # path -> handlers using it
+        self._writes = {}              # path -> write task (shared by concurrent acquirers)
+
+    @property
+    def directory(self) -> Path:
+        return config.project_dir / '.claude' / 'payloads'
+
+    async def acquire(self, data: bytes) -> Path:
+        """Return the spool file for `data`, writing it if no live handler already has it."""
+        path = self.directory / f"{hashlib.sha256(data).hexdigest()[:32]}.json"
+        self._refs[path] += 1
+        if path not in self._writes:
+            self._writes[path] = asyncio.get_running_loop().run_in_executor(payload_executor, self._write, path, data)
+        try:
+            await self._writes[path]
+        except Exception:
+            self.release(path)
+            raise
+        return path
+
+    def release(self, path: Path):
+        """Drop one reference; delete the file once no handler uses it."""
+        self._refs[path] -= 1
+        if self._refs[path] > 0:
+            return
+        del self._refs[path]
+        self._writes.pop(path, None)
+        self._remove(path)
+
+    def adopt(self, path: Path):
+        """Take a reference on a file written by a previous run (adopted handler)."""
+        self._refs[path] += 1
+
+    def discard(self, path: Path):
+        """Delete a previous run's file unless a live handler still uses it."""
+        if path not in self._refs:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: Path):
+        asyncio.get_running_loop().run_in_executor(payload_executor, contextvars.copy_context().run,
+                                                   PayloadSpool._unlink, path)
+
+    def sweep(self):
+        """Remove spool files (and legacy smart-payload-*.json) left behind by a previous run."""
+        cutoff = time.time() - SPOOL_STALE_SECONDS
+        removed = 0
+        candidates = list(self.directory.glob('*.json')) if self.directory.exists() else []
+        candidates += list((config.project_dir / '.claude').glob('smart-payload-*.json'))
+        for path in candidates:
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            log(f"Payload spool: removed {removed} stale file(s)")
+
+    @staticmethod
+    def _unlink(path: Path):
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:
+            log(f"Failed to remove payload file {path.name}: {e}", "WARN")
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+
+payload_spool = ProjectLocal('payload_spool', PayloadSpool)
+
+
+def record_payload_metrics(handler: str, task_id: str, projection: PayloadProjection):
+    """Record a payload_projection event for profile tuning."""
+    record_metric(
+        "payload_projection",
+        worker=handler_worker(handler),
+        handler=handler,
+        task_id=task_id,
+        budget_tokens=projection.budget,
+        original_tokens=projection.original_tokens,
+        projected_tokens=projection.tokens,
+        saved_tokens=projection.saved_tokens,
+        dropped=projection.dropped,
+    )
+
 
-    # Conditional fields based on handler profile
-    for key, flag in [("subtasks", "subtasks"), ("rework_feedback", "rework"), ("columns", "columns")]:
-        if profile[flag] and key in smart_payload:
-            filtered[key] = smart_payload[key]
+def submit_handler(handler: str, task_id: str, handler_args: list, smart_payload: Optional[dict],
+                   project_id: Optional[str], mode: str, log_prefix: str = "") -> bool:
+    """Build a handler's command and hand it to the scheduler.
 
-    # Comments - limit count per profile
-    max_c = profile["comments_max"]
-    if max_c > 0 and "recent_comments" in smart_payload:
-        filtered["recent_comments"] = smart_payload["recent_comments"][:max_c]
+    Shared by live events and actionable-tasks dispatch. Everything else is
+    deferred until the scheduler actually starts the handler, so superseded
+    or dropped dispatches cost nothing: the smart payload is projected and
+    serialized in a worker thread (keeping large payloads off the event
+    loop), then the payload file and environment overlay are applied.
+    """
+    # Skill arguments must be part of the prompt string, not separate argv entries.
+    # Claude Code CLI parses --flags as its own options before interpreting the skill.
+    # Workflow mode is passed via JOAN_WORKFLOW_MODE env var (see HandlerEnvironment).
+    skill_args = f"--task={task_id}"
+    if handler_args:
+        skill_args += " " + " ".join(handler_args)
 
-    return filtered
+    prompt = f"/agents:dispatch/{handler} {skill_args}"
 
+    if log_prefix:
+        log(f"{log_prefix}Dispatching {handler} {skill_args}")
+    else:
+        log(f"Dispatching: {handler} {skill_args}")
+
+    async def launch() -> bool:
+        try:
+            # Phase 3: Pass smart payload so handlers don't need to re-fetch
+            # Project it onto the fields this handler uses, within its token budget
+            projection = None
+            if smart_payload:
+                projection = await asyncio.get_running_loop().run_in_executor(
+                    payload_executor, project_payload_for_handler, handler, smart_payload)
+            payload_data = projection.data if projection else None
+            if projection:
+                cut = f", cut: {', '.join(projection.dropped)}" if projection.dropped else ""
+                log_debug(f"Payload projected: ~{projection.original_tokens} -> ~{projection.tokens} tokens "
+                          f"(budget {projection.budget}{cut}) ({handler})")
+            elif log_prefix:
+                log(f"{log_prefix}No smart payload provided for {handler}")
+        except Exception as e:
+            log(f"{log_prefix}Failed to dispatch handler: {e}", "ERROR")
+            dispatch_dedup.forget(task_id, handler, mode)
+            return False
 
-def dispatch_handler(event_type: str, task_id: str, tag_name: str = "", triggered_by: str = "user", smart_payload: dict = None, project_id: str = None):
+        payload_file = None
+        if payload_data:
+            try:
+                payload_file = await payload_spool.acquire(payload_data)
+                log(f"{log_prefix}Smart payload spooled to {payload_file.name} ({len(payload_data)} bytes)")
+            except OSError as e:
+                log(f"{log_prefix}Failed to spool smart payload, handler will fetch via MCP: {e}", "WARN")
+        env = handler_env.for_task(task_id, project_id, payload_file)
+        cmd = [handler_env.executable, prompt]
+        task_title = ((smart_payload or {}).get('task') or {}).get('title')
+        started = await supervisor.start(handler, task_id, cmd, env, log_prefix, mode=mode,
+                                         payload_file=payload_file, task_title=task_title)
+        if not started and payload_file:
+            payload_spool.release(payload_file)
+        if started and projection:
+            record_payload_metrics(handler, task_id, projection)
+            client_metrics.payload_original_bytes.inc(projection.original_bytes, handler=handler)
+            client_metrics.payload_projected_bytes.inc(len(projection.data), handler=handler)
+        return started
+
+    client_metrics.dispatches.inc(handler=handler)
+    scheduler.submit(handler, task_id, launch, mode)
+    return True
+
+
+def dispatch_handler(event_type: str, task_id: str, tag_name: str = "", triggered_by: str = "user", smart_payload: dict = None, project_id: str = None,
+                     event_time: Optional[float] = None):
     """Dispatch the appropriate handler based on event type and tag.
 
     Phase 3 Architecture:
@@ -430,74 +3435,11 @@ def dispatch_handler(event_type: str, task_id: str, tag_name: str = "", triggere
         return
 
     if handler:
-        # Skill arguments must be part of the prompt string, not separate argv entries.
-        # Claude Code CLI parses --flags as its own options before interpreting the skill.
-        # Workflow mode is passed via JOAN_WORKFLOW_MODE env var (already set below).
-        skill_args = f"--task={task_id}"
-        if handler_args:
-            skill_args += " " + " ".join(handler_args)
-
-        cmd = ["claude", f"/agents:dispatch/{handler} {skill_args}"]
-
-        log(f"Dispatching: {handler} {skill_args}")
-
-        # Run handler in background
-        try:
-            env = os.environ.copy()
-            env['JOAN_WORKFLOW_MODE'] = config.mode
-
-            # Pass auth token explicitly (critical: ensures spawned processes authenticate
-            # even if this process loaded token from credentials.json instead of env var)
-            if config.auth_token:
-                env['JOAN_AUTH_TOKEN'] = config.auth_token
-                log_debug(f"Auth token passed to handler: {config.auth_token[:20]}...")
-            else:
-                log(f"WARNING: No auth token available to pass to handler", "WARN")
-
-            # Phase 3: Pass context for result submission
-            # Handlers can use submit-result.py to report completion
-            env['JOAN_PROJECT_ID'] = project_id or config.project_id or ''
-            env['JOAN_TASK_ID'] = task_id
-            env['JOAN_API_URL'] = config.api_url
-
-            # Phase 3: Pass smart payload so handlers don't need to re-fetch
-            # Apply differential filtering to strip unused fields per handler
-            if smart_payload:
-                filtered = filter_payload_for_handler(handler, smart_payload)
-                env['JOAN_SMART_PAYLOAD'] = json.dumps(filtered)
-                original_size = len(json.dumps(smart_payload))
-                filtered_size = len(json.dumps(filtered))
-                reduction = round((1 - filtered_size / original_size) * 100) if original_size > 0 else 0
-                log_debug(f"Payload filtered: {original_size} -> {filtered_size} bytes (-{reduction}%) ({handler})")
-
-            process = subprocess.Popen(
-                cmd,
-                cwd=str(config.project_dir),
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True
-            )
-
-            log(f"Handler dispatched (PID: {process.pid})")
-
-            # Log output in background thread
-            def log_output():
-                try:
-                    for line in process.stdout:
-                        line = line.strip()
-                        if line:
-                            log(f"[{handler}] {line}")
-                    process.wait()
-                    log(f"Handler {handler} completed (exit code: {process.returncode})")
-                except Exception as e:
-                    log(f"Error reading handler output: {e}", "ERROR")
-
-            thread = threading.Thread(target=log_output, daemon=True)
-            thread.start()
+        mode = handler_mode(handler_args)
+        if not dispatch_dedup.admit(task_id, handler, mode, event_type, event_time):
+            return
 
-        except Exception as e:
-            log(f"Failed to dispatch handler: {e}", "ERROR")
+        submit_handler(handler, task_id, handler_args, smart_payload, project_id, mode)
 
 
 # =============================================================================
@@ -513,98 +3455,37 @@ def fetch_actionable_tasks() -> dict:
     url = f"{config.api_url}/api/v1/projects/{config.project_id}/actionable-tasks"
     url += f"?mode={config.mode}&include_payloads=true&include_recovery=true"
 
-    req = urllib.request.Request(url, headers={
-        'Authorization': f'Bearer {config.auth_token}',
-        'Content-Type': 'application/json',
-        'User-Agent': 'joan-agents-websocket-client/1.0',
-    })
-
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read().decode('utf-8'))
+    return json.loads(api_pool.request('GET', url, api_headers()).decode('utf-8'))
 
 
 def dispatch_handler_direct(handler: str, task_id: str, handler_args: list,
-                            smart_payload: dict = None, project_id: str = None):
-    """Dispatch a handler directly from startup dispatch (bypasses event routing).
+                            smart_payload: dict = None, project_id: str = None,
+                            source: str = "startup") -> bool:
+    """Dispatch a handler directly from an actionable-tasks queue (bypasses event routing).
 
-    Same subprocess pattern as dispatch_handler() but without event_type mapping.
+    Same launch path as dispatch_handler() but without event_type mapping.
+    `source` is "startup" or "recovery" and prefixes log lines. Returns False if
+    the dispatch was suppressed as a duplicate.
     """
-    skill_args = f"--task={task_id}"
-    if handler_args:
-        skill_args += " " + " ".join(handler_args)
-
-    cmd = ["claude", f"/agents:dispatch/{handler} {skill_args}"]
-    log(f"STARTUP: Dispatching {handler} {skill_args}")
-
-    try:
-        env = os.environ.copy()
-        env['JOAN_WORKFLOW_MODE'] = config.mode
-
-        # Pass auth token explicitly (critical: ensures spawned processes authenticate
-        # even if this process loaded token from credentials.json instead of env var)
-        if config.auth_token:
-            env['JOAN_AUTH_TOKEN'] = config.auth_token
-            log_debug(f"STARTUP: Auth token passed to handler: {config.auth_token[:20]}...")
-        else:
-            log(f"STARTUP: WARNING: No auth token available to pass to handler", "WARN")
-
-        env['JOAN_PROJECT_ID'] = project_id or config.project_id or ''
-        env['JOAN_TASK_ID'] = task_id
-        env['JOAN_API_URL'] = config.api_url
-
-        # Write smart payload to file for Claude to read (more reliable than env var)
-        payload_file = None
-        if smart_payload:
-            filtered = filter_payload_for_handler(handler, smart_payload)
-            payload_dir = config.project_dir / '.claude'
-            payload_dir.mkdir(exist_ok=True)
-            payload_file = payload_dir / f'smart-payload-{task_id}.json'
-            payload_file.write_text(json.dumps(filtered, indent=2))
-            env['JOAN_SMART_PAYLOAD_FILE'] = str(payload_file)
-            env['JOAN_SMART_PAYLOAD'] = json.dumps(filtered)  # Keep env var as backup
-            log(f"STARTUP: Smart payload written to {payload_file} ({len(json.dumps(filtered))} chars)")
-        else:
-            log(f"STARTUP: No smart payload provided for {handler}")
-
-        process = subprocess.Popen(
-            cmd,
-            cwd=str(config.project_dir),
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True
-        )
-
-        log(f"STARTUP: Handler dispatched (PID: {process.pid})")
-
-        def log_output():
-            try:
-                for line in process.stdout:
-                    line = line.strip()
-                    if line:
-                        log(f"[{handler}] {line}")
-                process.wait()
-                log(f"Handler {handler} completed (exit code: {process.returncode})")
-            except Exception as e:
-                log(f"Error reading handler output: {e}", "ERROR")
-
-        thread = threading.Thread(target=log_output, daemon=True)
-        thread.start()
-
-    except Exception as e:
-        log(f"STARTUP: Failed to dispatch handler: {e}", "ERROR")
+    mode = handler_mode(handler_args)
+    if not dispatch_dedup.admit(task_id, handler, mode, source):
+        return False
+    return submit_handler(handler, task_id, handler_args, smart_payload, project_id, mode,
+                          f"{source.upper()}: ")
 
 
-def run_startup_dispatch():
+async def run_startup_dispatch():
     """Query actionable tasks and dispatch handlers immediately.
 
-    Called once at startup before WebSocket connects. Eliminates cold start
-    delay by processing existing actionable work without waiting for events.
+    Runs on the event loop concurrently with the WebSocket connect: the HTTP
+    query happens in a worker thread, so live events are received (and
+    deduplicated against this snapshot) while it is in flight. Eliminates cold
+    start delay by processing existing actionable work without waiting for events.
     """
     log("=== STARTUP: QUERYING ACTIONABLE TASKS ===")
 
     try:
-        data = fetch_actionable_tasks()
+        data = await asyncio.to_thread(fetch_actionable_tasks)
     except urllib.error.HTTPError as e:
         log(f"STARTUP: API returned {e.code}: {e.reason}", "ERROR")
         log("STARTUP: Will rely on WebSocket events (cold-start delay possible)")
@@ -637,40 +3518,456 @@ def run_startup_dispatch():
         log(f"  INVALID STATE: '{invalid['task_title']}' "
             f"[{invalid['type']}] tags={invalid['tags']} fix={invalid['remediation']}")
 
-    # Dispatch handlers for each queue item (priority order: ops, reviewer, dev, architect, ba)
-    queues = data.get('queues', {})
+    dispatched = dispatch_actionable_queues(data.get('queues', {}), "startup")
+
+    log(f"STARTUP: Dispatched {dispatched} handler(s)")
+    log("")
+
+
+def dispatch_actionable_queues(queues: dict, source: str) -> int:
+    """Dispatch handlers for actionable-tasks queue items. Returns the number dispatched.
+
+    Queue items whose task already has a dispatch queued or running are skipped,
+    so re-running this against a fresh actionable-tasks response only picks up
+    the difference.
+    """
+    prefix = f"{source.upper()}: "
     dispatched = 0
 
+    # Priority order: ops, reviewer, dev, architect, ba
     for queue_name in ['ops', 'reviewer', 'dev', 'architect', 'ba']:
         for item in queues.get(queue_name, []):
             handler = item['handler']
             handler_args = item.get('handler_args', [])
             mode = item.get('mode', '')
 
-            log(f"STARTUP: {handler} → task {item['task_id'][:8]}... "
+            if scheduler.is_busy(item['task_id']):
+                log_debug(f"{prefix}{handler} → task {item['task_id'][:8]}... already in flight, skipping")
+                continue
+
+            log(f"{prefix}{handler} → task {item['task_id'][:8]}... "
                 f"'{item.get('task_title', '')}' (mode: {mode})")
 
-            dispatch_handler_direct(
+            if dispatch_handler_direct(
                 handler, item['task_id'], handler_args,
-                item.get('smart_payload'), config.project_id
-            )
-            dispatched += 1
+                item.get('smart_payload'), config.project_id, source
+            ):
+                dispatched += 1
 
-    log(f"STARTUP: Dispatched {dispatched} handler(s)")
-    log("")
+    return dispatched
+
+
+# =============================================================================
+# Missed-Event Recovery
+# The last processed event is persisted as a cursor and sent on every connect
+# (?since=...&lastEventId=...). A server that supports replay re-sends the
+# missed events followed by {"type": "replay_complete"}. If it answers
+# {"type": "replay_unavailable"}, or does not acknowledge at all, the client
+# falls back to diffing the actionable-tasks queues against what is in flight.
+# =============================================================================
+
+# Seconds to wait for a replay acknowledgement before falling back
+REPLAY_ACK_TIMEOUT = 10
+
+# Cursors older than this are not replayed (startup dispatch covers long gaps)
+REPLAY_MAX_AGE_SECONDS = 3600
+
+
+class EventCursor:
+    """Last processed WebSocket event, persisted across reconnects and restarts."""
+
+    def __init__(self):
+        self.event_id: Optional[str] = None
+        self.timestamp: Optional[str] = None   # raw event timestamp, sent back verbatim
+        self.event_time: Optional[float] = None
+        self.saved_at: Optional[float] = None  # wall clock of last advance
+        self._dirty = False
+        self._saver: Optional[asyncio.Task] = None
+
+    def load(self):
+        try:
+            data = json.loads(config.cursor_file.read_text())
+        except (OSError, ValueError):
+            return
+        self.event_id = data.get('event_id')
+        self.timestamp = data.get('timestamp')
+        self.event_time = parse_event_time(self.timestamp)
+        self.saved_at = data.get('saved_at')
+
+    def advance(self, event_id: Optional[str], timestamp) -> bool:
+        """Move the cursor forward to an event. Older (replayed/out-of-order) events are ignored."""
+        event_time = parse_event_time(timestamp)
+        if event_id is None and event_time is None:
+            return False
+        if event_time is not None and self.event_time is not None and event_time < self.event_time:
+            return False
+        self.event_id = str(event_id) if event_id is not None else self.event_id
+        self.timestamp = timestamp if event_time is not None else self.timestamp
+        self.event_time = event_time if event_time is not None else self.event_time
+        self.saved_at = time.time()
+        self._dirty = True
+        if self._saver is None or self._saver.done():
+            self._saver = asyncio.ensure_future(self._save_pending())
+        return True
+
+    async def _save_pending(self):
+        # One write in flight at a time; advances meanwhile coalesce into the next write
+        while self._dirty:
+            self._dirty = False
+            await asyncio.to_thread(self.save, self._state())
+
+    async def flush(self):
+        """Wait for pending cursor writes (shutdown)."""
+        if self._saver:
+            await self._saver
+
+    def _state(self) -> dict:
+        return {'event_id': self.event_id, 'timestamp': self.timestamp, 'saved_at': self.saved_at}
+
+    def save(self, state: Optional[dict] = None):
+        """Write the cursor atomically (temp file + rename)."""
+        try:
+            config.cursor_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = config.cursor_file.with_suffix('.tmp')
+            tmp.write_text(json.dumps(state or self._state()))
+            os.replace(tmp, config.cursor_file)
+        except OSError as e:
+            log(f"Failed to persist event cursor: {e}", "WARN")
+
+    def usable(self) -> bool:
+        """True if the cursor is recent enough to ask the server for a replay."""
+        if not (self.event_id or self.timestamp) or not self.saved_at:
+            return False
+        return time.time() - self.saved_at <= REPLAY_MAX_AGE_SECONDS
+
+    def query(self) -> str:
+        params = {}
+        if self.timestamp:
+            params['since'] = self.timestamp
+        if self.event_id:
+            params['lastEventId'] = self.event_id
+        return urllib.parse.urlencode(params)
+
+
+event_cursor = ProjectLocal('event_cursor', EventCursor)
+
+
+async def recover_missed_events(reason: str):
+    """Fallback when the server cannot replay: dispatch actionable work that is not in flight."""
+    log(f"RECOVERY: {reason} - diffing actionable tasks")
+    try:
+        data = await asyncio.to_thread(fetch_actionable_tasks)
+    except Exception as e:
+        log(f"RECOVERY: Failed to query actionable tasks: {e}", "ERROR")
+        return
+    dispatched = dispatch_actionable_queues(data.get('queues', {}), "recovery")
+    log(f"RECOVERY: Dispatched {dispatched} handler(s) for missed work")
+
+
+class ReplayTracker:
+    """Tracks the replay handshake for one WebSocket connection."""
+
+    def __init__(self, requested: bool):
+        self.requested = requested
+        self.acknowledged = asyncio.Event()
+        self.replayed = 0
+
+    async def watch(self):
+        """Fall back to an actionable-tasks diff if the server never acknowledges the replay."""
+        try:
+            await asyncio.wait_for(self.acknowledged.wait(), timeout=REPLAY_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.acknowledged.set()
+            await recover_missed_events(f"No replay acknowledgement within {REPLAY_ACK_TIMEOUT}s")
+
+
+def handle_event_message(data: dict):
+    """Route one `event` message from the WebSocket to its handler and advance the cursor."""
+    payload = data.get('payload', {})
+    event_type = payload.get('event_type', '')
+    task_id = payload.get('task_id', '')
+    event_project_id = payload.get('project_id', '')
+    triggered_by = payload.get('triggered_by', 'user')
+    metadata = payload.get('metadata', {})
+    smart_payload = metadata.get('smart_payload', None)
+    timestamp = payload.get('timestamp') or payload.get('created_at')
+
+    # Extract tag name for tag events
+    tag_name = ""
+    if event_type in ('tag_added', 'tag_removed'):
+        changes = payload.get('changes', [])
+        if changes:
+            tag_name = changes[0].get('new_value') or changes[0].get('old_value', '')
+
+    if event_type != 'connected':
+        client_metrics.events_received.inc(event_type=event_type or "unknown")
+        is_smart = "smart" if smart_payload else "legacy"
+        replayed = " [replayed]" if data.get('replayed') else ""
+        log(f"Event received: {event_type} task={task_id} tag={tag_name} ({is_smart}){replayed}")
+        if config.debug and smart_payload:
+            log_debug(f"Smart payload keys: {list(smart_payload.keys())}")
+
+    dispatch_handler(event_type, task_id, tag_name, triggered_by, smart_payload,
+                     event_project_id, parse_event_time(timestamp))
+
+    if event_type != 'connected':
+        event_cursor.advance(data.get('id') or payload.get('id') or payload.get('event_id'), timestamp)
+
+
+# =============================================================================
+# Event Loop Lag
+# A probe sleeps LOOP_LAG_INTERVAL at a time and measures how late it wakes
+# up. That delay is what every callback on the loop waited: WebSocket pings
+# (a ping_timeout disconnect after 10s), events and handler supervision. The
+# probe warns when lag passes LOOP_LAG_WARN_SECONDS and reports p50/p99/max
+# over the last minute as a loop_lag metric, in heartbeat debug logs and at
+# shutdown.
+# =============================================================================
+
+# Seconds between probe wake-ups
+LOOP_LAG_INTERVAL = 0.1
+
+# Samples kept for percentiles (one minute at LOOP_LAG_INTERVAL)
+LOOP_LAG_WINDOW = 600
+
+# Lag that gets a warning, and the minimum seconds between warnings
+LOOP_LAG_WARN_SECONDS = 0.25
+LOOP_LAG_WARN_EVERY = 30
+
+# Seconds between loop_lag records in agent-metrics.jsonl
+LOOP_LAG_REPORT_SECONDS = 60
+
+
+class LoopLagMonitor:
+    """Samples event-loop scheduling delay."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=LOOP_LAG_WINDOW)
+        self.max_lag = 0.0  # since startup
+        self._last_warning = 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Lag percentile over the window, in seconds."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def stats(self) -> dict:
+        return {
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "max_ms": round(max(self.samples, default=0.0) * 1000, 1),
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return f"p50 {stats['p50_ms']}ms, p99 {stats['p99_ms']}ms, max {stats['max_ms']}ms"
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_report = loop.time() + LOOP_LAG_REPORT_SECONDS
+        while True:
+            before = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            now = loop.time()
+            lag = max(0.0, now - before - LOOP_LAG_INTERVAL)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= LOOP_LAG_WARN_SECONDS and now - self._last_warning >= LOOP_LAG_WARN_EVERY:
+                self._last_warning = now
+                log(f"Event loop blocked for {lag * 1000:.0f}ms (last minute: {self.summary()})", "WARN")
+            if now >= next_report:
+                next_report = now + LOOP_LAG_REPORT_SECONDS
+                record_metric("loop_lag", samples=len(self.samples), **self.stats())
+
+
+loop_lag = LoopLagMonitor()
+
+
+# =============================================================================
+# Metrics Endpoint
+# With --metrics ADDR (or JOAN_WS_METRICS), ws-client serves the Prometheus
+# text format on GET /metrics. ADDR is a port (bound to 127.0.0.1),
+# HOST:PORT, or unix:PATH for a unix socket. Each scrape is one short
+# HTTP/1.0 exchange answered on the event loop from the in-memory metrics.
+# =============================================================================
+
+# Seconds a scrape connection may take to send its request
+METRICS_REQUEST_TIMEOUT = 5
+
+# Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def parse_metrics_address(value: str) -> tuple:
+    """Parse a --metrics address into ('unix', path) or ('tcp', (host, port))."""
+    if value.startswith('unix:'):
+        return 'unix', value[len('unix:'):]
+    host, _, port = value.rpartition(':')
+    if not 0 < int(port) < 65536:
+        raise ValueError(f"port out of range: {port}")
+    return 'tcp', (host.strip('[]') or '127.0.0.1', int(port))
+
+
+def render_metrics() -> str:
+    """Refresh the live-state gauges and render every metric."""
+    metrics = client_metrics
+    for family in (metrics.queue_depth, metrics.running, metrics.slots, metrics.followups, metrics.loop_lag,
+                   metrics.host_load):
+        family.clear()
+    for project in projects:
+        snapshot = scheduler.snapshot(project)
+        for worker in sorted(set(project.config.handler_concurrency) | set(snapshot)):
+            running, waiting, limit = snapshot.get(worker, (0, 0, scheduler.limit(worker, project)))
+            metrics.running.set(running, project=project.label, worker=worker)
+            metrics.queue_depth.set(waiting, project=project.label, worker=worker)
+            metrics.slots.set(limit, project=project.label, worker=worker)
+        metrics.followups.set(scheduler.followups(project), project=project.label)
+        metrics.admission_deferred.set(int(host_load.deferring(project)), project=project.label)
+    for signal_name, value in host_load.sample().items():
+        if value is not None:
+            metrics.host_load.set(round(value, 3), signal=signal_name)
+    metrics.budget.set(scheduler.budget or 0)
+    metrics.loop_lag.set(round(loop_lag.percentile(50), 6), quantile="0.5")
+    metrics.loop_lag.set(round(loop_lag.percentile(99), 6), quantile="0.99")
+    metrics.loop_lag.set(round(max(loop_lag.samples, default=0.0), 6), quantile="1")
+    return '\n'.join(line for family in metrics.families() for line in family.render()) + '\n'
+
+
+class MetricsServer:
+    """Serves GET /metrics over TCP or a unix socket."""
+
+    def __init__(self):
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._unix_path: Optional[Path] = None
+
+    async def start(self, address: str):
+        """Start listening; a bad or busy address is logged and the client runs without it."""
+        try:
+            kind, target = parse_metrics_address(address)
+        except ValueError:
+            log(f"Invalid metrics address {address!r} (expected PORT, HOST:PORT or unix:PATH)", "ERROR")
+            return
+        try:
+            if kind == 'unix':
+                path = Path(target)
+                if path.is_socket():
+                    path.unlink()  # left by a previous run
+                self._server = await asyncio.start_unix_server(self._handle, path=str(path))
+                self._unix_path = path
+                where = f"unix socket {path} (GET /metrics)"
+            else:
+                host, port = target
+                self._server = await asyncio.start_server(self._handle, host, port)
+                where = f"http://{host}:{port}/metrics"
+        except OSError as e:
+            log(f"Failed to start metrics endpoint on {address}: {e}", "ERROR")
+            return
+        log(f"Serving Prometheus metrics on {where}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), METRICS_REQUEST_TIMEOUT)
+            method, path = (request.split(b"\r\n", 1)[0].decode('latin-1').split() + ['', ''])[:2]
+            if method not in ('GET', 'HEAD'):
+                status, body = "405 Method Not Allowed", b"Only GET is supported\n"
+            elif path.split('?', 1)[0] not in ('/', '/metrics'):
+                status, body = "404 Not Found", b"Metrics are served on /metrics\n"
+            else:
+                status, body = "200 OK", render_metrics().encode('utf-8')
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {METRICS_CONTENT_TYPE}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        except Exception as e:
+            log(f"Metrics request failed: {e}", "WARN")
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._unix_path:
+            self._unix_path.unlink(missing_ok=True)
+            self._unix_path = None
+
+
+metrics_server = MetricsServer()
+
+
+# =============================================================================
+# WebSocket Capture
+# With --record FILE (or JOAN_WS_RECORD), every raw inbound message is
+# appended with its receive time to a gzipped JSONL capture, for replay
+# against the loopback server (joan-loadtest --replay). Captures contain
+# full smart payloads (task contents), so treat them like a database dump.
+#
+#   {"capture": "joan-ws", "version": 1, "t": ..., "project_id": ...}   per ws-client run
+#   {"t": ..., "connect": true}                                           per connection
+#   {"t": ..., "raw": "<message text>"}                                   per message
+# =============================================================================
+
+CAPTURE_VERSION = 1
+
+
+class WebSocketCapture:
+    """Recorder for inbound WebSocket messages (a no-op unless a capture file is configured)."""
+
+    def __init__(self):
+        self._writer = LogWriter(lambda: config.record_file, opener=gzip_append)
+        self._header_written = False
+
+    def connected(self):
+        """Mark a (re)connect; the first one also writes the run header."""
+        if not config.record_file:
+            return
+        if not self._header_written:
+            self._header_written = True
+            self._writer.write(json.dumps({
+                "capture": "joan-ws", "version": CAPTURE_VERSION, "t": time.time(),
+                "project_id": config.project_id, "project_name": config.project_name, "mode": config.mode,
+            }))
+            log(f"Recording WebSocket messages to {config.record_file}")
+        self._writer.write(json.dumps({"t": time.time(), "connect": True}))
+
+    def message(self, message):
+        if config.record_file:
+            if isinstance(message, bytes):
+                message = message.decode('utf-8', errors='replace')
+            self._writer.write(json.dumps({"t": time.time(), "raw": message}))
+
+    def close(self):
+        self._writer.close()
+
+
+ws_capture = ProjectLocal('ws_capture', WebSocketCapture)
 
 
 async def websocket_client():
     """Main WebSocket client loop with reconnection."""
     # Build WebSocket URL
-    ws_url = config.api_url.replace('https://', 'wss://').replace('http://', 'ws://')
-    ws_url = f"{ws_url}/api/v1/projects/{config.project_id}/events/ws?token={config.auth_token}&projectId={config.project_id}"
+    base_url = config.api_url.replace('https://', 'wss://').replace('http://', 'ws://')
+    base_url = f"{base_url}/api/v1/projects/{config.project_id}/events/ws?token={config.auth_token}&projectId={config.project_id}"
 
     reconnect_delay = 1  # Start with 1 second
     max_reconnect_delay = 60  # Max 60 seconds
+    connected_before = False
+    event_cursor.load()
+    client_metrics.reconnects.inc(0)
+    client_metrics.connected.set(0)
 
     while not shutdown_event.is_set():
         try:
+            # Resume from the persisted cursor so the server can replay missed events
+            replay = ReplayTracker(event_cursor.usable())
+            ws_url = f"{base_url}&{event_cursor.query()}" if replay.requested else base_url
+
             log(f"Connecting to WebSocket...")
             log_debug(f"URL: {ws_url[:100]}...")  # Don't log full URL with token
 
@@ -681,40 +3978,45 @@ async def websocket_client():
                 close_timeout=10,
             ) as websocket:
                 log("WebSocket connected successfully")
+                ws_capture.connected()
+                client_metrics.connected.set(1)
+                if connected_before:
+                    client_metrics.reconnects.inc()
                 reconnect_delay = 1  # Reset on successful connection
 
+                if replay.requested:
+                    log(f"Requested replay of events since {event_cursor.timestamp or event_cursor.event_id}")
+                    supervisor.create_task(replay.watch())
+                elif connected_before:
+                    # Reconnect without a usable cursor - events during the gap are unknown
+                    supervisor.create_task(recover_missed_events("Reconnected without event cursor"))
+                connected_before = True
+
                 # Handle incoming messages
                 async for message in websocket:
+                    ws_capture.message(message)
                     try:
                         data = json.loads(message)
                         msg_type = data.get('type', '')
 
                         if msg_type == 'event':
-                            payload = data.get('payload', {})
-                            event_type = payload.get('event_type', '')
-                            task_id = payload.get('task_id', '')
-                            event_project_id = payload.get('project_id', '')
-                            triggered_by = payload.get('triggered_by', 'user')
-                            metadata = payload.get('metadata', {})
-                            smart_payload = metadata.get('smart_payload', None)
-
-                            # Extract tag name for tag events
-                            tag_name = ""
-                            if event_type in ('tag_added', 'tag_removed'):
-                                changes = payload.get('changes', [])
-                                if changes:
-                                    tag_name = changes[0].get('new_value') or changes[0].get('old_value', '')
-
-                            if event_type != 'connected':
-                                is_smart = "smart" if smart_payload else "legacy"
-                                log(f"Event received: {event_type} task={task_id} tag={tag_name} ({is_smart})")
-                                if config.debug and smart_payload:
-                                    log_debug(f"Smart payload keys: {list(smart_payload.keys())}")
-
-                            dispatch_handler(event_type, task_id, tag_name, triggered_by, smart_payload, event_project_id)
+                            if data.get('replayed'):
+                                replay.replayed += 1
+                            handle_event_message(data)
+
+                        elif msg_type == 'replay_complete':
+                            replay.acknowledged.set()
+                            log(f"Replay complete: {replay.replayed} missed event(s) received")
+
+                        elif msg_type == 'replay_unavailable':
+                            if not replay.acknowledged.is_set():
+                                replay.acknowledged.set()
+                                supervisor.create_task(recover_missed_events(
+                                    f"Server cannot replay ({data.get('reason', 'no reason given')})"))
 
                         elif msg_type == 'heartbeat':
-                            log_debug("Heartbeat received")
+                            log_debug(f"Heartbeat received (running: {supervisor.summary()}, "
+                                      f"loop lag: {loop_lag.summary()})")
 
                         elif msg_type == 'error':
                             error_msg = data.get('message', 'Unknown error')
@@ -732,6 +4034,10 @@ async def websocket_client():
             log(f"WebSocket connection closed: {e.code} {e.reason}", "WARN")
         except Exception as e:
             log(f"WebSocket error: {e}", "ERROR")
+        finally:
+            # A dropped connection ends this replay attempt; the next connect starts a new one
+            replay.acknowledged.set()
+            client_metrics.connected.set(0)
 
         if not shutdown_event.is_set():
             log(f"Reconnecting in {reconnect_delay}s...")
@@ -749,10 +4055,50 @@ async def websocket_client():
             reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
 
 
+async def start_project():
+    """Start the current project: recover its handlers, then run startup dispatch and its WebSocket."""
+    handler_env.base()
+    await asyncio.to_thread(payload_spool.sweep)
+    await asyncio.to_thread(sweep_handler_cgroups)
+
+    # Reattach to handlers a previous run left behind before anything is dispatched
+    await recover_handlers()
+
+    # Dispatch existing actionable work while the WebSocket handshake runs.
+    # Tasks seen by both are dispatched once (dedup cache + per-task single-flight).
+    return asyncio.create_task(run_startup_dispatch()), asyncio.create_task(websocket_client())
+
+
 async def main_async():
     """Async main entry point."""
-    # Run WebSocket client (startup dispatch already completed synchronously)
-    ws_task = asyncio.create_task(websocket_client())
+    log("=== CONNECTING TO JOAN ===")
+    log(f"API: {config.api_url}")
+    for project in projects:
+        log(f"Project: {project.config.project_name} ({project.config.mode} mode)")
+    if scheduler.budget:
+        log(f"Shared handler budget: {scheduler.budget} concurrent handler(s) across {len(projects)} project(s)")
+    await asyncio.to_thread(host_slots.reload)
+    if host_slots.enabled:
+        log(f"Host slots: {host_slots.max_handlers} handler(s) machine-wide across ws-clients ({host_slots.slots_dir})")
+    log("")
+    log("WebSocket mode active:")
+    log(f"  Real-time events via WebSocket")
+    log(f"  No catchup scans (state-driven startup)")
+    log(f"  Auto-reconnect with exponential backoff")
+    log("")
+
+    if config.metrics_address:
+        await metrics_server.start(config.metrics_address)
+
+    started = await asyncio.gather(*(project.create_task(start_project()) for project in projects))
+    tasks = [task for project_tasks in started for task in project_tasks]
+    lag_task = asyncio.create_task(loop_lag.run())
+    usage_task = asyncio.create_task(handler_usage.run())
+    slots_task = asyncio.create_task(host_slots.watch())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_shutdown, sig)
 
     # Wait for shutdown
     try:
@@ -760,23 +4106,90 @@ async def main_async():
     except asyncio.CancelledError:
         pass
 
-    # Cancel tasks
-    ws_task.cancel()
+    # Stop accepting events and starting handlers
+    for task in tasks:
+        task.cancel()
 
     try:
-        await asyncio.gather(ws_task, return_exceptions=True)
+        await asyncio.gather(*tasks, return_exceptions=True)
     except:
         pass
+    for project in projects:
+        await event_cursor.for_project(project).flush()
+
+    queued, followups = scheduler.close()
+    if queued or followups:
+        log(f"Dropping {queued} queued dispatch(es) and {followups} follow-up(s) at shutdown "
+            f"(the next startup dispatch picks them up)", "WARN")
+
+    await drain_handlers()
+    lag_task.cancel()
+    usage_task.cancel()
+    slots_task.cancel()
+    handler_usage.close()
+    await metrics_server.close()
+    log(f"Event loop lag (last minute): {loop_lag.summary()}; worst since startup {loop_lag.max_lag * 1000:.0f}ms")
+    for project in projects:
+        dedup = dispatch_dedup.for_project(project)
+        if dedup.suppressed:
+            project.run(log, f"Dispatch dedup: {dedup.total_suppressed()} redundant dispatch(es) suppressed "
+                             f"({', '.join(f'{k}: {v}' for k, v in dedup.suppressed.items())})")
+
+
+async def drain_handlers():
+    """Let running handlers finish within the drain grace period, then terminate the rest.
+
+    A second SIGINT/SIGTERM (force_shutdown_event) skips the wait and SIGKILLs
+    every handler's process group, including during the SIGTERM grace period.
+    """
+    if not supervisor.running:
+        return
+    log(f"Draining {len(supervisor.running)} running handler(s) for up to {config.drain_seconds}s "
+        f"(signal again to terminate them): {supervisor.summary()}")
+
+    idle = asyncio.ensure_future(supervisor.wait_idle())
+    forced = asyncio.ensure_future(force_shutdown_event.wait())
+    terminating = None
+    try:
+        await asyncio.wait({idle, forced}, timeout=config.drain_seconds,
+                           return_when=asyncio.FIRST_COMPLETED)
+        if idle.done():
+            log("Drain complete: all handlers finished")
+            return
+
+        if not forced.done():
+            log(f"Drain grace period expired, terminating: {supervisor.summary()}", "WARN")
+            terminating = asyncio.ensure_future(supervisor.terminate_all("shutdown"))
+            await asyncio.wait({terminating, forced}, return_when=asyncio.FIRST_COMPLETED)
+        if forced.done():
+            log(f"Forced shutdown, killing: {supervisor.summary()}", "WARN")
+            await supervisor.terminate_all("forced shutdown", grace=0)
+        await idle
+    finally:
+        for task in (idle, forced, terminating):
+            if task:
+                task.cancel()
+
+
+def request_shutdown(signum: int):
+    """Handle SIGINT/SIGTERM on the event loop: first drains, second forces."""
+    name = signal.Signals(signum).name
+    if not shutdown_event.is_set():
+        log(f"{name} received, shutting down WebSocket client...")
+        shutdown_event.set()
+    elif not force_shutdown_event.is_set():
+        log(f"{name} received again, terminating running handlers", "WARN")
+        force_shutdown_event.set()
 
 
 def signal_handler(signum, frame):
-    """Handle shutdown signals."""
+    """Handle shutdown signals before the event loop is running."""
     log("Shutting down WebSocket client...")
     shutdown_event.set()
 
 
-def verify_ready():
-    """Verify project is ready for WebSocket processing."""
+def verify_ready() -> bool:
+    """Verify the current project is ready for WebSocket processing."""
     log("=== VERIFYING PROJECT STATE ===")
 
     try:
@@ -784,13 +4197,13 @@ def verify_ready():
     except FileNotFoundError:
         log(f"ERROR: .joan-agents.json not found at {config.config_file}", "ERROR")
         log("Run /agents:init first to configure the project.")
-        sys.exit(1)
+        return False
     except json.JSONDecodeError as e:
         log(f"ERROR: .joan-agents.json is not valid JSON: {e}", "ERROR")
-        sys.exit(1)
+        return False
     except ValueError as e:
         log(f"ERROR: {e}", "ERROR")
-        sys.exit(1)
+        return False
 
     if not config.auth_token:
         log("ERROR: No auth token found", "ERROR")
@@ -803,54 +4216,66 @@ def verify_ready():
             log("")
             log("Note: Install 'cryptography' to enable automatic credential sharing:")
             log("  pip install cryptography")
-        sys.exit(1)
+        return False
 
     log(f"Project: {config.project_name}")
     log(f"Project ID: {config.project_id}")
     log(f"API URL: {config.api_url}")
+    log(f"Handler slots: {', '.join(f'{w}={n}' for w, n in config.handler_concurrency.items())}"
+        f"{f', total={config.max_concurrent_handlers}' if config.max_concurrent_handlers else ''}")
     log("Config: Valid")
     log("")
+    return True
+
+
+def project_record_file(record_file: Path, project_dir: Path) -> Path:
+    """The capture file for one of several projects: the directory name goes before the first dot."""
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '-', project_dir.resolve().name).strip('-') or 'project'
+    stem, dot, suffixes = record_file.name.partition('.')
+    return record_file.with_name(f"{stem}-{slug}{dot}{suffixes}")
 
 
 def main():
     """Main entry point."""
     # Parse arguments
     config.parse_args(sys.argv[1:])
+    projects.extend(Project(config.copy_for(project_dir, options.get('mode')))
+                    for project_dir, options in config.additional_projects)
+    scheduler.budget = config.handler_budget
+    if len(projects) > 1 and config.record_file:
+        for project in projects:
+            project.config.record_file = project_record_file(project.config.record_file,
+                                                             project.config.project_dir)
 
     # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    # Rotate previous session's log before writing anything
-    rotate_log()
-
-    # Verify project
-    verify_ready()
+    # Rotate previous session's log before writing anything, then verify each project
+    for project in projects:
+        project.run(rotate_log)
+    ready = [project for project in projects if project.run(verify_ready)]
+    if len(ready) < len(projects):
+        if not ready or len(projects) == 1:
+            sys.exit(1)
+        for project in projects:
+            if project not in ready:
+                log(f"Skipping {project.config.project_dir}: not ready (see above)", "WARN")
+                project.close()
+        projects[:] = ready
 
     log("=== STARTING WEBSOCKET CLIENT ===")
     log("")
 
-    # Immediate: dispatch existing actionable work (eliminates cold start)
-    run_startup_dispatch()
-
-    # Then: connect WebSocket for real-time events
-    log("=== CONNECTING TO JOAN ===")
-    log(f"API: {config.api_url}")
-    log(f"Project: {config.project_name}")
-    log("")
-    log("WebSocket mode active:")
-    log(f"  Real-time events via WebSocket")
-    log(f"  No catchup scans (state-driven startup)")
-    log(f"  Auto-reconnect with exponential backoff")
-    log("")
-
-    # Run async event loop
+    # Run async event loop (startup dispatch, WebSocket, handler supervision)
     try:
         asyncio.run(main_async())
     except KeyboardInterrupt:
         pass
     finally:
         log("WebSocket client stopped")
+        api_pool.close()
+        close_projects()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+"""
+Fixtures for ws-client.py tests.
+
+ws-client.py is a script, not a package: each test loads a fresh copy of it
+against a throwaway project directory, with machine-wide host slots off.
+"""
+
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+WS_CLIENT = Path(__file__).resolve().parent.parent / "scripts" / "ws-client.py"
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / ".joan-agents.json").write_text(json.dumps({
+        "projectId": "test-project",
+        "projectName": "Test",
+        "settings": {},
+    }))
+    return project
+
+
+@pytest.fixture
+def ws(tmp_path, project_dir, monkeypatch):
+    """A freshly loaded ws-client module serving `project_dir`."""
+    monkeypatch.setenv("JOAN_AUTH_TOKEN", "test")
+    monkeypatch.setenv("JOAN_PROJECT_DIR", str(project_dir))
+    monkeypatch.setenv("JOAN_SLOTS_DIR", str(tmp_path / "slots"))
+    monkeypatch.setenv("JOAN_HOST_MAX_HANDLERS", "0")
+    spec = importlib.util.spec_from_file_location("ws_client_under_test", WS_CLIENT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.config.load_project_config()
+    yield module
+    module.close_projects()
+
+
+@pytest.fixture
+def fake_claude(tmp_path, monkeypatch):
+    """Put a `claude` on PATH that sleeps for FAKE_CLAUDE_SECONDS (default 0) and exits."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    launcher = bin_dir / "claude"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" -c '
+                        f'"import os, time; time.sleep(float(os.environ.get(\'FAKE_CLAUDE_SECONDS\', 0)))"\n')
+    launcher.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    return launcher
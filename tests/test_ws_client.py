@@ -0,0 +1,591 @@
+"""Tests for ws-client.py dispatch bookkeeping and settings."""
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+SCHEMA = Path(__file__).resolve().parent.parent / "schemas" / "joan-agents.schema.json"
+
+
+def run_handler(ws, task_id: str, handler: str = "handle-ba", code: str = "pass"):
+    """Start a trivial handler process through the supervisor and wait until it has exited."""
+    async def scenario():
+        started = await ws.supervisor.start(handler, task_id, [sys.executable, "-c", code], {})
+        assert started
+        await ws.supervisor.wait_idle()
+    asyncio.run(scenario())
+
+
+def write_settings(project_dir, **settings):
+    """Replace the project's settings in .joan-agents.json."""
+    path = project_dir / ".joan-agents.json"
+    data = json.loads(path.read_text())
+    data["settings"] = settings
+    path.write_text(json.dumps(data))
+
+
+def settings_schema() -> dict:
+    return json.loads(SCHEMA.read_text())["properties"]["settings"]["properties"]
+
+
+def test_new_transition_after_successful_run_is_dispatched(ws):
+    dedup = ws.dispatch_dedup
+    assert dedup.admit("task-1", "handle-ba", "", "task_needs_ba")
+    assert not dedup.admit("task-1", "handle-ba", "", "tag_added")  # duplicate while in flight
+
+    run_handler(ws, "task-1")
+
+    assert dedup.admit("task-1", "handle-ba", "", "task_needs_ba_reevaluation")
+    assert dedup.total_suppressed() == 1
+
+
+async def until(predicate, timeout: float = 10):
+    """Poll `predicate` on the event loop until it holds."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_newer_event_mid_run_is_held_as_follow_up(ws, fake_claude, monkeypatch):
+    monkeypatch.setenv("FAKE_CLAUDE_SECONDS", "1")
+
+    async def scenario():
+        ws.dispatch_handler("task_needs_rework", "task-1", event_time=1000.0)
+        await until(lambda: ws.supervisor.running)
+
+        ws.dispatch_handler("tag_added", "task-1", tag_name="Rework-Requested", event_time=1001.0)  # legacy echo
+        ws.dispatch_handler("task_needs_rework", "task-1", event_time=1000.0)  # replayed
+        assert not ws.scheduler._followups
+        assert ws.dispatch_dedup.total_suppressed() == 2
+
+        ws.dispatch_handler("task_needs_rework", "task-1", event_time=2000.0)  # another rework request
+        assert [task_id for _, task_id in ws.scheduler._followups] == ["task-1"]
+
+        [first_pid] = ws.supervisor.running
+        await until(lambda: ws.supervisor.running and first_pid not in ws.supervisor.running)  # follow-up runs
+        await ws.supervisor.wait_idle()
+    asyncio.run(scenario())
+
+
+def test_retry_after_failed_run_is_dispatched(ws):
+    dedup = ws.dispatch_dedup
+    assert dedup.admit("task-1", "handle-ba", "", "task_needs_ba")
+
+    run_handler(ws, "task-1", code="raise SystemExit(3)")
+
+    assert dedup.admit("task-1", "handle-ba", "", "task_needs_ba")
+
+
+def test_stale_event_after_run_is_still_suppressed(ws):
+    dedup = ws.dispatch_dedup
+    assert dedup.admit("task-1", "handle-ba", "", "task_needs_ba", event_time=1000.0)
+
+    run_handler(ws, "task-1")
+
+    assert not dedup.admit("task-1", "handle-ba", "", "tag_added", event_time=990.0)
+    assert dedup.suppressed["stale"] == 1
+
+
+def recording_launch(started: list, name: str):
+    """A scheduler launch that records `name` and leaves its slot held (no process)."""
+    async def launch():
+        started.append(name)
+        return True
+    return launch
+
+
+def test_queued_dispatches_start_by_stage_priority_with_aging(ws, project_dir):
+    write_settings(project_dir, maxConcurrentHandlers=1)
+    ws.config.load_project_config()
+    started = []
+
+    async def scenario():
+        ws.scheduler.submit("handle-dev", "busy", recording_launch(started, "busy"))
+        await until(lambda: started)
+        for handler in ("handle-ba", "handle-architect", "handle-reviewer", "handle-ops"):
+            ws.scheduler.submit(handler, handler, recording_launch(started, handler))
+        await asyncio.sleep(0.05)
+        assert started == ["busy"]  # every queued dispatch waits for the one slot
+
+        # Three aging periods lift ba (stage 4) level with reviewer (stage 1); it was queued first
+        [ba] = [p for p in ws.scheduler._pending if p.handler == "handle-ba"]
+        ba.enqueued_at -= 3 * ws.DISPATCH_AGING_SECONDS
+
+        ws.scheduler.finished("busy", "handle-dev")
+        while len(started) < 5:
+            count = len(started)
+            await until(lambda: len(started) > count)
+            ws.scheduler.finished(started[-1], started[-1])  # each task id is its handler name
+        assert started == ["busy", "handle-ops", "handle-ba", "handle-reviewer", "handle-architect"]
+    asyncio.run(scenario())
+
+
+def test_task_runs_single_flight_and_latest_follow_up_wins(ws, project_dir):
+    write_settings(project_dir, maxConcurrentHandlers=1)
+    ws.config.load_project_config()
+    started = []
+
+    async def scenario():
+        ws.scheduler.submit("handle-ops", "other", recording_launch(started, "other"))
+        ws.scheduler.submit("handle-ba", "task-1", recording_launch(started, "ba"))
+        ws.scheduler.submit("handle-architect", "task-1", recording_launch(started, "architect"))
+        assert ws.scheduler.waiting() == 2  # the queued ba was replaced in place
+        await until(lambda: started == ["other"])
+
+        ws.scheduler.finished("other", "handle-ops")
+        await until(lambda: started == ["other", "architect"])
+
+        assert ws.dispatch_dedup.admit("task-1", "handle-dev", "", "task_needs_dev")
+        ws.scheduler.submit("handle-dev", "task-1", recording_launch(started, "dev"))
+        assert ws.dispatch_dedup.admit("task-1", "handle-reviewer", "", "task_needs_review")
+        ws.scheduler.submit("handle-reviewer", "task-1", recording_launch(started, "reviewer"))
+        assert ws.scheduler.followups() == 1 and ws.scheduler.waiting() == 0
+        # The superseded follow-up never ran, so the same event may dispatch it again later
+        assert ws.dispatch_dedup.admit("task-1", "handle-dev", "", "task_needs_dev")
+
+        ws.scheduler.finished("task-1", "handle-architect")
+        await until(lambda: len(started) == 3)
+        assert started == ["other", "architect", "reviewer"]
+        assert ws.scheduler.is_busy("task-1") and not ws.scheduler.followups()
+    asyncio.run(scenario())
+
+
+def process_state(pid: int) -> str:
+    return Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0]
+
+
+def test_urgent_dispatch_pauses_the_newest_lowest_priority_handler(ws, project_dir):
+    write_settings(project_dir, maxConcurrentHandlers=3, preemptFor=["ops"])
+    ws.config.load_project_config()
+
+    def launch(handler: str, task_id: str, seconds: float):
+        return lambda: ws.supervisor.start(handler, task_id,
+                                           [sys.executable, "-c", f"import time; time.sleep({seconds})"], {})
+
+    async def scenario():
+        for handler, task_id in (("handle-ba", "ba-old"), ("handle-dev", "dev"), ("handle-ba", "ba-new")):
+            ws.scheduler.submit(handler, task_id, launch(handler, task_id, 60))
+            await until(lambda: task_id in {entry.task_id for entry in ws.supervisor.running.values()})
+        running = {entry.task_id: entry for entry in ws.supervisor.running.values()}
+
+        ws.scheduler.submit("handle-ops", "ops", launch("handle-ops", "ops", 0.5))
+        await until(lambda: len(ws.supervisor.running) == 4)
+        victim = running["ba-new"]
+        assert victim.paused_at is not None and victim.preemptions == 1
+        await until(lambda: process_state(victim.pid) == "T")
+        assert [entry.paused_at for entry in (running["ba-old"], running["dev"])] == [None, None]
+
+        await until(lambda: len(ws.supervisor.running) == 3)  # the ops handler finished
+        assert victim.paused_at is None and victim.paused_seconds > 0
+        assert process_state(victim.pid) != "T"
+        await ws.supervisor.terminate_all("test", grace=0)
+        await ws.supervisor.wait_idle()
+    asyncio.run(scenario())
+
+
+def test_load_admission_settings(ws, project_dir):
+    assert ws.config.load_admission is None  # off by default
+
+    write_settings(project_dir, loadAdmission=True)
+    ws.config.load_project_config()
+    assert ws.config.load_admission == ws.DEFAULT_LOAD_ADMISSION
+
+    write_settings(project_dir, loadAdmission={"maxLoadPerCpu": 4})
+    ws.config.load_project_config()
+    assert ws.config.load_admission == {**ws.DEFAULT_LOAD_ADMISSION, "maxLoadPerCpu": 4.0}
+
+    write_settings(project_dir, loadAdmission=False)
+    ws.config.load_project_config()
+    assert ws.config.load_admission is None
+
+
+@pytest.mark.parametrize("value", ["off", [1], 1, {"resumeRatio": 0}, {"maxLoadPerCpu": -1}])
+def test_invalid_load_admission_is_rejected(ws, project_dir, value):
+    write_settings(project_dir, loadAdmission=value)
+    with pytest.raises(ValueError, match="loadAdmission"):
+        ws.config.load_project_config()
+
+
+def test_load_admission_schema_defaults_match_client(ws):
+    properties = settings_schema()["loadAdmission"]["oneOf"][1]["properties"]
+    assert {name: spec["default"] for name, spec in properties.items()} == ws.DEFAULT_LOAD_ADMISSION
+
+
+def test_handler_resources_schema_matches_client(ws):
+    schema = json.loads(SCHEMA.read_text())
+    workers = settings_schema()["handlerResources"]["properties"]
+    assert {worker: spec["default"] for worker, spec in workers.items()} == ws.DEFAULT_HANDLER_RESOURCES
+    envelope = schema["definitions"]["handlerEnvelope"]["properties"]
+    assert set(envelope["ioClass"]["enum"]) == set(ws.IOPRIO_CLASSES)
+
+
+@pytest.mark.parametrize("value", [["dev"], {"dev": 5}, {"dev": {"ioClass": "fast"}}])
+def test_invalid_handler_resources_are_rejected(ws, project_dir, value):
+    write_settings(project_dir, handlerResources=value)
+    with pytest.raises(ValueError):
+        ws.config.load_project_config()
+
+
+def test_preempt_for_schema_matches_client(ws, project_dir):
+    assert set(settings_schema()["preemptFor"]["items"]["enum"]) == set(ws.STAGE_PRIORITY)
+
+    write_settings(project_dir, preemptFor=["ops", "reviewer"])
+    ws.config.load_project_config()
+    assert ws.config.preempt_for == {"ops", "reviewer"}
+
+    for value in (["qa"], "ops"):
+        write_settings(project_dir, preemptFor=value)
+        with pytest.raises(ValueError, match="preemptFor"):
+            ws.config.load_project_config()
+
+
+def test_journal_appends_after_compaction_reach_the_new_file(ws):
+    journal = ws.handler_journal
+    journal._append({"op": "start", "pid": 101, "task_id": "task-1"})
+    journal._append({"op": "start", "pid": 102, "task_id": "task-2"})
+    deadline = time.monotonic() + 5
+    while len(journal.load()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)  # flushed; the writer keeps its append handle open
+    records = journal.load()
+
+    journal.adopt([records[0]])
+    journal._append({"op": "start", "pid": 103, "task_id": "task-3"})
+    journal.close()
+
+    assert [r["pid"] for r in journal.load()] == [101, 103]
+
+
+def test_journal_is_compacted_while_running(ws, monkeypatch):
+    monkeypatch.setattr(ws, "HANDLER_JOURNAL_COMPACT_EXITS", 2)
+
+    def records():
+        ws.handler_journal.close()  # flush
+        return [(r["op"], r["task_id"]) for r in map(json.loads, ws.config.journal_file.read_text().splitlines())]
+
+    async def scenario():
+        await ws.supervisor.start("handle-dev", "long", [sys.executable, "-c", "import time; time.sleep(30)"], {})
+        for i in range(3):
+            await ws.supervisor.start("handle-ba", f"short-{i}", [sys.executable, "-c", "pass"], {})
+            await until(lambda: len(ws.supervisor.running) == 1)
+        # The second exit compacted the journal down to the live handler
+        assert records() == [("start", "long"), ("start", "short-2"), ("exit", "short-2")]
+
+        [entry] = ws.supervisor.running.values()
+        await ws.supervisor.terminate(entry, "test", grace=0)
+        await ws.supervisor.wait_idle()
+        assert records() == []  # the last exit left no live handler
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("handler, cut", [("handle-dev", False), ("handle-architect", False), ("handle-ba", True)])
+def test_description_is_cut_only_for_fitted_handlers(ws, handler, cut):
+    description = "Spec line. " * 6000  # ~16k tokens, past every budget
+    smart_payload = {
+        "task": {"id": "task-1", "title": "Big spec", "description": description},
+        "tags": [],
+        "subtasks": [{"title": "Subtask", "completed": False}],
+    }
+    projection = ws.project_payload_for_handler(handler, smart_payload)
+    kept = projection.payload["task"]["description"]
+    assert (len(kept) < len(description)) is cut
+    assert ("truncated" in kept) is cut
+
+
+def test_envelope_is_applied_to_the_spawned_handler(ws, tmp_path):
+    envelope = ws.HandlerEnvelope({"nice": 7, "ioClass": "idle", "addressSpaceMB": 2048}, None)
+    popen = ws.spawn_handler([sys.executable, "-c", "import time; time.sleep(5)"], dict(os.environ),
+                             tmp_path / "out.log", envelope, "unused")
+    try:
+        stat = Path(f"/proc/{popen.pid}/stat").read_text()
+        assert int(stat.rpartition(")")[2].split()[16]) == max(7, os.getpriority(os.PRIO_PROCESS, 0))
+        limits = Path(f"/proc/{popen.pid}/limits").read_text()
+        assert f"{2048 * 1024 * 1024}" in next(line for line in limits.splitlines()
+                                               if line.startswith("Max address space"))
+        assert os.getpgid(popen.pid) == popen.pid
+    finally:
+        popen.kill()
+        popen.wait()
+
+
+def metrics(ws, event: str) -> list:
+    """The `event` records written to agent-metrics.jsonl so far."""
+    ws.metrics_writer.close()  # flush
+    lines = ws.config.metrics_file.read_text().splitlines() if ws.config.metrics_file.exists() else []
+    return [record for record in map(json.loads, lines) if record["event"] == event]
+
+
+def test_timed_out_handler_is_killed_with_its_group_after_ignoring_sigterm(ws, monkeypatch):
+    ignore_term = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN)"
+    code = (f"{ignore_term}; import subprocess, sys; "
+            f"child = subprocess.Popen([sys.executable, '-c', '{ignore_term}; time.sleep(60)']); "
+            f"print(child.pid, flush=True); time.sleep(60)")
+    terminate = ws.supervisor.terminate
+    monkeypatch.setattr(ws.supervisor, "terminate", lambda entry, reason, grace=0.5: terminate(entry, reason, grace))
+
+    async def scenario():
+        assert await ws.supervisor.start("handle-dev", "task-1", [sys.executable, "-c", code], {})
+        [entry] = ws.supervisor.running.values()
+        entry.timeout_minutes = 1.5 / 60  # read once its watcher starts
+        await until(lambda: entry.output_tail)
+        child = int(entry.output_tail[0])
+        await ws.supervisor.wait_idle()
+        return entry, child
+
+    entry, child = asyncio.run(scenario())
+    assert entry.terminating == "timeout"
+    assert entry.process.returncode == -signal.SIGKILL
+    assert ws.process_start_ticks(child) is None  # the rest of the group went down with it
+    [timeout] = metrics(ws, "handler_timeout")
+    assert timeout["killed"] and timeout["task_id"] == "task-1"
+
+
+def start_sleepers(ws, **seconds):
+    """Start one handler per task id, each sleeping for its number of seconds; return their entries."""
+    async def start():
+        for task_id, duration in seconds.items():
+            assert await ws.supervisor.start("handle-dev", task_id,
+                                             [sys.executable, "-c", f"import time; time.sleep({duration})"], {})
+        return {entry.task_id: entry for entry in ws.supervisor.running.values()}
+    return start()
+
+
+def test_sigterm_drains_handlers_then_terminates_the_rest(ws, project_dir):
+    write_settings(project_dir, shutdownDrainSeconds=1)
+    ws.config.load_project_config()
+
+    async def scenario():
+        entries = await start_sleepers(ws, short=0.2, long=60)
+        ws.request_shutdown(signal.SIGTERM)
+        assert ws.shutdown_event.is_set() and not ws.force_shutdown_event.is_set()
+        await ws.drain_handlers()
+        return entries
+
+    entries = asyncio.run(scenario())
+    assert (entries["short"].terminating, entries["short"].process.returncode) == (None, 0)
+    assert (entries["long"].terminating, entries["long"].process.returncode) == ("shutdown", -signal.SIGTERM)
+
+
+def test_second_sigterm_kills_draining_handlers(ws):
+    async def scenario():
+        entries = await start_sleepers(ws, long=60)
+        ws.request_shutdown(signal.SIGTERM)
+        drain = asyncio.ensure_future(ws.drain_handlers())
+        await asyncio.sleep(0.2)
+        assert not drain.done()  # waiting out the default drain period
+        ws.request_shutdown(signal.SIGTERM)
+        await asyncio.wait_for(drain, 5)
+        return entries
+
+    entries = asyncio.run(scenario())
+    assert ws.force_shutdown_event.is_set()
+    assert (entries["long"].terminating, entries["long"].process.returncode) == ("forced shutdown", -signal.SIGKILL)
+
+
+def test_handler_exiting_without_a_result_reports_a_failure(ws, tmp_path, monkeypatch):
+    reports = []
+    monkeypatch.setattr(ws, "post_worker_result",
+                        lambda project_id, task_id, payload: reports.append((task_id, payload)) or {})
+    handlers = {
+        "crashed": "print('boom'); raise SystemExit(3)",
+        "reported": "import os, pathlib; pathlib.Path(os.environ['JOAN_RESULT_MARKER']).touch(); raise SystemExit(1)",
+        "clean": "pass",
+    }
+
+    async def scenario():
+        for task_id, code in handlers.items():
+            marker = tmp_path / f"{task_id}.reported"
+            assert await ws.supervisor.start("handle-dev", task_id, [sys.executable, "-c", code],
+                                             {"JOAN_RESULT_MARKER": str(marker)})
+        await ws.supervisor.wait_idle()
+    asyncio.run(scenario())
+
+    [(task_id, payload)] = reports
+    assert task_id == "crashed"
+    assert payload["worker"] == "dev-worker" and not payload["success"]
+    assert payload["result_type"] == ws.UNREPORTED_EXIT_RESULT_TYPE
+    assert payload["output"] == {"exit_code": 3, "terminated": None}
+    assert "exited with code 3" in payload["error"] and payload["error"].endswith("boom")
+    assert not list(tmp_path.glob("*.reported"))  # markers are consumed
+
+
+def test_process_stat_is_parsed_past_a_tricky_command_name(ws):
+    code = "open('/proc/self/comm', 'w').write('a) b (c'); print(flush=True); import time; time.sleep(5)"
+    process = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+    try:
+        process.stdout.readline()
+        ppid, pgrp, start_ticks, _, rss_pages = ws.read_process_stat(process.pid)
+        assert (ppid, pgrp) == (os.getpid(), os.getpgrp())
+        assert start_ticks == ws.process_start_ticks(process.pid)
+        assert rss_pages > 0
+    finally:
+        process.kill()
+        process.wait()
+    assert ws.read_process_stat(process.pid) is None
+
+
+def test_usage_scan_follows_descendants_that_leave_the_group(ws):
+    escapee = "import os, time; os.setsid(); print(os.getpid(), flush=True); time.sleep(60)"
+    code = f"import subprocess, sys, time; subprocess.Popen([sys.executable, '-c', {escapee!r}]); time.sleep(60)"
+    handler = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, start_new_session=True)
+    bystander = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    child = None
+    try:
+        child = int(handler.stdout.readline())
+        found = ws.scan_handler_processes([handler.pid])
+        assert sorted(pid for pid, _ in found[handler.pid]) == sorted([handler.pid, child])
+    finally:
+        os.killpg(handler.pid, signal.SIGKILL)
+        if child:
+            os.kill(child, signal.SIGKILL)
+        bystander.kill()
+        for process in (handler, bystander):
+            process.wait()
+
+
+def test_usage_counts_orphans_but_not_children_twice(ws):
+    ticks = ws.CLOCK_TICKS
+    usage = ws.HandlerUsage()
+    # (pid, start ticks) -> (ppid, CPU ticks, RSS pages, read bytes, write bytes)
+    usage.update({(10, 1): (1, 2 * ticks, 100, 1000, 10),   # the handler
+                  (11, 1): (10, 1 * ticks, 50, 500, 5),     # its child
+                  (12, 1): (1, 3 * ticks, 25, 0, 0)})       # an orphan, re-parented to init
+    assert (usage.cpu_seconds, usage.read_bytes, usage.processes) == (6, 1500, 3)
+
+    # The handler waited for its child (the kernel adds the child's totals to it); init reaped the orphan
+    usage.update({(10, 1): (1, 3 * ticks, 100, 1500, 15)})
+    assert (usage.cpu_seconds, usage.read_bytes, usage.write_bytes) == (6, 1500, 15)
+    assert (usage.rss_bytes, usage.peak_rss_bytes) == (100 * ws.PAGE_SIZE, 175 * ws.PAGE_SIZE)
+    assert usage.processes == 1
+
+
+def test_payload_released_and_dispatched_again_keeps_its_file(ws):
+    async def scenario():
+        path = await ws.payload_spool.acquire(b'{"task": 1}')
+        ws.payload_spool.release(path)  # removal is queued on the payload executor
+        assert await ws.payload_spool.acquire(b'{"task": 1}') == path  # rewritten after the removal
+        await asyncio.get_running_loop().run_in_executor(ws.payload_executor, lambda: None)
+        assert path.read_bytes() == b'{"task": 1}'
+    asyncio.run(scenario())
+
+
+def test_payload_file_is_shared_until_its_last_handler_exits(ws):
+    async def drained():
+        await asyncio.get_running_loop().run_in_executor(ws.payload_executor, lambda: None)
+
+    async def scenario():
+        first, second = await asyncio.gather(ws.payload_spool.acquire(b"{}"), ws.payload_spool.acquire(b"{}"))
+        other = await ws.payload_spool.acquire(b"[]")
+        assert first == second != other
+        assert sorted(p.name for p in ws.payload_spool.directory.iterdir()) == sorted([first.name, other.name])
+
+        ws.payload_spool.release(first)
+        await drained()
+        assert first.exists()
+        ws.payload_spool.release(second)
+        ws.payload_spool.release(other)
+        await drained()
+        assert not any(ws.payload_spool.directory.iterdir())
+    asyncio.run(scenario())
+
+
+def test_spool_sweep_removes_only_stale_files(ws):
+    spool = ws.payload_spool.directory
+    spool.mkdir(parents=True)
+    stale, fresh = spool / "stale.json", spool / "fresh.json"
+    legacy = ws.config.project_dir / ".claude" / "smart-payload-task-1.json"
+    for path in (stale, fresh, legacy):
+        path.write_text("{}")
+    old = time.time() - ws.SPOOL_STALE_SECONDS - 60
+    for path in (stale, legacy):
+        os.utime(path, (old, old))
+
+    ws.payload_spool.sweep()
+
+    assert [stale.exists(), fresh.exists(), legacy.exists()] == [False, True, False]
+
+
+def host_slots(ws, tmp_path, monkeypatch, settings=None):
+    """A fresh HostSlots client on a shared slot dir, configured by slots.json `settings` (None: no file)."""
+    monkeypatch.delenv("JOAN_HOST_MAX_HANDLERS", raising=False)
+    slots_dir = tmp_path / "host-slots"
+    slots_dir.mkdir(exist_ok=True)
+    if settings is not None:
+        (slots_dir / "slots.json").write_text(settings if isinstance(settings, str) else json.dumps(settings))
+    slots = ws.HostSlots(slots_dir)
+    slots.reload()
+    return slots
+
+
+def slot_project(name: str, tmp_path):
+    return SimpleNamespace(config=SimpleNamespace(project_id=name, project_name=name, project_dir=tmp_path))
+
+
+def test_host_slots_are_off_without_slots_json(ws, tmp_path, monkeypatch):
+    assert not host_slots(ws, tmp_path, monkeypatch).enabled
+    monkeypatch.setenv("JOAN_HOST_MAX_HANDLERS", "2")
+    slots = ws.HostSlots(tmp_path / "host-slots")
+    slots.reload()
+    assert slots.enabled and slots.max_handlers == 2
+
+
+@pytest.mark.parametrize("settings, minimums", [
+    ("[1, 2]", {}),
+    ('"24"', {}),
+    ("{not json", {}),
+    ({"maxHandlers": "many"}, {}),
+    ({"maxHandlers": True, "projectMinimums": ["alpha"]}, {}),
+    ({"projectMinimums": {"alpha": "two", "beta": 1}}, {"beta": 1}),
+])
+def test_invalid_host_slot_settings_fall_back_to_defaults(ws, tmp_path, monkeypatch, settings, minimums):
+    slots = host_slots(ws, tmp_path, monkeypatch, settings)
+    assert slots.enabled
+    assert slots.max_handlers == (os.cpu_count() or 1)
+    assert slots.minimums == minimums
+
+
+def test_invalid_host_max_handlers_env_is_ignored(ws, tmp_path, monkeypatch):
+    host_slots(ws, tmp_path, monkeypatch, {"maxHandlers": 3})
+    monkeypatch.setenv("JOAN_HOST_MAX_HANDLERS", "lots")
+    slots = ws.HostSlots(tmp_path / "host-slots")
+    slots.reload()
+    assert slots.enabled and slots.max_handlers == 3
+
+
+def test_host_slot_minimums_are_reserved_and_the_rest_is_shared(ws, tmp_path, monkeypatch):
+    settings = {"maxHandlers": 3, "projectMinimums": {"alpha": 1}}
+    alpha_client = host_slots(ws, tmp_path, monkeypatch, settings)
+    beta_client = host_slots(ws, tmp_path, monkeypatch, settings)  # another ws-client on the host
+    alpha, beta = slot_project("alpha", tmp_path), slot_project("beta", tmp_path)
+
+    assert alpha_client.acquire(alpha, "handle-dev", "a1").path.name == "reserved-alpha-00.lock"
+    shared = [beta_client.acquire(beta, "handle-dev", f"b{i}") for i in range(2)]
+    assert [slot.path.name for slot in shared] == ["slot-00.lock", "slot-01.lock"]
+    assert beta_client.acquire(beta, "handle-dev", "b2") is None  # alpha's reserved slot stays alpha's
+    assert alpha_client.acquire(alpha, "handle-dev", "a2") is None  # shared pool is full
+
+    beta_client.release(shared[0])
+    assert alpha_client.acquire(alpha, "handle-dev", "a2").path.name == "slot-00.lock"
+    assert json.loads((tmp_path / "host-slots" / "slot-00.lock").read_text())["task_id"] == "a2"
+
+
+def test_reload_resets_removed_settings(ws, project_dir):
+    defaults = (ws.config.max_concurrent_handlers, ws.config.dedup_ttl_seconds, ws.config.drain_seconds,
+                ws.config.handler_cgroup, ws.config.load_admission, ws.config.preempt_for)
+    write_settings(project_dir, maxConcurrentHandlers=3, dispatchDedupSeconds=5, shutdownDrainSeconds=7,
+                   handlerCgroup="/sys/fs/cgroup/joan", loadAdmission=True, preemptFor=["ops"])
+    ws.config.load_project_config()
+    assert ws.config.max_concurrent_handlers == 3 and ws.config.handler_cgroup is not None
+
+    write_settings(project_dir)
+    ws.config.load_project_config()
+    assert (ws.config.max_concurrent_handlers, ws.config.dedup_ttl_seconds, ws.config.drain_seconds,
+            ws.config.handler_cgroup, ws.config.load_admission, ws.config.preempt_for) == defaults